@@ -53,7 +53,9 @@ CREATE TABLE clients (
     client_id SERIAL PRIMARY KEY,
     client_number INTEGER,
     job_id INT REFERENCES jobs(job_id),
-    device_id INT REFERENCES devices(device_id)
+    device_id INT REFERENCES devices(device_id),
+    -- What n_bytes_sent/n_bytes_rcvd cover: namespace, interface:<name> or process
+    net_scope VARCHAR(50)
 );
 
 CREATE TABLE clients_in_round (
@@ -65,7 +67,16 @@ CREATE TABLE clients_in_round (
     loss DECIMAL,
     num_examples INT,
     accuracy DECIMAL,
-    client_state VARCHAR(50)
+    client_state VARCHAR(50),
+    -- Input pipeline of the training loop, measured by colext.monitor_batches
+    data_wait_time DECIMAL,
+    compute_time DECIMAL,
+    data_wait_fraction DECIMAL,
+    -- Model parameter handling, measured by MonitorFlwrClient
+    set_params_time DECIMAL,
+    get_params_time DECIMAL,
+    params_bytes_in BIGINT,
+    params_bytes_out BIGINT
 );
 
 -- Associated with a round stage
@@ -114,11 +125,105 @@ CREATE TABLE device_measurements (
 
     gpu_info jsonb,
     cpu_info jsonb,
+    -- Client stage during the sample: 0 idle, 1 fit, 2 eval
+    stage SMALLINT,
+
+    -- Disk I/O of the monitored processes, cumulative since monitoring started
+    n_bytes_read DECIMAL,
+    n_bytes_written DECIMAL,
+    n_read_ops DECIMAL,
+    n_write_ops DECIMAL,
+    n_major_faults DECIMAL,
+    io_wait_time DECIMAL,
     client_id INT REFERENCES clients(client_id)
 );
 
 SELECT create_hypertable('device_measurements', 'time', if_not_exists => TRUE, create_default_indexes => TRUE);
 
+-- HW metrics aggregated on the device over fixed windows
+CREATE TABLE device_measurement_windows (
+    start_time TIMESTAMP WITH TIME ZONE NOT NULL,
+    end_time TIMESTAMP WITH TIME ZONE NOT NULL,
+    n_samples INT,
+    energy DECIMAL,
+
+    cpu_util_min DECIMAL,
+    cpu_util_mean DECIMAL,
+    cpu_util_max DECIMAL,
+    cpu_util_last DECIMAL,
+
+    gpu_util_min DECIMAL,
+    gpu_util_mean DECIMAL,
+    gpu_util_max DECIMAL,
+    gpu_util_last DECIMAL,
+
+    mem_util_min DECIMAL,
+    mem_util_mean DECIMAL,
+    mem_util_max DECIMAL,
+    mem_util_last DECIMAL,
+
+    power_consumption_min DECIMAL,
+    power_consumption_mean DECIMAL,
+    power_consumption_max DECIMAL,
+    power_consumption_last DECIMAL,
+
+    net_usage_out_min DECIMAL,
+    net_usage_out_mean DECIMAL,
+    net_usage_out_max DECIMAL,
+    net_usage_out_last DECIMAL,
+
+    net_usage_in_min DECIMAL,
+    net_usage_in_mean DECIMAL,
+    net_usage_in_max DECIMAL,
+    net_usage_in_last DECIMAL,
+
+    n_bytes_sent DECIMAL,
+    n_bytes_rcvd DECIMAL,
+    n_bytes_read DECIMAL,
+    n_bytes_written DECIMAL,
+    n_read_ops DECIMAL,
+    n_write_ops DECIMAL,
+    n_major_faults DECIMAL,
+    io_wait_time DECIMAL,
+    client_id INT REFERENCES clients(client_id)
+);
+
+SELECT create_hypertable('device_measurement_windows', 'end_time', if_not_exists => TRUE, create_default_indexes => TRUE);
+
+-- Histograms and counters about the monitoring pipeline itself, written by each client at job end
+-- Counters only set n_values. bucket_counts has an extra overflow bucket after the last bound
+CREATE TABLE monitoring_telemetry (
+    client_id INT REFERENCES clients(client_id),
+    metric VARCHAR(50) NOT NULL,
+    n_values BIGINT,
+    sum DECIMAL,
+    min DECIMAL,
+    max DECIMAL,
+    p50 DECIMAL,
+    p90 DECIMAL,
+    p99 DECIMAL,
+    bucket_bounds DECIMAL[],
+    bucket_counts BIGINT[]
+);
+
+-- Per process summary of the client process tree, written by each client at job end
+-- Only populated when monitoring.process_tree is set
+CREATE TABLE client_processes (
+    client_id INT REFERENCES clients(client_id),
+    pid INT,
+    ppid INT,
+    name VARCHAR(100),
+    first_seen TIMESTAMP WITH TIME ZONE,
+    last_seen TIMESTAMP WITH TIME ZONE,
+    n_samples INT,
+    cpu_util_mean DECIMAL,
+    cpu_util_max DECIMAL,
+    rss_mean DECIMAL,
+    rss_max DECIMAL,
+    pss_mean DECIMAL,
+    pss_max DECIMAL
+);
+
 CREATE TABLE monsoon_measurements (
     time TIMESTAMP WITH TIME ZONE NOT NULL,
     voltage_val DECIMAL,
@@ -141,6 +246,9 @@ ALTER TABLE clients_in_round ENABLE ROW LEVEL SECURITY;
 ALTER TABLE epochs ENABLE ROW LEVEL SECURITY;
 ALTER TABLE batches ENABLE ROW LEVEL SECURITY;
 ALTER TABLE device_measurements ENABLE ROW LEVEL SECURITY;
+ALTER TABLE device_measurement_windows ENABLE ROW LEVEL SECURITY;
+ALTER TABLE monitoring_telemetry ENABLE ROW LEVEL SECURITY;
+ALTER TABLE client_processes ENABLE ROW LEVEL SECURITY;
 ALTER TABLE monsoon_measurements ENABLE ROW LEVEL SECURITY;
 ALTER TABLE server_round_metrics ENABLE ROW LEVEL SECURITY;
 
@@ -152,8 +260,11 @@ CREATE POLICY p_rounds ON rounds USING (job_id IN (SELECT DISTINCT job_id FROM j
 CREATE POLICY p_clients ON clients USING (job_id IN (SELECT DISTINCT job_id FROM jobs));
 CREATE POLICY p_clients_in_round ON clients_in_round USING (client_id IN (SELECT DISTINCT client_id FROM clients));
 CREATE POLICY p_epochs ON epochs USING (cir_id IN (SELECT DISTINCT cir_id FROM clients_in_round));
-CREATE POLICY p_batches ON batches USING (cir_id IN (SELECT DISTINCT cir_id FROM clients_in_round));
+CREATE POLICY p_batches ON batches USING (epoch_id IN (SELECT DISTINCT epoch_id FROM epochs));
 CREATE POLICY p_device_measurements ON device_measurements USING (client_id IN (SELECT DISTINCT client_id FROM clients));
+CREATE POLICY p_device_measurement_windows ON device_measurement_windows USING (client_id IN (SELECT DISTINCT client_id FROM clients));
+CREATE POLICY p_monitoring_telemetry ON monitoring_telemetry USING (client_id IN (SELECT DISTINCT client_id FROM clients));
+CREATE POLICY p_client_processes ON client_processes USING (client_id IN (SELECT DISTINCT client_id FROM clients));
 CREATE POLICY p_monsoon_measurements ON monsoon_measurements USING (client_id IN (SELECT DISTINCT client_id FROM clients));
 CREATE POLICY p_server_round_metrics ON server_round_metrics USING (round_id IN (SELECT DISTINCT round_id FROM rounds));
 
@@ -161,5 +272,7 @@ GRANT USAGE ON SEQUENCE
     jobs_job_id_seq,
     rounds_round_id_seq,
     clients_client_id_seq,
-    clients_in_round_cir_id_seq
+    clients_in_round_cir_id_seq,
+    epochs_epoch_id_seq,
+    batches_batch_id_seq
     TO colext_user;
\ No newline at end of file
@@ -27,6 +27,23 @@ export COLEXT_DEVICE_TYPE=FLServer
 export COLEXT_MONITORING_LIVE_METRICS=True
 export COLEXT_MONITORING_PUSH_INTERVAL=10
 export COLEXT_MONITORING_SCRAPE_INTERVAL=1
+export COLEXT_MONITORING_SCRAPE_INTERVAL_FIT=0
+export COLEXT_MONITORING_SCRAPE_INTERVAL_EVAL=0
+export COLEXT_MONITORING_SCRAPE_INTERVAL_IDLE=0
+export COLEXT_MONITORING_HIGH_RES_SAMPLING=False
+export COLEXT_MONITORING_SCRAPE_BACKEND=psutil
+export COLEXT_MONITORING_PROCESS_TREE=False
+export COLEXT_MONITORING_NET_SCOPE=namespace
+export COLEXT_MONITORING_SCRAPER=auto
+export COLEXT_MONITORING_SMART_PLUG_INTERVAL=0
+export COLEXT_MONITORING_THERMAL_INTERVAL=5
+export COLEXT_MONITORING_MEASURE_SELF=False
+export COLEXT_MONITORING_MODE=process
+export COLEXT_MONITORING_PUSH_MODE=copy
+export COLEXT_MONITORING_AGG_WINDOW=0
+export COLEXT_MONITORING_RAW_RETENTION=all
+export COLEXT_MONITORING_BATCH_SAMPLING=1
+export COLEXT_COLLECTOR_ADDRESS=""
 export COLEXT_LOG_LEVEL=DEBUG
 
 num_clients=1
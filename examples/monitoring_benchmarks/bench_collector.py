@@ -0,0 +1,101 @@
+"""
+Compares HW metric ingestion of many clients pushing directly to the DB vs through the metric collector.
+ - direct:    every client has its own connection and writes its batches with COPY
+ - collector: clients send their batches to a MetricCollector, which coalesces and writes them
+DB connection parameters are read from the usual PG* env variables.
+With --dry_run, the collector does not write to the DB, measuring only the protocol overhead.
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+import psycopg
+
+from colext.common.logger import log
+from colext.metric_collection.collector_client import CollectorClient
+from colext.metric_collection.collector_server import MetricCollector
+from colext.metric_collection.db_writer import HWMetricWriter
+from colext.metric_collection.sample_buffer import HWSampleBuffer
+
+BENCH_TABLE = "device_measurements"
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Benchmark the metric collector")
+    parser.add_argument("-c", "--n_clients", type=int, default=50, help="Number of concurrent clients")
+    parser.add_argument("-n", "--n_batches", type=int, default=20, help="Batches pushed per client")
+    parser.add_argument("-b", "--batch_size", type=int, default=34, help="Samples per batch. Default = 10s push / 0.3s scrape")
+    parser.add_argument("-m", "--modes", nargs="+", default=["direct", "collector"], help="Ingestion paths to compare")
+    parser.add_argument("-f", "--flush_interval", type=float, default=0.05, help="Collector coalescing window in seconds")
+    parser.add_argument("-d", "--dry_run", action="store_true", help="Collector acknowledges batches without writing them")
+    parser.add_argument("-o", "--output", type=str, default=None, help="Optional json file for results")
+    return parser.parse_args()
+
+def gen_batch(n):
+    start = time.time()
+    buffer = HWSampleBuffer(n)
+    for i in range(n):
+        buffer.append(start + 0.3 * i, 50.0, None, 1e8, 4000.0, i * 1500, i * 3000, 1e5, 2e5)
+    return buffer
+
+def run_clients(n_clients, push_fn_factory, n_batches, batch):
+    def client_loop(client_db_id):
+        push_fn = push_fn_factory(client_db_id)
+        for _ in range(n_batches):
+            push_fn(batch)
+
+    threads = [threading.Thread(target=client_loop, args=(cid,)) for cid in range(1, n_clients + 1)]
+    start_wall = time.perf_counter()
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    return time.perf_counter() - start_wall
+
+def bench_direct(args, batch):
+    def push_fn_factory(client_db_id):
+        conn = psycopg.connect()
+        writer = HWMetricWriter(client_db_id, table=BENCH_TABLE)
+        return lambda b: writer.write(conn, b)
+
+    wall_s = run_clients(args.n_clients, push_fn_factory, args.n_batches, batch)
+    # Every push is its own transaction
+    return wall_s, args.n_clients * args.n_batches
+
+def bench_collector(args, batch):
+    address = f"unix:{os.path.join(tempfile.mkdtemp(), 'collector.sock')}"
+    collector = MetricCollector(address, flush_interval_s=args.flush_interval, dry_run=args.dry_run)
+    collector.start()
+
+    def push_fn_factory(client_db_id):
+        client = CollectorClient(address, client_db_id)
+        return lambda b: client.push(b, [], [], b"")
+
+    wall_s = run_clients(args.n_clients, push_fn_factory, args.n_batches, batch)
+    collector.stop()
+    return wall_s, collector.n_writes
+
+def main():
+    args = get_args()
+    log.setLevel("WARNING")
+    batch = gen_batch(args.batch_size)
+    n_rows = args.n_clients * args.n_batches * args.batch_size
+
+    bench_fns = {"direct": bench_direct, "collector": bench_collector}
+    results = []
+    for mode in args.modes:
+        wall_s, n_transactions = bench_fns[mode](args, batch)
+        results.append({"mode": mode, "rows": n_rows, "wall_s": wall_s, "rows_per_s": n_rows / wall_s,
+                        "db_transactions": n_transactions})
+
+    print(f"{'mode':<10} {'rows':>8} {'rows/s':>12} {'wall (s)':>10} {'DB txs':>8}")
+    for r in results:
+        print(f"{r['mode']:<10} {r['rows']:>8} {r['rows_per_s']:>12.0f} {r['wall_s']:>10.3f} {r['db_transactions']:>8}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Compares the HW metric ingestion paths (COPY vs INSERT) against a local Postgres.
+DB connection parameters are read from the usual PG* env variables.
+The benchmark writes to a temp table, so it does not need the CoLExT schema.
+"""
+import argparse
+import json
+import random
+import time
+import psycopg
+
+from colext.metric_collection.db_writer import HWMetricWriter
+from colext.metric_collection.sample_buffer import HWSampleBuffer
+
+BENCH_TABLE = "bench_device_measurements"
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Benchmark HW metric ingestion paths")
+    parser.add_argument("-n", "--n_batches", type=int, default=50, help="Number of batches pushed per mode")
+    parser.add_argument("-b", "--batch_size", type=int, default=34, help="Samples per batch. Default = 10s push / 0.3s scrape")
+    parser.add_argument("-m", "--modes", nargs="+", default=["insert", "copy"], help="Push modes to compare")
+    parser.add_argument("-o", "--output", type=str, default=None, help="Optional json file for results")
+    return parser.parse_args()
+
+def gen_metrics(n):
+    start = time.time()
+    buffer = HWSampleBuffer(n)
+    for i in range(n):
+        buffer.append(start + 0.3 * i,
+                      random.uniform(0, 400), random.uniform(0, 100), random.randint(10**8, 10**9),
+                      random.uniform(1000, 15000), i * 1500, i * 3000,
+                      random.uniform(0, 10**6), random.uniform(0, 10**6))
+    return buffer
+
+def create_bench_table(conn):
+    # Same column types as device_measurements in generate_db.sql
+    conn.execute(f"""
+        CREATE TEMP TABLE IF NOT EXISTS {BENCH_TABLE} (
+            time TIMESTAMP WITH TIME ZONE NOT NULL,
+            cpu_util DECIMAL, mem_util DECIMAL, gpu_util DECIMAL,
+            power_consumption DECIMAL,
+            n_bytes_sent DECIMAL, n_bytes_rcvd DECIMAL,
+            net_usage_out DECIMAL, net_usage_in DECIMAL,
+            client_id INT)
+    """)
+    conn.commit()
+
+def bench_mode(conn, mode, batches):
+    writer = HWMetricWriter(client_db_id=1, push_mode=mode, table=BENCH_TABLE)
+    n_rows = sum(len(b) for b in batches)
+
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    for batch in batches:
+        writer.write(conn, batch)
+    cpu_s = time.process_time() - start_cpu
+    wall_s = time.perf_counter() - start_wall
+
+    if mode == "copy" and not writer.use_copy:
+        print("WARNING: COPY path failed and fell back to INSERT.")
+
+    return {
+        "mode": mode,
+        "rows": n_rows,
+        "wall_s": wall_s,
+        "rows_per_s": n_rows / wall_s,
+        "client_cpu_s": cpu_s,
+        "client_cpu_us_per_row": cpu_s / n_rows * 1e6,
+    }
+
+def main():
+    args = get_args()
+    batches = [gen_metrics(args.batch_size) for _ in range(args.n_batches)]
+
+    results = []
+    with psycopg.connect() as conn:
+        create_bench_table(conn)
+        for mode in args.modes:
+            conn.execute(f"TRUNCATE {BENCH_TABLE}")
+            conn.commit()
+            results.append(bench_mode(conn, mode, batches))
+
+    print(f"{'mode':<8} {'rows':>8} {'rows/s':>12} {'wall (s)':>10} {'cpu us/row':>12}")
+    for r in results:
+        print(f"{r['mode']:<8} {r['rows']:>8} {r['rows_per_s']:>12.0f} {r['wall_s']:>10.3f} {r['client_cpu_us_per_row']:>12.1f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Checks that importing colext stays cheap, since every FL client pays for it at startup.
+Each statement is timed in fresh interpreters outside of the CoLExT environment, where the decorators
+return the class unchanged. Reports the median time of each statement and the heavy dependencies it loaded.
+Exits with 1 if a statement exceeds --budget_ms or loads a heavy dependency.
+Budgets depend on the host: the default is meant for development machines, ARM boards need a larger one.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Should only be imported once monitoring is enabled and the component using them is created
+HEAVY_MODULES = ("flwr", "psycopg", "psycopg_pool", "psutil", "tapo", "jtop", "numpy")
+STATEMENTS = {
+    "import colext": "import colext",
+    "MonitorFlwrClient": "from colext import MonitorFlwrClient\nMonitorFlwrClient(type('Client', (), {}))",
+    "MonitorFlwrStrategy": "from colext import MonitorFlwrStrategy\nMonitorFlwrStrategy(type('Strategy', (), {}))",
+    "monitor_batches": "from colext import monitor_batches\nmonitor_batches([])",
+}
+# Modules needed to time the statement are imported before the timer starts
+CHILD_CODE = """
+import json, sys, time
+start = time.perf_counter()
+{statement}
+import_s = time.perf_counter() - start
+print(json.dumps({{"import_s": import_s, "heavy_modules": [m for m in {heavy_modules!r} if m in sys.modules]}}))
+"""
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Check the import time of colext against a budget")
+    parser.add_argument("-n", "--n_runs", type=int, default=10, help="Fresh interpreters per statement")
+    parser.add_argument("-b", "--budget_ms", type=float, default=100.0, help="Maximum median time per statement (ms)")
+    parser.add_argument("--top", type=int, default=0, help="Print the n slowest modules imported by each statement (-X importtime)")
+    return parser.parse_args()
+
+def child_env() -> dict:
+    env = dict(os.environ)
+    env["COLEXT_ENV"] = "False"
+    # Warnings of the disabled decorators are not part of the measurement
+    env["COLEXT_LOG_LEVEL"] = "WARNING"
+    return env
+
+def time_statement(statement: str, n_runs: int):
+    code = CHILD_CODE.format(statement=statement, heavy_modules=HEAVY_MODULES)
+    times_s = []
+    heavy_modules = set()
+    for _ in range(n_runs):
+        out = subprocess.run([sys.executable, "-c", code], env=child_env(), check=True,
+                             capture_output=True, text=True).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        times_s.append(result["import_s"])
+        heavy_modules.update(result["heavy_modules"])
+    return statistics.median(times_s), sorted(heavy_modules)
+
+def imported_modules(statement: str):
+    """ (cumulative us, module) of every module imported when running statement, from -X importtime. """
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], env=child_env(), check=True,
+                            capture_output=True, text=True).stderr
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, module = line.split("|")
+        modules.append((int(cumulative_us), module.strip()))
+    return modules
+
+def slowest_modules(statement: str, n: int):
+    """ n slowest modules imported by statement, leaving out the ones imported at interpreter startup (e.g. site). """
+    startup_modules = {module for _, module in imported_modules("pass")}
+    modules = [(cumulative_us, module) for cumulative_us, module in imported_modules(statement)
+               if module not in startup_modules]
+    return sorted(modules, reverse=True)[:n]
+
+def main():
+    args = get_args()
+    failed = False
+    print(f"{'statement':>20} {'median (ms)':>12} {'heavy modules':>14}")
+    for name, statement in STATEMENTS.items():
+        import_s, heavy_modules = time_statement(statement, args.n_runs)
+        over_budget = import_s * 1e3 > args.budget_ms
+        failed |= over_budget or bool(heavy_modules)
+        print(f"{name:>20} {import_s * 1e3:>12.1f} {', '.join(heavy_modules) or '-':>14}"
+              f"{'  OVER BUDGET' if over_budget else ''}")
+        for cumulative_us, module in (slowest_modules(statement, args.top) if args.top > 0 else []):
+            print(f"{'':>20} {cumulative_us / 1e3:>12.1f} {module}")
+
+    if failed:
+        print(f"Import time budget of {args.budget_ms}ms exceeded or heavy modules imported: {HEAVY_MODULES}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
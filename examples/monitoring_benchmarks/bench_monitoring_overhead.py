@@ -0,0 +1,293 @@
+"""
+Measures the overhead CoLExT monitoring adds to an FL client, to catch regressions before they reach the devices.
+Runs the no-op Flower client of examples/measure_scrap_overhead without monitoring (baseline) and with MonitorFlwrClient
+over a grid of scraping intervals, push intervals, scrape backends and monitor modes. Each run is a fresh client process.
+For every run it reports the added startup time, CPU time, memory and wall time per round, and the HW metric rows/s pushed to the DB.
+In process mode, the metric manager is a forked process sharing pages with the client, so memory is the PSS summed over both,
+read after the last round. Their peak RSS is reported as well. The CPU time of the metric manager alone, as reported
+by its telemetry, is reported as monitor_self_cpu_s.
+
+Runs against a local Postgres/TimescaleDB stand-in. DB connection parameters are read from the usual PG* env variables.
+Use a scratch database: the CoLExT tables the client writes to are created in it if missing.
+Rows written by the benchmark are deleted at the end, unless --keep_rows is set.
+With --compare, the added overhead is checked against a previous report and the benchmark exits with 1 if it regressed.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+import psutil
+import psycopg
+from psycopg import sql
+
+from colext.common.logger import log
+
+BENCH_DIR = Path(__file__).resolve().parent
+CLIENT_DIR = BENCH_DIR.parent / "measure_scrap_overhead"
+DB_SCHEMA_FILE = BENCH_DIR.parents[1] / "colext_setup" / "db_setup" / "generate_db.sql"
+DB_SCHEMA = "fl_testbed_logging"
+# Tables written by the client
+CLIENT_TABLES = ("clients", "clients_in_round", "epochs", "batches", "device_measurements",
+                 "device_measurement_windows", "monitoring_telemetry", "client_processes")
+HYPERTABLES = {"device_measurements": "time", "device_measurement_windows": "end_time"}
+# Same as the monitoring defaults in experiment_dispatcher. The grid overrides the scraping and push intervals and backend
+MONITORING_ENV = {
+    "COLEXT_MONITORING_LIVE_METRICS": "True",
+    "COLEXT_MONITORING_SCRAPE_INTERVAL_FIT": "0",
+    "COLEXT_MONITORING_SCRAPE_INTERVAL_EVAL": "0",
+    "COLEXT_MONITORING_SCRAPE_INTERVAL_IDLE": "0",
+    "COLEXT_MONITORING_HIGH_RES_SAMPLING": "False",
+    "COLEXT_MONITORING_PROCESS_TREE": "False",
+    "COLEXT_MONITORING_NET_SCOPE": "namespace",
+    "COLEXT_MONITORING_SCRAPER": "auto",
+    "COLEXT_MONITORING_SMART_PLUG_INTERVAL": "0",
+    "COLEXT_MONITORING_THERMAL_INTERVAL": "5",
+    "COLEXT_MONITORING_MEASURE_SELF": "False",
+    "COLEXT_MONITORING_MODE": "process",
+    "COLEXT_MONITORING_PUSH_MODE": "copy",
+    "COLEXT_MONITORING_AGG_WINDOW": "0",
+    "COLEXT_MONITORING_RAW_RETENTION": "all",
+    "COLEXT_MONITORING_BATCH_SAMPLING": "1",
+    "COLEXT_COLLECTOR_ADDRESS": "",
+}
+# Added overhead compared by --compare
+COMPARED_METRICS = ("added_startup_s", "added_cpu_s", "added_pss_mb", "added_round_s")
+# Differences below these are noise, whatever the relative change
+COMPARE_FLOORS = {"added_startup_s": 0.05, "added_cpu_s": 0.05, "added_pss_mb": 2.0, "added_round_s": 0.005}
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Benchmark the overhead of monitoring an FL client")
+    parser.add_argument("-s", "--scrape_intervals", type=float, nargs="+", default=[0.1, 0.3, 1.0], help="Scraping intervals (s)")
+    parser.add_argument("-p", "--push_intervals", type=float, nargs="+", default=[1.0, 10.0], help="Push intervals (s)")
+    parser.add_argument("-b", "--backends", nargs="+", default=["psutil", "procfs"], help="Scrape backends")
+    parser.add_argument("-m", "--monitor_modes", nargs="+", default=["process", "thread"], help="Monitor modes")
+    parser.add_argument("-r", "--n_rounds", type=int, default=5, help="Rounds run by each client")
+    parser.add_argument("-f", "--fit_s", type=float, default=2.0, help="Duration of each no-op fit (s)")
+    parser.add_argument("-e", "--env", nargs="*", default=[], metavar="KEY=VALUE",
+                        help="Extra env variables for the monitored clients, e.g. COLEXT_MONITORING_PROCESS_TREE=True")
+    parser.add_argument("-o", "--output", type=str, default="monitoring_overhead.json", help="Json file for the report")
+    parser.add_argument("-c", "--compare", type=str, default=None, help="Previous report to check for regressions")
+    parser.add_argument("-t", "--tolerance", type=float, default=0.25, help="Allowed relative increase over --compare")
+    parser.add_argument("--keep_rows", action="store_true", help="Keep the rows written by the benchmark in the DB")
+    parser.add_argument("--client", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+# ====== Client process ======
+def run_client(n_rounds: int, fit_s: float) -> None:
+    """ Runs n_rounds of fit and evaluate and prints its resource usage as json. """
+    sys.path.insert(0, str(CLIENT_DIR))
+    # Decorated with MonitorFlwrClient when COLEXT_ENV is set
+    from client import FlowerClient
+
+    start_wall = time.perf_counter()
+    # Includes starting the metric manager and waiting for it to be ready
+    client = FlowerClient(fit_s)
+    startup_s = time.perf_counter() - start_wall
+    round_times = []
+    for round_id in range(1, n_rounds + 1):
+        start_round = time.perf_counter()
+        client.fit([], {"COLEXT_ROUND_ID": round_id})
+        client.evaluate([], {"COLEXT_ROUND_ID": round_id})
+        round_times.append(time.perf_counter() - start_round)
+    process = psutil.Process()
+    pss_mb = sum(p.memory_full_info().pss for p in [process, *process.children(recursive=True)]) / 1024**2
+    if hasattr(client, "clean_up"):
+        # Pushes the remaining metrics and reaps the metric manager, so its usage shows up in RUSAGE_CHILDREN
+        client.clean_up()
+    wall_s = time.perf_counter() - start_wall
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    monitor_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    print(json.dumps({
+        "wall_s": wall_s,
+        "startup_s": startup_s,
+        "round_s": sum(round_times) / len(round_times),
+        "pss_mb": pss_mb,
+        "client_cpu_s": usage.ru_utime + usage.ru_stime,
+        "monitor_cpu_s": monitor_usage.ru_utime + monitor_usage.ru_stime,
+        # ru_maxrss is in KiB on Linux
+        "client_rss_mb": usage.ru_maxrss / 1024,
+        "monitor_rss_mb": monitor_usage.ru_maxrss / 1024,
+    }))
+
+# ====== DB ======
+def create_client_tables(conn) -> bool:
+    """ Creates the tables written by the client from generate_db.sql, without foreign keys, if they don't exist. """
+    ddl = DB_SCHEMA_FILE.read_text(encoding="utf-8")
+    conn.execute(sql.SQL("CREATE SCHEMA IF NOT EXISTS {}").format(sql.Identifier(DB_SCHEMA)))
+    conn.execute(sql.SQL("SET search_path TO {}").format(sql.Identifier(DB_SCHEMA)))
+    for table in CLIENT_TABLES:
+        match = re.search(rf"CREATE TABLE {table} \(.*?\n\);", ddl, re.S)
+        # The benchmark does not create the jobs, rounds and devices its rows would reference
+        statement = re.sub(r"\s+REFERENCES \w+\(\w+\)", "", match.group(0))
+        conn.execute(statement.replace("CREATE TABLE", "CREATE TABLE IF NOT EXISTS", 1))
+
+    has_timescale = conn.execute("SELECT 1 FROM pg_extension WHERE extname = 'timescaledb'").fetchone() is not None
+    if has_timescale:
+        for table, time_col in HYPERTABLES.items():
+            conn.execute("SELECT create_hypertable(%s, %s, if_not_exists => TRUE, migrate_data => TRUE)", (table, time_col))
+    conn.commit()
+    return has_timescale
+
+def register_client(conn, run_i: int) -> int:
+    (client_db_id,) = conn.execute("INSERT INTO clients (client_number) VALUES (%s) RETURNING client_id", (run_i,)).fetchone()
+    conn.commit()
+    return client_db_id
+
+def count_hw_rows(conn, client_db_id: int) -> int:
+    (n_rows,) = conn.execute("SELECT count(*) FROM device_measurements WHERE client_id = %s", (client_db_id,)).fetchone()
+    conn.commit()
+    return n_rows
+
+def get_monitor_cpu(conn, client_db_id: int):
+    """ CPU time of the metric manager, from its telemetry. None if it was not written. """
+    row = conn.execute("SELECT sum FROM monitoring_telemetry WHERE client_id = %s AND metric = 'monitor_cpu_s'",
+                       (client_db_id,)).fetchone()
+    conn.commit()
+    return float(row[0]) if row is not None else None
+
+def delete_bench_rows(conn, client_db_ids) -> None:
+    ids = list(client_db_ids)
+    # Discard the transaction of a failed run
+    conn.rollback()
+    for table in ("device_measurements", "device_measurement_windows", "monitoring_telemetry",
+                  "client_processes", "clients_in_round", "clients"):
+        conn.execute(sql.SQL("DELETE FROM {} WHERE client_id = ANY(%s)").format(sql.Identifier(table)), (ids,))
+    conn.commit()
+
+# ====== Benchmark ======
+def client_env(monitored: bool, client_db_id: int, spool_dir: str, settings: dict, extra_env: dict) -> dict:
+    env = {**os.environ, "PGOPTIONS": f"-c search_path={DB_SCHEMA}", "COLEXT_ENV": str(monitored)}
+    if monitored:
+        env.update({
+            **MONITORING_ENV,
+            "COLEXT_JOB_ID": "0",
+            "COLEXT_CLIENT_ID": "0",
+            "COLEXT_CLIENT_DB_ID": str(client_db_id),
+            "COLEXT_DEVICE_TYPE": "FLServer",
+            "COLEXT_SPOOL_DIR": spool_dir,
+            "COLEXT_LOG_LEVEL": "WARNING",
+            "COLEXT_MONITORING_SCRAPE_INTERVAL": str(settings["scrape_interval"]),
+            "COLEXT_MONITORING_PUSH_INTERVAL": str(settings["push_interval"]),
+            "COLEXT_MONITORING_SCRAPE_BACKEND": settings["backend"],
+            "COLEXT_MONITORING_MODE": settings["monitor_mode"],
+            **extra_env,
+        })
+    return env
+
+def bench_run(conn, args, run_i: int, settings: dict, extra_env: dict, spool_dir: str) -> dict:
+    monitored = settings is not None
+    client_db_id = register_client(conn, run_i)
+    env = client_env(monitored, client_db_id, spool_dir, settings, extra_env)
+    cmd = [sys.executable, str(Path(__file__).resolve()), "--client", "--n_rounds", str(args.n_rounds), "--fit_s", str(args.fit_s)]
+    proc = subprocess.run(cmd, env=env, capture_output=True, text=True, check=False)
+    if proc.returncode != 0:
+        print(proc.stderr, file=sys.stderr)
+        raise RuntimeError(f"Client run {run_i} failed with exit code {proc.returncode}")
+
+    run = json.loads(proc.stdout.strip().splitlines()[-1])
+    n_rows = count_hw_rows(conn, client_db_id)
+    run.update({
+        "client_db_id": client_db_id,
+        "monitored": monitored,
+        **(settings or {}),
+        # In thread mode, the metric manager CPU is part of client_cpu_s
+        "cpu_s": run["client_cpu_s"] + run["monitor_cpu_s"],
+        "monitor_self_cpu_s": get_monitor_cpu(conn, client_db_id) if monitored else None,
+        "hw_rows": n_rows,
+        "hw_rows_per_s": n_rows / run["wall_s"],
+    })
+    return run
+
+def add_overhead(run: dict, baseline: dict) -> None:
+    run["added_startup_s"] = run["startup_s"] - baseline["startup_s"]
+    run["added_cpu_s"] = run["cpu_s"] - baseline["cpu_s"]
+    run["added_cpu_pct"] = run["added_cpu_s"] / run["wall_s"] * 100
+    run["added_pss_mb"] = run["pss_mb"] - baseline["pss_mb"]
+    run["added_round_s"] = run["round_s"] - baseline["round_s"]
+
+def run_key(run: dict) -> tuple:
+    # Reports from before monitor modes only ran in process mode
+    return (run["scrape_interval"], run["push_interval"], run["backend"], run.get("monitor_mode", "process"))
+
+def find_regressions(runs, previous_runs, tolerance: float):
+    previous = {run_key(run): run for run in previous_runs}
+    regressions = []
+    for run in runs:
+        prev = previous.get(run_key(run))
+        if prev is None:
+            continue
+        for metric in COMPARED_METRICS:
+            if metric not in prev:
+                # Not measured by the previous report
+                continue
+            limit = max(prev[metric] * (1 + tolerance), prev[metric] + COMPARE_FLOORS[metric])
+            if run[metric] > limit:
+                regressions.append({"run": run_key(run), "metric": metric, "previous": prev[metric], "current": run[metric]})
+    return regressions
+
+def main():
+    args = get_args()
+    if args.client:
+        run_client(args.n_rounds, args.fit_s)
+        return
+
+    log.setLevel("WARNING")
+    extra_env = dict(kv.split("=", 1) for kv in args.env)
+    grid = [{"scrape_interval": scrape_interval, "push_interval": push_interval, "backend": backend, "monitor_mode": monitor_mode}
+            for scrape_interval, push_interval, backend, monitor_mode
+            in itertools.product(args.scrape_intervals, args.push_intervals, args.backends, args.monitor_modes)]
+
+    with psycopg.connect() as conn, tempfile.TemporaryDirectory() as spool_dir:
+        has_timescale = create_client_tables(conn)
+        baseline = bench_run(conn, args, 0, None, extra_env, spool_dir)
+        runs = []
+        try:
+            for run_i, settings in enumerate(grid, start=1):
+                run = bench_run(conn, args, run_i, settings, extra_env, spool_dir)
+                add_overhead(run, baseline)
+                runs.append(run)
+        finally:
+            if not args.keep_rows:
+                delete_bench_rows(conn, [baseline["client_db_id"]] + [run["client_db_id"] for run in runs])
+
+    print(f"Baseline: startup = {baseline['startup_s']:.3f}s, CPU = {baseline['cpu_s']:.2f}s, PSS = {baseline['pss_mb']:.1f}MB, "
+          f"round = {baseline['round_s']:.3f}s")
+    print(f"{'scrape (s)':>10} {'push (s)':>9} {'backend':>8} {'mode':>8} {'+startup (ms)':>14} {'+CPU (s)':>9} {'+CPU %':>7} "
+          f"{'+PSS (MB)':>10} {'+round (ms)':>12} {'rows/s':>8}")
+    for r in runs:
+        print(f"{r['scrape_interval']:>10} {r['push_interval']:>9} {r['backend']:>8} {r['monitor_mode']:>8} "
+              f"{r['added_startup_s'] * 1e3:>14.1f} {r['added_cpu_s']:>9.3f} {r['added_cpu_pct']:>7.2f} "
+              f"{r['added_pss_mb']:>10.1f} {r['added_round_s'] * 1e3:>12.2f} {r['hw_rows_per_s']:>8.1f}")
+
+    report = {
+        "host": {"platform": platform.platform(), "python": platform.python_version(), "cpu_count": os.cpu_count(),
+                 "timescaledb": has_timescale},
+        "settings": {"n_rounds": args.n_rounds, "fit_s": args.fit_s, "env": extra_env},
+        "baseline": baseline,
+        "runs": runs,
+    }
+    regressions = []
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = find_regressions(runs, json.load(f)["runs"], args.tolerance)
+        report["regressions"] = regressions
+        for reg in regressions:
+            print(f"REGRESSION {reg['run']}: {reg['metric']} {reg['previous']:.3f} -> {reg['current']:.3f}")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    if regressions:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Measures the scrape cost of following the whole process tree of a client.
+ - single: the root process only, through PsutilReader (previous path)
+ - tree: the root and its children through ProcessTree, split into membership refresh and sampling
+ - tree_psutil_refresh: ProcessTree finding children with psutil, which scans every process on the device
+Also compares the summed PSS reported by the tree, which is partly extrapolated from RSS, with the PSS read at that time.
+The root spawns n_children idle children holding some memory, like DataLoader workers between batches.
+Does not need a DB.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+
+from colext.metric_collection.hw_scraper.scrapers.proc_readers import PsutilReader
+from colext.metric_collection.hw_scraper.scrapers.process_tree import ProcessTree
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Benchmark process tree scraping")
+    parser.add_argument("-c", "--n_children", type=int, default=4, help="Number of child processes")
+    parser.add_argument("-n", "--n_scrapes", type=int, default=500, help="Number of scrapes per path")
+    parser.add_argument("-m", "--child_mem_mb", type=int, default=50, help="Memory held by each child")
+    parser.add_argument("-o", "--output", type=str, default=None, help="Optional json file for results")
+    return parser.parse_args()
+
+def idle_child(mem_mb, stop_event):
+    held = bytearray(mem_mb * 1024 * 1024)
+    stop_event.wait()
+    return len(held)
+
+def time_per_call_us(fn, n_calls):
+    start_cpu = time.process_time()
+    start_wall = time.perf_counter()
+    for _ in range(n_calls):
+        fn()
+    wall_us = (time.perf_counter() - start_wall) / n_calls * 1e6
+    cpu_us = (time.process_time() - start_cpu) / n_calls * 1e6
+    return wall_us, cpu_us
+
+def result(path, n_processes, wall_us, cpu_us):
+    return {"path": path, "n_processes": n_processes, "wall_us_per_scrape": wall_us, "cpu_us_per_scrape": cpu_us}
+
+def main():
+    args = get_args()
+    root_pid = os.getpid()
+
+    stop_event = multiprocessing.Event()
+    children = [multiprocessing.Process(target=idle_child, args=(args.child_mem_mb, stop_event))
+                for _ in range(args.n_children)]
+    for child in children:
+        child.start()
+    # Let the children allocate their memory
+    time.sleep(1)
+
+    results = []
+    reader = PsutilReader(root_pid)
+    results.append(result("single", 1, *time_per_call_us(reader.read_process, args.n_scrapes)))
+
+    tree = ProcessTree(root_pid)
+    results.append(result("tree", len(tree), *time_per_call_us(lambda: tree.scrape(time.time()), args.n_scrapes)))
+    results.append(result("tree (refresh only)", len(tree), *time_per_call_us(tree.refresh, args.n_scrapes)))
+    _, _, tree_pss = tree.scrape(time.time())
+    read_pss = sum(tracked.proc.memory_full_info().pss for tracked in tree.processes.values())
+
+    tree_psutil_refresh = ProcessTree(root_pid)
+    tree_psutil_refresh.use_children_files = False
+    results.append(result("tree_psutil_refresh (refresh only)", len(tree_psutil_refresh),
+                          *time_per_call_us(tree_psutil_refresh.refresh, args.n_scrapes)))
+
+    stop_event.set()
+    for child in children:
+        child.join()
+
+    print(f"{args.n_children} children holding {args.child_mem_mb} MB | {len(os.listdir('/proc'))} /proc entries | {os.cpu_count()} CPUs")
+    print(f"{'path':<36} {'processes':>9} {'wall us/scrape':>15} {'cpu us/scrape':>14}")
+    for r in results:
+        print(f"{r['path']:<36} {r['n_processes']:>9} {r['wall_us_per_scrape']:>15.1f} {r['cpu_us_per_scrape']:>14.1f}")
+    print(f"Summed PSS: tree = {tree_pss / 2**20:.1f} MB, read = {read_pss / 2**20:.1f} MB")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"results": results, "tree_pss": tree_pss, "read_pss": read_pss}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Compares how HW samples are held between scrapes and pushes.
+ - dataclass: ProcessMetrics objects in a queue, drained to a list and turned into dicts on push (previous path)
+ - columnar:  samples appended to an HWSampleBuffer and encoded straight into the COPY payload
+Reports the memory held per buffered sample (including the buffer allocation) and the client CPU spent per push.
+Does not need a DB.
+"""
+import argparse
+import json
+import queue
+import random
+import time
+import tracemalloc
+from dataclasses import asdict
+from datetime import datetime, timezone
+
+from colext.metric_collection.db_writer import HWMetricWriter
+from colext.metric_collection.sample_buffer import HWSampleBuffer
+from colext.metric_collection.typing import ProcessMetrics
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Benchmark HW sample buffering")
+    parser.add_argument("-n", "--n_pushes", type=int, default=200, help="Number of pushes per path")
+    parser.add_argument("-b", "--batch_size", type=int, default=34, help="Samples per push. Default = 10s push / 0.3s scrape")
+    parser.add_argument("-o", "--output", type=str, default=None, help="Optional json file for results")
+    return parser.parse_args()
+
+def gen_samples(n):
+    start = time.time()
+    return [(start + 0.3 * i,
+             random.uniform(0, 400), random.uniform(0, 100), random.randint(10**8, 10**9),
+             random.uniform(1000, 15000), i * 1500, i * 3000,
+             random.uniform(0, 10**6), random.uniform(0, 10**6))
+            for i in range(n)]
+
+def dataclass_fill(samples):
+    q = queue.Queue()
+    for s in samples:
+        q.put(ProcessMetrics(datetime.fromtimestamp(s[0], timezone.utc), *s[1:]))
+    return q
+
+def dataclass_push(q, client_db_id):
+    metrics = []
+    while not q.empty():
+        metrics.append(q.get())
+    return [{**asdict(m), "client_id": client_db_id} for m in metrics]
+
+def columnar_fill(samples, buffer=None):
+    if buffer is None:
+        buffer = HWSampleBuffer(len(samples))
+    buffer.clear()
+    for s in samples:
+        buffer.append(*s)
+    return buffer
+
+def measure_bytes_per_sample(fill_fn, samples):
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    held = fill_fn(samples)
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del held
+    return (after - before) / len(samples)
+
+def bench_path(name, fill_fn, push_fn, samples, n_pushes, reuse_fill_fn=None):
+    bytes_per_sample = measure_bytes_per_sample(fill_fn, samples)
+    fill_fn = reuse_fill_fn or fill_fn
+
+    fill_cpu_s = 0.0
+    push_cpu_s = 0.0
+    for _ in range(n_pushes):
+        start_cpu = time.process_time()
+        held = fill_fn(samples)
+        mid_cpu = time.process_time()
+        push_fn(held)
+        end_cpu = time.process_time()
+        fill_cpu_s += mid_cpu - start_cpu
+        push_cpu_s += end_cpu - mid_cpu
+
+    return {
+        "path": name,
+        "bytes_per_sample": bytes_per_sample,
+        "fill_cpu_us_per_sample": fill_cpu_s / (n_pushes * len(samples)) * 1e6,
+        "push_cpu_us": push_cpu_s / n_pushes * 1e6,
+    }
+
+def main():
+    args = get_args()
+    samples = gen_samples(args.batch_size)
+    writer = HWMetricWriter(client_db_id=1)
+    buffer = HWSampleBuffer(args.batch_size)
+
+    results = [
+        bench_path("dataclass", dataclass_fill, lambda q: dataclass_push(q, 1), samples, args.n_pushes),
+        # The columnar buffer is preallocated and reused between pushes, as in MetricManager
+        bench_path("columnar", columnar_fill, lambda b: writer.encode_copy_payload([(1, b)]), samples, args.n_pushes,
+                   reuse_fill_fn=lambda s: columnar_fill(s, buffer)),
+    ]
+
+    print(f"{'path':<10} {'bytes/sample':>13} {'fill cpu us/sample':>19} {'push cpu us':>12}")
+    for r in results:
+        print(f"{r['path']:<10} {r['bytes_per_sample']:>13.0f} {r['fill_cpu_us_per_sample']:>19.2f} {r['push_cpu_us']:>12.1f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Compares the cost of reading process and network counters with each scrape backend.
+ - psutil: psutil.Process oneshot + memory_full_info + net_io_counters (previous path)
+ - procfs: /proc files kept open and reread with pread
+Reports the wall and CPU time per scrape and checks both backends report the same values.
+The scraped process burns CPU in a child process so cpu_util has something to measure.
+Does not need a DB.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+
+from colext.metric_collection.hw_scraper.scrapers.proc_readers import PsutilReader, ProcfsReader
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Benchmark scrape backends")
+    parser.add_argument("-n", "--n_scrapes", type=int, default=2000, help="Number of scrapes per backend")
+    parser.add_argument("-p", "--pid", type=int, default=None, help="Process to scrape. Default = a busy child process")
+    parser.add_argument("-o", "--output", type=str, default=None, help="Optional json file for results")
+    return parser.parse_args()
+
+def busy_loop(stop_event):
+    x = 0
+    while not stop_event.is_set():
+        x += 1
+
+def scrape(reader):
+    cpu_util, mem_util = reader.read_process()
+    bytes_sent, bytes_recv = reader.read_net()
+    return cpu_util, mem_util, bytes_sent, bytes_recv
+
+def bench_backend(name, reader, n_scrapes):
+    scrape(reader) # Sets the cpu_util baseline
+    start_cpu = time.process_time()
+    start_wall = time.perf_counter()
+    for _ in range(n_scrapes):
+        scrape(reader)
+    wall_s = time.perf_counter() - start_wall
+    cpu_s = time.process_time() - start_cpu
+
+    return {
+        "backend": name,
+        "n_scrapes": n_scrapes,
+        "wall_us_per_scrape": wall_s / n_scrapes * 1e6,
+        "cpu_us_per_scrape": cpu_s / n_scrapes * 1e6,
+    }
+
+def compare_values(pid):
+    """ Scrapes with both backends over the same 1s window. """
+    readers = {"psutil": PsutilReader(pid), "procfs": ProcfsReader(pid)}
+    for reader in readers.values():
+        scrape(reader)
+    time.sleep(1)
+    values = {name: scrape(reader) for name, reader in readers.items()}
+    for reader in readers.values():
+        reader.close()
+    return values
+
+def main():
+    args = get_args()
+
+    stop_event = None
+    pid = args.pid
+    if pid is None:
+        stop_event = multiprocessing.Event()
+        busy_proc = multiprocessing.Process(target=busy_loop, args=(stop_event,), daemon=True)
+        busy_proc.start()
+        pid = busy_proc.pid
+
+    results = []
+    for name, reader_class in (("psutil", PsutilReader), ("procfs", ProcfsReader)):
+        reader = reader_class(pid)
+        results.append(bench_backend(name, reader, args.n_scrapes))
+        reader.close()
+    values = compare_values(pid)
+
+    if stop_event is not None:
+        stop_event.set()
+        busy_proc.join()
+
+    print(f"pid = {pid} | {os.cpu_count()} CPUs")
+    print(f"{'backend':>8} | {'wall us/scrape':>14} | {'cpu us/scrape':>13}")
+    for r in results:
+        print(f"{r['backend']:>8} | {r['wall_us_per_scrape']:14.1f} | {r['cpu_us_per_scrape']:13.1f}")
+    print(f"procfs speedup (cpu): {results[0]['cpu_us_per_scrape'] / results[1]['cpu_us_per_scrape']:.1f}x")
+
+    print(f"{'backend':>8} | {'cpu_util %':>10} | {'rss B':>12} | {'sent B':>12} | {'recv B':>12}")
+    for name, (cpu_util, mem_util, bytes_sent, bytes_recv) in values.items():
+        print(f"{name:>8} | {cpu_util:10.1f} | {mem_util:12d} | {bytes_sent:12d} | {bytes_recv:12d}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"results": results, "values": values}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
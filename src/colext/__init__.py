@@ -1,6 +1,50 @@
-from .metric_collection.decorators import MonitorFlwrClient, MonitorFlwrStrategy
+import importlib
+from typing import TYPE_CHECKING
+
+# Public names and the module that defines them. Modules are imported on first access (PEP 562),
+# so importing colext doesn't import Flower, psycopg or psutil before they're needed.
+# Outside of the CoLExT environment, the decorators return the class unchanged and never import them
+_EXPORTS = {
+    "MonitorFlwrClient": ".metric_collection.decorators",
+    "MonitorFlwrStrategy": ".metric_collection.decorators",
+    "monitor_epochs": ".metric_collection.training_monitor",
+    "monitor_batches": ".metric_collection.training_monitor",
+    "monitor_model": ".metric_collection.training_monitor",
+    "training_epoch": ".metric_collection.training_monitor",
+    "training_batch": ".metric_collection.training_monitor",
+    "mark_forward": ".metric_collection.training_monitor",
+    "mark_backward": ".metric_collection.training_monitor",
+    "mark_optimizer_step": ".metric_collection.training_monitor",
+    "record_batch_loss": ".metric_collection.training_monitor",
+}
+
+if TYPE_CHECKING:
+    from .metric_collection.decorators import MonitorFlwrClient, MonitorFlwrStrategy
+    from .metric_collection.training_monitor import (
+        monitor_epochs, monitor_batches, monitor_model, training_epoch, training_batch,
+        mark_forward, mark_backward, mark_optimizer_step, record_batch_loss)
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    # Later accesses don't go through __getattr__
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
 
 __all__ = [
     "MonitorFlwrClient",
     "MonitorFlwrStrategy",
-]
\ No newline at end of file
+    "monitor_epochs",
+    "monitor_batches",
+    "monitor_model",
+    "training_epoch",
+    "training_batch",
+    "mark_forward",
+    "mark_backward",
+    "mark_optimizer_step",
+    "record_batch_loss",
+]
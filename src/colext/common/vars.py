@@ -2,5 +2,6 @@ REGISTRY="colext:5000"
 
 STD_DATASETS_PATH="/colext/datasets"
 HF_DATASETS_CACHE="/colext/hf_datasets"
+SPOOL_PATH="/colext/spool"
 
 SMART_PLUG_HOST_MAP_FILE = "/colext/smart_plug_host_map.json"
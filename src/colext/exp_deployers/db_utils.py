@@ -1,6 +1,8 @@
 from typing import Tuple, BinaryIO
 import psycopg
 
+from colext.metric_collection.db_writer import CLIENT_PROCESS_COLUMNS, HW_WINDOW_COLUMNS, MONITORING_TELEMETRY_COLUMNS
+
 class DBUtils:
     def __init__(self) -> None:
         self.DB_CONNECTION = self.create_db_connection()
@@ -96,7 +98,10 @@ class DBUtils:
                         time,
                         cpu_util, mem_util, gpu_util,
                         power_consumption,
-                        n_bytes_sent, n_bytes_rcvd, net_usage_out, net_usage_in
+                        n_bytes_sent, n_bytes_rcvd, net_usage_out, net_usage_in, net_scope,
+                        n_bytes_read, n_bytes_written, n_read_ops, n_write_ops, n_major_faults, io_wait_time,
+                        CASE stage WHEN 0 THEN 'IDLE' WHEN 1 THEN 'FIT' WHEN 2 THEN 'EVAL' END AS client_stage,
+                        cpu_info, gpu_info
                     FROM clients
                     JOIN device_measurements USING (client_id)
                     JOIN jobs USING (job_id)
@@ -112,6 +117,69 @@ class DBUtils:
 
         cursor.close()
 
+    def get_hw_metric_windows(self, job_id: int, metric_writer: BinaryIO):
+        cursor = self.DB_CONNECTION.cursor()
+        window_cols = ", ".join(c for c in HW_WINDOW_COLUMNS if c != "client_id")
+        query = f"""
+                COPY
+                (SELECT client_number AS client_id,
+                        {window_cols}
+                    FROM clients
+                    JOIN device_measurement_windows USING (client_id)
+                    JOIN jobs USING (job_id)
+                    WHERE jobs.job_id = %s
+                    ORDER BY client_number, end_time)
+                TO STDOUT WITH (FORMAT CSV, HEADER)
+               """
+        data = (job_id,)
+        with cursor.copy(query, data) as copy:
+            for data in copy:
+                metric_writer.write(data)
+
+        cursor.close()
+
+    def get_monitoring_telemetry(self, job_id: int, metric_writer: BinaryIO):
+        cursor = self.DB_CONNECTION.cursor()
+        telemetry_cols = ", ".join(c for c in MONITORING_TELEMETRY_COLUMNS if c != "client_id")
+        query = f"""
+                COPY
+                (SELECT client_number AS client_id,
+                        {telemetry_cols}
+                    FROM clients
+                    JOIN monitoring_telemetry USING (client_id)
+                    JOIN jobs USING (job_id)
+                    WHERE jobs.job_id = %s
+                    ORDER BY client_number, metric)
+                TO STDOUT WITH (FORMAT CSV, HEADER)
+               """
+        data = (job_id,)
+        with cursor.copy(query, data) as copy:
+            for data in copy:
+                metric_writer.write(data)
+
+        cursor.close()
+
+    def get_client_processes(self, job_id: int, metric_writer: BinaryIO):
+        cursor = self.DB_CONNECTION.cursor()
+        process_cols = ", ".join(c for c in CLIENT_PROCESS_COLUMNS if c != "client_id")
+        query = f"""
+                COPY
+                (SELECT client_number AS client_id,
+                        {process_cols}
+                    FROM clients
+                    JOIN client_processes USING (client_id)
+                    JOIN jobs USING (job_id)
+                    WHERE jobs.job_id = %s
+                    ORDER BY client_number, first_seen, pid)
+                TO STDOUT WITH (FORMAT CSV, HEADER)
+               """
+        data = (job_id,)
+        with cursor.copy(query, data) as copy:
+            for data in copy:
+                metric_writer.write(data)
+
+        cursor.close()
+
     def get_round_metrics(self, job_id: int, metric_writer: BinaryIO):
         cursor = self.DB_CONNECTION.cursor()
         query = """
@@ -161,7 +229,9 @@ class DBUtils:
                         round_number,
                         stage,
                         cir.start_time, cir.end_time,
-                        num_examples, loss, accuracy
+                        num_examples, loss, accuracy,
+                        data_wait_time, compute_time, data_wait_fraction,
+                        set_params_time, get_params_time, params_bytes_in, params_bytes_out
                     FROM clients_in_round as cir
                         JOIN rounds USING(round_id)
                         JOIN clients USING(client_id)
@@ -176,6 +246,57 @@ class DBUtils:
 
         cursor.close()
 
+    def get_epoch_metrics(self, job_id: int, metric_writer: BinaryIO):
+        cursor = self.DB_CONNECTION.cursor()
+        query = """
+                COPY
+                (SELECT client_number AS client_id,
+                        round_number, stage, epoch_number,
+                        ep.start_time, ep.end_time,
+                        EXTRACT(EPOCH FROM ep.end_time - ep.start_time) AS "Epoch time (s)"
+                    FROM epochs as ep
+                        JOIN clients_in_round as cir USING(cir_id)
+                        JOIN rounds USING(round_id)
+                        JOIN clients USING(client_id)
+                    WHERE rounds.job_id = %s
+                    ORDER BY client_number, round_id, epoch_number)
+                TO STDOUT WITH (FORMAT CSV, HEADER)
+               """
+        data = (job_id,)
+        with cursor.copy(query, data) as copy:
+            for data in copy:
+                metric_writer.write(data)
+
+        cursor.close()
+
+    def get_batch_metrics(self, job_id: int, metric_writer: BinaryIO):
+        cursor = self.DB_CONNECTION.cursor()
+        query = """
+                COPY
+                (SELECT client_number AS client_id,
+                        round_number, stage, epoch_number, batch_number,
+                        b.start_time, b.end_time,
+                        EXTRACT(EPOCH FROM b.end_time - b.start_time) AS "Batch time (s)",
+                        EXTRACT(EPOCH FROM b.frwd_pass_time - b.start_time) AS "Forward time (s)",
+                        EXTRACT(EPOCH FROM b.bkwd_pass_time - b.frwd_pass_time) AS "Backward time (s)",
+                        EXTRACT(EPOCH FROM b.opt_step_time - b.bkwd_pass_time) AS "Optimizer step time (s)",
+                        b.loss
+                    FROM batches as b
+                        JOIN epochs as ep USING(epoch_id)
+                        JOIN clients_in_round as cir USING(cir_id)
+                        JOIN rounds USING(round_id)
+                        JOIN clients USING(client_id)
+                    WHERE rounds.job_id = %s
+                    ORDER BY client_number, round_id, epoch_number, batch_number)
+                TO STDOUT WITH (FORMAT CSV, HEADER)
+               """
+        data = (job_id,)
+        with cursor.copy(query, data) as copy:
+            for data in copy:
+                metric_writer.write(data)
+
+        cursor.close()
+
     def get_server_round_metrics(self, job_id: int, metric_writer: BinaryIO):
         cursor = self.DB_CONNECTION.cursor()
         query = """
@@ -209,6 +330,9 @@ class DBUtils:
         with open("hw_metrics.csv", "wb") as metric_writer:
             self.get_hw_metrics(job_id, metric_writer)
 
+        with open("hw_metric_windows.csv", "wb") as metric_writer:
+            self.get_hw_metric_windows(job_id, metric_writer)
+
         with open("round_metrics.csv", "wb") as metric_writer:
             self.get_round_metrics(job_id, metric_writer)
 
@@ -218,9 +342,21 @@ class DBUtils:
         with open("server_round_metrics.csv", "wb") as metric_writer:
             self.get_server_round_metrics(job_id, metric_writer)
 
+        with open("epoch_metrics.csv", "wb") as metric_writer:
+            self.get_epoch_metrics(job_id, metric_writer)
+
+        with open("batch_metrics.csv", "wb") as metric_writer:
+            self.get_batch_metrics(job_id, metric_writer)
+
         with open("client_info.csv", "wb") as metric_writer:
             self.get_client_info(job_id, metric_writer)
 
+        with open("monitoring_telemetry.csv", "wb") as metric_writer:
+            self.get_monitoring_telemetry(job_id, metric_writer)
+
+        with open("client_processes.csv", "wb") as metric_writer:
+            self.get_client_processes(job_id, metric_writer)
+
 class JobNotFoundException(ValueError):
     """Could not find the job in DB"""
 
@@ -18,6 +18,7 @@ class LocalDeployer(DeployerBase):
 
         # Will be assigned to inside deploy_setup
         self.server_proc = None
+        self.collector_proc = None
         self.log_file_handles = []
         self.client_procs = []
 
@@ -37,6 +38,9 @@ class LocalDeployer(DeployerBase):
 
         self.log_file_handles = []
 
+        if self.config["monitoring"]["collector_address"] == "local":
+            self.deploy_collector(job_id, logs_dir)
+
         log.info("Deploying server")
         server_log_path = logs_dir.joinpath("server.log")
         server_log_handle = open(server_log_path, 'w', encoding='UTF-8')
@@ -66,6 +70,25 @@ class LocalDeployer(DeployerBase):
         log.info("Experiment deployed")
         log.info(f"Logs are being streamed to {logs_dir}")
 
+    def deploy_collector(self, job_id: int, logs_dir: Path):
+        """ Starts a metric collector for this experiment only """
+        log.info("Deploying metric collector")
+        collector_log_handle = open(logs_dir.joinpath("collector.log"), 'w', encoding='UTF-8')
+        self.log_file_handles.append(collector_log_handle)
+
+        base_env_vars = self.get_base_env_vars(job_id)
+        collector_cmd = ["colext_collector",
+                         "--listen", base_env_vars["COLEXT_COLLECTOR_ADDRESS"],
+                         "--push_mode", base_env_vars["COLEXT_MONITORING_PUSH_MODE"]]
+        self.collector_proc = subprocess.Popen(collector_cmd, env={**os.environ.copy(), **base_env_vars},
+                                               stdout=collector_log_handle, stderr=collector_log_handle)
+
+    def get_collector_address(self, job_id: int) -> str:
+        collector_address = self.config["monitoring"]["collector_address"]
+        if collector_address == "local":
+            collector_address = f"unix:/tmp/colext_collector_{job_id}.sock"
+        return collector_address
+
     def get_base_env_vars(self, job_id):
         base_env_vars = {
             "COLEXT_ENV": str(self.config["colext"]["monitor_job"]),
@@ -77,11 +100,28 @@ class LocalDeployer(DeployerBase):
             "COLEXT_N_CLIENTS": str(self.config["n_clients"]),
 
             "COLEXT_DATASETS": os.getenv("COLEXT_DATASETS", STD_DATASETS_PATH),
+            "COLEXT_SPOOL_DIR": str(Path(self.config["code"]["path"]) / "colext_spool"),
 
             "COLEXT_MONITORING_LIVE_METRICS": str(self.config["monitoring"]["live_metrics"]),
             "COLEXT_MONITORING_PUSH_INTERVAL": str(self.config["monitoring"]["push_interval"]),
             "COLEXT_MONITORING_SCRAPE_INTERVAL": str(self.config["monitoring"]["scraping_interval"]),
+            "COLEXT_MONITORING_SCRAPE_INTERVAL_FIT": str(self.config["monitoring"]["fit_scraping_interval"]),
+            "COLEXT_MONITORING_SCRAPE_INTERVAL_EVAL": str(self.config["monitoring"]["eval_scraping_interval"]),
+            "COLEXT_MONITORING_SCRAPE_INTERVAL_IDLE": str(self.config["monitoring"]["idle_scraping_interval"]),
+            "COLEXT_MONITORING_HIGH_RES_SAMPLING": str(self.config["monitoring"]["high_res_sampling"]),
+            "COLEXT_MONITORING_SCRAPE_BACKEND": str(self.config["monitoring"]["scrape_backend"]),
+            "COLEXT_MONITORING_PROCESS_TREE": str(self.config["monitoring"]["process_tree"]),
+            "COLEXT_MONITORING_NET_SCOPE": str(self.config["monitoring"]["net_scope"]),
+            "COLEXT_MONITORING_SCRAPER": str(self.config["monitoring"]["scraper"]),
+            "COLEXT_MONITORING_SMART_PLUG_INTERVAL": str(self.config["monitoring"]["smart_plug_interval"]),
+            "COLEXT_MONITORING_THERMAL_INTERVAL": str(self.config["monitoring"]["thermal_interval"]),
             "COLEXT_MONITORING_MEASURE_SELF": str(self.config["monitoring"]["measure_self"]),
+            "COLEXT_MONITORING_MODE": str(self.config["monitoring"]["monitor_mode"]),
+            "COLEXT_MONITORING_PUSH_MODE": str(self.config["monitoring"]["push_mode"]),
+            "COLEXT_MONITORING_AGG_WINDOW": str(self.config["monitoring"]["agg_window"]),
+            "COLEXT_MONITORING_RAW_RETENTION": str(self.config["monitoring"]["raw_retention"]),
+            "COLEXT_MONITORING_BATCH_SAMPLING": str(self.config["monitoring"]["batch_sampling"]),
+            "COLEXT_COLLECTOR_ADDRESS": self.get_collector_address(job_id),
 
             "PGHOSTADDR": "127.0.0.1",
             "PGDATABASE": "colext_db",
@@ -148,6 +188,12 @@ class LocalDeployer(DeployerBase):
                 else:
                     log.info(f"Client {client_i} finished successfully")
 
+        if self.collector_proc is not None:
+            log.info("Stopping metric collector")
+            # The collector writes the batches it still holds before exiting
+            self.collector_proc.terminate()
+            self.collector_proc.wait()
+
         # Close file handles
         for f in self.log_file_handles:
             f.close()
@@ -9,7 +9,7 @@ from python_on_whales import docker
 from jinja2 import Environment, FileSystemLoader
 
 from colext.common.logger import log
-from colext.common.vars import REGISTRY, STD_DATASETS_PATH, HF_DATASETS_CACHE
+from colext.common.vars import REGISTRY, STD_DATASETS_PATH, HF_DATASETS_CACHE, SPOOL_PATH
 from colext.exp_deployers.deployer_base import DeployerBase
 from .kubernetes_utils import KubernetesUtils
 
@@ -123,7 +123,23 @@ class SBCDeployer(DeployerBase):
             pod_config["monitoring_live_metrics"] = self.config["monitoring"]["live_metrics"]
             pod_config["monitoring_push_interval"] = self.config["monitoring"]["push_interval"]
             pod_config["monitoring_scrape_interval"] = self.config["monitoring"]["scraping_interval"]
+            pod_config["monitoring_scrape_interval_fit"] = self.config["monitoring"]["fit_scraping_interval"]
+            pod_config["monitoring_scrape_interval_eval"] = self.config["monitoring"]["eval_scraping_interval"]
+            pod_config["monitoring_scrape_interval_idle"] = self.config["monitoring"]["idle_scraping_interval"]
+            pod_config["monitoring_high_res_sampling"] = self.config["monitoring"]["high_res_sampling"]
+            pod_config["monitoring_scrape_backend"] = self.config["monitoring"]["scrape_backend"]
+            pod_config["monitoring_process_tree"] = self.config["monitoring"]["process_tree"]
+            pod_config["monitoring_net_scope"] = self.config["monitoring"]["net_scope"]
+            pod_config["monitoring_scraper"] = self.config["monitoring"]["scraper"]
+            pod_config["monitoring_smart_plug_interval"] = self.config["monitoring"]["smart_plug_interval"]
+            pod_config["monitoring_thermal_interval"] = self.config["monitoring"]["thermal_interval"]
             pod_config["monitoring_measure_self"] = self.config["monitoring"]["measure_self"]
+            pod_config["monitoring_mode"] = self.config["monitoring"]["monitor_mode"]
+            pod_config["monitoring_push_mode"] = self.config["monitoring"]["push_mode"]
+            pod_config["monitoring_agg_window"] = self.config["monitoring"]["agg_window"]
+            pod_config["monitoring_raw_retention"] = self.config["monitoring"]["raw_retention"]
+            pod_config["monitoring_batch_sampling"] = self.config["monitoring"]["batch_sampling"]
+            pod_config["collector_address"] = self.config["monitoring"]["collector_address"]
 
             # Add IP of smartplug in case it exists
             pod_config["SP_IP_ADDRESS"] = self.smart_plug_host_map.get(dev_hostname, None)
@@ -164,6 +180,7 @@ class SBCDeployer(DeployerBase):
         pod_config["log_level"] = config["colext"]["log_level"]
         pod_config["std_datasets_path"] = STD_DATASETS_PATH
         pod_config["hf_datasets_path"] = HF_DATASETS_CACHE
+        pod_config["spool_path"] = SPOOL_PATH
 
         return pod_config
 
@@ -0,0 +1,128 @@
+import socket
+import struct
+import zlib
+from typing import BinaryIO, List, Optional, Tuple
+
+from colext.common.logger import log
+from colext.metric_collection.metric_spool import RECORD_HEADER, encode_batch_records, encode_record
+from colext.metric_collection.monitor_sockets import register_monitor_socket
+from colext.metric_collection.sample_buffer import HWSampleBuffer
+from colext.metric_collection.typing import HWWindowMetrics, StageMetrics
+
+# Frames share the spool record format. Metric batches use the spool record types
+FRAME_HELLO = 16 # client -> collector: client_db_id
+FRAME_COMMIT = 17 # client -> collector: end of batch
+FRAME_ACK = 18 # collector -> client: batch status
+HELLO_PAYLOAD = struct.Struct("<i")
+ACK_PAYLOAD = struct.Struct("<B")
+ACK_OK = 0
+ACK_FAILED = 1
+# The batch failed too many times and was set aside by the collector. It must not be retried
+ACK_QUARANTINED = 2
+
+DEFAULT_COLLECTOR_PORT = 8150
+
+class CollectorError(OSError):
+    """The metric collector could not store a batch"""
+
+def parse_collector_address(address: str) -> Tuple[int, object]:
+    """ Parses 'unix:<path>' or '<host>:<port>' into a (socket family, socket address) pair. """
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:"):]
+
+    host, _, port = address.rpartition(":")
+    if not host:
+        host, port = port, DEFAULT_COLLECTOR_PORT
+    return socket.AF_INET, (host, int(port))
+
+def read_frame(rfile: BinaryIO) -> Optional[Tuple[int, bytes]]:
+    """ Reads a (frame_type, payload) pair. Returns None if the peer closed the connection. """
+    header = rfile.read(RECORD_HEADER.size)
+    if not header:
+        return None
+    if len(header) < RECORD_HEADER.size:
+        raise CollectorError("Connection closed in the middle of a frame")
+
+    payload_len, payload_crc, frame_type = RECORD_HEADER.unpack(header)
+    payload = rfile.read(payload_len)
+    if len(payload) < payload_len:
+        raise CollectorError("Connection closed in the middle of a frame")
+    if zlib.crc32(payload) != payload_crc:
+        raise CollectorError("Corrupted frame")
+    return frame_type, payload
+
+class CollectorClient():
+    """
+        Ships metric batches to the metric collector instead of writing them to the DB.
+
+        Each batch is sent as a sequence of records followed by a commit frame.
+        push returns once the collector acknowledges the batch was written to the DB.
+        Connection problems and failed writes raise an OSError so the caller can spool the batch.
+        The connection is reopened on the next push.
+    """
+    def __init__(self, address: str, client_db_id: int, timeout_s: float = 60) -> None:
+        self.address = address
+        self.family, self.sock_address = parse_collector_address(address)
+        self.client_db_id = int(client_db_id)
+        self.timeout_s = timeout_s
+        self.sock = None
+        self.rfile = None
+
+    def connect(self) -> None:
+        sock = socket.socket(self.family, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout_s)
+        try:
+            sock.connect(self.sock_address)
+        except OSError:
+            sock.close()
+            raise
+
+        self.sock = sock
+        self.rfile = sock.makefile("rb")
+        # Not counted as client traffic when the metric manager runs in the client process
+        register_monitor_socket(sock.fileno())
+        self.sock.sendall(encode_record(FRAME_HELLO, HELLO_PAYLOAD.pack(self.client_db_id)))
+        log.info("Connected to metric collector at %s", self.address)
+
+    def set_timeout(self, timeout_s: float) -> None:
+        """ Applies to the next socket operations, including those of a push in progress in another thread. """
+        self.timeout_s = timeout_s
+        sock = self.sock
+        if sock is not None:
+            sock.settimeout(timeout_s)
+
+    def close(self) -> None:
+        if self.sock is None:
+            return
+
+        self.rfile.close()
+        self.sock.close()
+        self.sock = None
+        self.rfile = None
+
+    def push(self, hw_metrics: HWSampleBuffer, hw_windows: List[HWWindowMetrics],
+             stage_metrics: List[StageMetrics], training_records: bytes) -> None:
+        records = encode_batch_records(hw_metrics, hw_windows, stage_metrics, training_records)
+        if not records:
+            return
+
+        frames = [encode_record(record_type, payload) for record_type, payload in records]
+        frames.append(encode_record(FRAME_COMMIT, b""))
+        try:
+            if self.sock is None:
+                self.connect()
+            self.sock.sendall(b"".join(frames))
+            frame = read_frame(self.rfile)
+        except OSError:
+            self.close()
+            raise
+
+        if frame is None or frame[0] != FRAME_ACK:
+            self.close()
+            raise CollectorError("Metric collector closed the connection before acknowledging the batch")
+        (status,) = ACK_PAYLOAD.unpack(frame[1])
+        if status == ACK_QUARANTINED:
+            log.error("Metric collector could not write a batch after several attempts and quarantined it.")
+            return
+        if status != ACK_OK:
+            raise CollectorError("Metric collector could not write the batch to the DB")
@@ -0,0 +1,326 @@
+import os
+import time
+import queue
+import socket
+import hashlib
+import threading
+import socketserver
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+import psycopg
+from psycopg_pool import ConnectionPool
+
+from colext.common.logger import log
+from colext.metric_collection.collector_client import (
+    ACK_FAILED, ACK_OK, ACK_PAYLOAD, ACK_QUARANTINED, FRAME_ACK, FRAME_COMMIT, FRAME_HELLO, HELLO_PAYLOAD,
+    CollectorError, parse_collector_address, read_frame)
+from colext.metric_collection.db_writer import HWMetricWriter, write_hw_windows, write_stage_metrics, write_training_metrics
+from colext.metric_collection.metric_spool import BATCH_RECORD_TYPES, MetricSpool, decode_batch_record, encode_record
+from colext.metric_collection.sample_buffer import HWSampleBuffer
+from colext.metric_collection.training_monitor import TRAINING_RECORD
+from colext.metric_collection.typing import HWWindowMetrics, StageMetrics
+
+class PendingBatch():
+    """ Metric batch received from a client, waiting to be written by the collector. """
+    def __init__(self, client_db_id: int) -> None:
+        self.client_db_id = client_db_id
+        self.hw_metrics: List[HWSampleBuffer] = []
+        self.hw_windows: List[HWWindowMetrics] = []
+        self.stage_metrics: List[StageMetrics] = []
+        self.training_records = bytearray()
+        # Frames as received, written to the quarantine if the batch keeps failing
+        self.frames: List[Tuple[int, bytes]] = []
+        self.done = threading.Event()
+        self.ok = False
+        self.quarantined = False
+
+    def digest(self) -> bytes:
+        """ Identifies the batch when the client retries it, e.g. when replaying its spool. """
+        h = hashlib.blake2b(str(self.client_db_id).encode(), digest_size=16)
+        for frame_type, payload in self.frames:
+            h.update(bytes([frame_type]))
+            h.update(payload)
+        return h.digest()
+
+    @property
+    def n_rows(self) -> int:
+        return (sum(len(m) for m in self.hw_metrics) + len(self.hw_windows) + len(self.stage_metrics)
+                + len(self.training_records) // TRAINING_RECORD.size)
+
+# All clients of an experiment connect around the same time
+LISTEN_BACKLOG = 512
+# Failed writes of the same batch before it's quarantined
+MAX_BATCH_ATTEMPTS = 3
+# Failing batches tracked at once. The oldest are forgotten first
+MAX_TRACKED_FAILURES = 10_000
+
+class CollectorTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = LISTEN_BACKLOG
+
+class CollectorUnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    request_queue_size = LISTEN_BACKLOG
+
+class MetricCollector():
+    """
+        Receives metric batches from clients and writes them to the DB in bulk.
+
+        Every client connection is served by its own thread, which queues the received batches.
+        Writer threads coalesce the queued batches of all clients for up to flush_interval_s
+        (or until max_batch_rows) and write them in a single transaction with one COPY.
+        A client is acknowledged once its batch is committed, so it can spool the batch otherwise.
+        A batch that fails MAX_BATCH_ATTEMPTS times (e.g. a bad row retried from the client spool) is written
+        to a spool in quarantine_dir/client_<id> and acknowledged as quarantined, so the client stops retrying it.
+        Once fixed, quarantined batches can be pushed with colext_replay_spool --spool_dir <quarantine_dir>.
+        With dry_run, batches are decoded and acknowledged without touching the DB.
+    """
+    def __init__(self, address: str, push_mode: str = "copy", n_writers: int = 2,
+                 flush_interval_s: float = 0.5, max_batch_rows: int = 50_000,
+                 report_interval_s: float = 10, dry_run: bool = False,
+                 quarantine_dir: str = "collector_quarantine") -> None:
+        self.address = address
+        self.push_mode = push_mode
+        self.n_writers = n_writers
+        self.flush_interval_s = flush_interval_s
+        self.max_batch_rows = max_batch_rows
+        self.report_interval_s = report_interval_s
+        self.dry_run = dry_run
+        self.quarantine_dir = quarantine_dir
+
+        self.pending_batches = queue.Queue()
+        self.finish_event = threading.Event()
+        self.stats_lock = threading.Lock()
+        self.n_clients = 0
+        self.n_rows = 0
+        self.n_batches = 0
+        self.n_failed_batches = 0
+        self.n_quarantined_batches = 0
+        self.n_writes = 0
+        # Batch digest -> failed attempts
+        self.batch_failures = OrderedDict()
+        self.quarantine_lock = threading.Lock()
+
+        self.db_pool = None
+        if not self.dry_run:
+            # DB parameters are read from env variables
+            self.db_pool = ConnectionPool(open=True, min_size=1, max_size=n_writers)
+        # writer_ths share pending_batches. Each one keeps its own HWMetricWriter
+        self.writer_ths = [threading.Thread(target=self.writer_loop, daemon=True) for _ in range(n_writers)]
+        self.reporter_th = threading.Thread(target=self.report_loop, daemon=True)
+        self.server = self.create_server()
+
+    def create_server(self) -> socketserver.BaseServer:
+        family, sock_address = parse_collector_address(self.address)
+        collector = self
+
+        class ClientHandler(socketserver.StreamRequestHandler):
+            def handle(self):
+                collector.handle_client(self.rfile, self.wfile)
+
+        if family == socket.AF_UNIX:
+            if os.path.exists(sock_address):
+                os.remove(sock_address)
+            return CollectorUnixServer(sock_address, ClientHandler)
+        return CollectorTCPServer(sock_address, ClientHandler)
+
+    def start(self) -> None:
+        for writer_th in self.writer_ths:
+            writer_th.start()
+        self.reporter_th.start()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        log.info("Metric collector listening on %s", self.address)
+
+    def stop(self) -> None:
+        """ Stops accepting batches and waits for the queued ones to be written. """
+        log.info("Stopping metric collector.")
+        self.server.shutdown()
+        self.server.server_close()
+        self.finish_event.set()
+        for writer_th in self.writer_ths:
+            writer_th.join()
+        if self.db_pool is not None:
+            self.db_pool.close()
+
+        log.info("Metric collector wrote %s rows from %s batches in %s writes (%s failed batches, %s quarantined).",
+                 self.n_rows, self.n_batches, self.n_writes, self.n_failed_batches, self.n_quarantined_batches)
+
+    # ====== Client connections ======
+    def handle_client(self, rfile, wfile) -> None:
+        try:
+            frame = read_frame(rfile)
+        except OSError as err:
+            log.warning("Lost connection to client (%s).", err)
+            return
+        if frame is None or frame[0] != FRAME_HELLO:
+            log.warning("Client did not introduce itself. Closing connection.")
+            return
+
+        (client_db_id,) = HELLO_PAYLOAD.unpack(frame[1])
+        log.info("Client %s connected.", client_db_id)
+        with self.stats_lock:
+            self.n_clients += 1
+        try:
+            self.serve_client(client_db_id, rfile, wfile)
+        except OSError as err:
+            log.warning("Lost connection to client %s (%s).", client_db_id, err)
+        finally:
+            with self.stats_lock:
+                self.n_clients -= 1
+
+    def serve_client(self, client_db_id: int, rfile, wfile) -> None:
+        batch = PendingBatch(client_db_id)
+        while True:
+            frame = read_frame(rfile)
+            if frame is None:
+                log.info("Client %s disconnected.", client_db_id)
+                return
+
+            frame_type, payload = frame
+            if frame_type in BATCH_RECORD_TYPES:
+                batch.frames.append(frame)
+                hw_metrics, hw_windows, stage_metrics, training_records = decode_batch_record(frame_type, payload)
+                if len(hw_metrics) > 0:
+                    batch.hw_metrics.append(hw_metrics)
+                batch.hw_windows.extend(hw_windows)
+                batch.stage_metrics.extend(stage_metrics)
+                batch.training_records += training_records
+            elif frame_type == FRAME_COMMIT:
+                self.pending_batches.put(batch)
+                batch.done.wait()
+                status = ACK_OK if batch.ok else ACK_QUARANTINED if batch.quarantined else ACK_FAILED
+                wfile.write(encode_record(FRAME_ACK, ACK_PAYLOAD.pack(status)))
+                wfile.flush()
+                batch = PendingBatch(client_db_id)
+            else:
+                raise CollectorError(f"Unexpected frame type {frame_type} from client {client_db_id}")
+
+    # ====== DB writes ======
+    def writer_loop(self) -> None:
+        hw_metric_writer = HWMetricWriter(None, self.push_mode)
+        while True:
+            batches = self.coalesce_batches()
+            if batches is None:
+                break
+
+            start_write_time = time.perf_counter()
+            self.write_batches(hw_metric_writer, batches)
+            log.debug("Wrote %s batches in %.3fs", len(batches), time.perf_counter() - start_write_time)
+
+    def coalesce_batches(self) -> Optional[List[PendingBatch]]:
+        """ Waits for a batch and collects the ones arriving in the next flush_interval_s. Returns None on stop. """
+        while True:
+            try:
+                batches = [self.pending_batches.get(timeout=0.5)]
+                break
+            except queue.Empty:
+                if self.finish_event.is_set():
+                    return None
+
+        n_rows = batches[0].n_rows
+        deadline = time.monotonic() + self.flush_interval_s
+        while n_rows < self.max_batch_rows:
+            remaining_time = deadline - time.monotonic()
+            if remaining_time <= 0:
+                break
+            try:
+                batch = self.pending_batches.get(timeout=remaining_time)
+            except queue.Empty:
+                break
+            batches.append(batch)
+            n_rows += batch.n_rows
+
+        return batches
+
+    def write_batches(self, hw_metric_writer: HWMetricWriter, batches: List[PendingBatch]) -> None:
+        try:
+            try:
+                if not self.dry_run:
+                    with self.db_pool.connection() as conn:
+                        with conn.transaction():
+                            self.write_to_db(conn, hw_metric_writer, batches)
+                ok = True
+            # Not only DB errors: a bad row can fail while building the COPY data
+            except Exception as err:
+                log.error("Could not write %s coalesced batches (%s: %s).", len(batches), type(err).__name__, err)
+                ok = False
+
+            if not ok and len(batches) > 1:
+                # Write batches one by one so a bad batch does not fail the others
+                for batch in batches:
+                    self.write_batches(hw_metric_writer, [batch])
+                return
+
+            with self.stats_lock:
+                self.n_writes += 1
+                self.n_batches += len(batches)
+                if ok:
+                    self.n_rows += sum(b.n_rows for b in batches)
+                else:
+                    self.n_failed_batches += len(batches)
+
+            for batch in batches:
+                batch.ok = ok
+                if not ok:
+                    self.record_failure(batch)
+        finally:
+            # Clients wait for their batches, whatever happened
+            for batch in batches:
+                batch.done.set()
+
+    def record_failure(self, batch: PendingBatch) -> None:
+        """ Counts a failed write of batch and quarantines it once it failed MAX_BATCH_ATTEMPTS times. """
+        digest = batch.digest()
+        with self.quarantine_lock:
+            n_attempts = self.batch_failures.pop(digest, 0) + 1
+            if n_attempts < MAX_BATCH_ATTEMPTS:
+                self.batch_failures[digest] = n_attempts
+                while len(self.batch_failures) > MAX_TRACKED_FAILURES:
+                    self.batch_failures.popitem(last=False)
+                return
+
+            quarantine_path = os.path.join(self.quarantine_dir, f"client_{batch.client_db_id}")
+            try:
+                spool = MetricSpool(quarantine_path)
+                for frame_type, payload in batch.frames:
+                    spool.append_record(frame_type, payload)
+                spool.close()
+            except OSError as err:
+                log.error("Could not quarantine a batch of client %s (%s). It will be retried.", batch.client_db_id, err)
+                return
+
+        batch.quarantined = True
+        with self.stats_lock:
+            self.n_quarantined_batches += 1
+        log.error("Batch of client %s failed %s times. Quarantined it in %s.",
+                  batch.client_db_id, n_attempts, quarantine_path)
+
+    @staticmethod
+    def write_to_db(conn: psycopg.Connection, hw_metric_writer: HWMetricWriter, batches: List[PendingBatch]) -> None:
+        hw_batches = [(b.client_db_id, m) for b in batches for m in b.hw_metrics]
+        if hw_batches:
+            hw_metric_writer.write_batches(conn, hw_batches)
+        for batch in batches:
+            if batch.hw_windows:
+                write_hw_windows(conn, batch.client_db_id, batch.hw_windows)
+        stage_metrics = [sm for b in batches for sm in b.stage_metrics]
+        if stage_metrics:
+            write_stage_metrics(conn, stage_metrics)
+        # After the stage metrics, which create the rows training records are linked to
+        for batch in batches:
+            if batch.training_records:
+                write_training_metrics(conn, batch.client_db_id, batch.training_records)
+
+    # ====== Reporting ======
+    def report_loop(self) -> None:
+        last_rows, last_batches, last_time = 0, 0, time.monotonic()
+        while not self.finish_event.wait(self.report_interval_s):
+            now = time.monotonic()
+            with self.stats_lock:
+                n_rows, n_batches, n_clients = self.n_rows, self.n_batches, self.n_clients
+            elapsed = now - last_time
+            log.info("Collector ingest: %.0f rows/s, %.1f batches/s from %s clients. %s batches queued.",
+                     (n_rows - last_rows) / elapsed, (n_batches - last_batches) / elapsed,
+                     n_clients, self.pending_batches.qsize())
+            last_rows, last_batches, last_time = n_rows, n_batches, now
@@ -0,0 +1,273 @@
+import math
+import struct
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+from dataclasses import asdict
+import psycopg
+from psycopg import sql
+
+from colext.common.logger import log
+from colext.metric_collection.typing import HWWindowMetrics, StageMetrics
+from colext.metric_collection.sample_buffer import HW_SAMPLE_INFO_FIELDS, HW_SAMPLE_IO_FIELDS, STAGE_UNKNOWN, HWSampleBuffer
+from colext.metric_collection.hw_aggregator import HW_COUNTER_FIELDS, HW_GAUGE_FIELDS, HW_WINDOW_STATS
+from colext.metric_collection.training_monitor import RECORD_BATCH, RECORD_EPOCH, TRAINING_RECORD
+
+# Same order as HW_SAMPLE_FIELDS + HW_SAMPLE_INFO_FIELDS + stage + HW_SAMPLE_IO_FIELDS with client_id after time
+HW_METRIC_COLUMNS = ("time", "client_id", "cpu_util", "gpu_util", "mem_util", "power_consumption",
+                     "n_bytes_sent", "n_bytes_rcvd", "net_usage_out", "net_usage_in", *HW_SAMPLE_INFO_FIELDS, "stage",
+                     *HW_SAMPLE_IO_FIELDS)
+
+# Types used for the binary COPY into the staging table. Values are cast to the target table types on INSERT.
+HW_METRIC_COPY_TYPES = ("timestamptz", "int4", "float8", "float8", "float8", "float8",
+                        "int8", "int8", "float8", "float8", *("jsonb" for _ in HW_SAMPLE_INFO_FIELDS), "int2",
+                        *("float8" for _ in HW_SAMPLE_IO_FIELDS))
+
+# Binary COPY file format: https://www.postgresql.org/docs/current/sql-copy.html
+COPY_BINARY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+COPY_BINARY_TRAILER = struct.pack("!h", -1)
+# Field count followed by (length, value) for each fixed size column in HW_METRIC_COLUMNS
+HW_METRIC_COPY_ROW = struct.Struct("!h" + "iq" + "ii" + "id" * 4 + "iq" * 2 + "id" * 2)
+# Info fields follow as (length, jsonb version, JSON text), or a -1 length for NULL
+COPY_FIELD_LENGTH = struct.Struct("!i")
+COPY_NULL_FIELD = COPY_FIELD_LENGTH.pack(-1)
+JSONB_BINARY_VERSION = b"\x01"
+# The stage is last, as (length, value) or NULL for STAGE_UNKNOWN
+COPY_STAGE_FIELD = struct.Struct("!ih")
+# Followed by the I/O counters as (length, value)
+HW_METRIC_COPY_IO = struct.Struct("!" + "id" * len(HW_SAMPLE_IO_FIELDS))
+PG_EPOCH_S = 946684800 # 2000-01-01 UTC
+
+VALID_PUSH_MODES = ["copy", "insert"]
+
+HW_WINDOW_COLUMNS = ("start_time", "end_time", "client_id", "n_samples", "energy",
+                     *(f"{field}_{stat}" for field in HW_GAUGE_FIELDS for stat in HW_WINDOW_STATS),
+                     *HW_COUNTER_FIELDS)
+
+# Same order as MonitoringTelemetry.summary_rows with client_id first
+MONITORING_TELEMETRY_COLUMNS = ("client_id", "metric", "n_values", "sum", "min", "max", "p50", "p90", "p99",
+                                "bucket_bounds", "bucket_counts")
+
+# Same order as ProcessStats.to_row with client_id first
+CLIENT_PROCESS_COLUMNS = ("client_id", "pid", "ppid", "name", "first_seen", "last_seen", "n_samples",
+                          "cpu_util_mean", "cpu_util_max", "rss_mean", "rss_max", "pss_mean", "pss_max")
+
+class HWMetricWriter:
+    """
+        Writes HW metrics to the device_measurements table.
+
+        push_mode="copy" streams each batch with a binary COPY into a session temp table
+        and moves it to the target table with a single INSERT ... SELECT.
+        A direct COPY into the target table is not possible because COPY FROM is not supported
+        for tables with row level security enabled.
+        If the COPY path fails, the writer permanently falls back to row-by-row INSERTs.
+        client_db_id can be None if the writer is only used with write_batches.
+    """
+    def __init__(self, client_db_id: Optional[int], push_mode: str = "copy",
+                 table: str = "fl_testbed_logging.device_measurements") -> None:
+        if push_mode not in VALID_PUSH_MODES:
+            raise ValueError(f"push_mode can only be set to {VALID_PUSH_MODES}. Got '{push_mode}'")
+
+        self.client_db_id = None if client_db_id is None else int(client_db_id)
+        self.use_copy = push_mode == "copy"
+
+        table_id = sql.Identifier(*table.split("."))
+        staging_id = sql.Identifier("colext_hw_metrics_staging")
+        cols = sql.SQL(", ").join(map(sql.Identifier, HW_METRIC_COLUMNS))
+        staging_cols = sql.SQL(", ").join(
+            sql.SQL("{} {}").format(sql.Identifier(c), sql.SQL(t)) for c, t in zip(HW_METRIC_COLUMNS, HW_METRIC_COPY_TYPES))
+        # Missing values are encoded as NaN in the COPY payload
+        staging_select = sql.SQL(", ").join(
+            sql.SQL("NULLIF({}, 'NaN')").format(sql.Identifier(c)) if t == "float8" else sql.Identifier(c)
+            for c, t in zip(HW_METRIC_COLUMNS, HW_METRIC_COPY_TYPES))
+
+        self.create_staging_sql = sql.SQL(
+            "CREATE TEMP TABLE IF NOT EXISTS {staging} ({staging_cols}) ON COMMIT DELETE ROWS"
+        ).format(staging=staging_id, staging_cols=staging_cols)
+        self.copy_sql = sql.SQL(
+            "COPY {staging} ({cols}) FROM STDIN (FORMAT BINARY)"
+        ).format(staging=staging_id, cols=cols)
+        self.move_sql = sql.SQL(
+            "INSERT INTO {table} ({cols}) SELECT {staging_select} FROM {staging}"
+        ).format(table=table_id, cols=cols, staging_select=staging_select, staging=staging_id)
+        self.insert_sql = sql.SQL(
+            "INSERT INTO {table} ({cols}) VALUES ({placeholders})"
+        ).format(table=table_id, cols=cols,
+                 placeholders=sql.SQL(", ").join(sql.Placeholder() * len(HW_METRIC_COLUMNS)))
+
+    def write(self, conn: psycopg.Connection, metrics: HWSampleBuffer) -> None:
+        """ Writes metrics using conn. Each call runs in its own transaction. """
+        self.write_batches(conn, [(self.client_db_id, metrics)])
+
+    def write_batches(self, conn: psycopg.Connection, batches: List[Tuple[int, HWSampleBuffer]]) -> None:
+        """ Writes (client_db_id, metrics) batches from possibly different clients in a single transaction. """
+        if self.use_copy:
+            try:
+                with conn.transaction():
+                    self.copy_metrics(conn, batches)
+                return
+            except psycopg.OperationalError:
+                # Connection problems are not specific to COPY
+                raise
+            except psycopg.Error as err:
+                log.warning("Could not push HW metrics using COPY (%s). Falling back to INSERT.", err)
+                self.use_copy = False
+
+        with conn.transaction():
+            self.insert_metrics(conn, batches)
+
+    def copy_metrics(self, conn: psycopg.Connection, batches: List[Tuple[int, HWSampleBuffer]]) -> None:
+        payload = self.encode_copy_payload(batches)
+        with conn.cursor() as cur:
+            cur.execute(self.create_staging_sql)
+            with cur.copy(self.copy_sql) as copy:
+                copy.write(payload)
+            cur.execute(self.move_sql)
+
+    def encode_copy_payload(self, batches: List[Tuple[int, HWSampleBuffer]]) -> bytearray:
+        """ Encodes the buffer columns as a binary COPY payload, packing rows in place. """
+        row = HW_METRIC_COPY_ROW
+        n_rows = sum(len(metrics) for _, metrics in batches)
+        info_size = sum(COPY_FIELD_LENGTH.size + (0 if v is None else len(JSONB_BINARY_VERSION) + len(v))
+                        for _, metrics in batches for field in HW_SAMPLE_INFO_FIELDS
+                        for v in getattr(metrics, field)[:len(metrics)])
+        stage_size = sum(len(COPY_NULL_FIELD) if stage == STAGE_UNKNOWN else COPY_STAGE_FIELD.size
+                         for _, metrics in batches for stage in metrics.column("stage"))
+        payload = bytearray(len(COPY_BINARY_HEADER) + n_rows * (row.size + HW_METRIC_COPY_IO.size) + info_size + stage_size
+                            + len(COPY_BINARY_TRAILER))
+        payload[:len(COPY_BINARY_HEADER)] = COPY_BINARY_HEADER
+
+        n_fields = len(HW_METRIC_COLUMNS)
+        offset = len(COPY_BINARY_HEADER)
+        for cid, metrics in batches:
+            time_s, cpu, gpu, mem, power = metrics.time, metrics.cpu_util, metrics.gpu_util, metrics.mem_util, metrics.power_consumption
+            sent, rcvd, net_out, net_in = metrics.n_bytes_sent, metrics.n_bytes_rcvd, metrics.net_usage_out, metrics.net_usage_in
+            info_columns = [getattr(metrics, field) for field in HW_SAMPLE_INFO_FIELDS]
+            stages = metrics.stage
+            read, written, read_ops, write_ops, major_faults, io_wait = (getattr(metrics, field) for field in HW_SAMPLE_IO_FIELDS)
+            for i in range(len(metrics)):
+                pg_time_us = round((time_s[i] - PG_EPOCH_S) * 1_000_000)
+                row.pack_into(payload, offset, n_fields,
+                              8, pg_time_us, 4, cid, 8, cpu[i], 8, gpu[i], 8, mem[i], 8, power[i],
+                              8, sent[i], 8, rcvd[i], 8, net_out[i], 8, net_in[i])
+                offset += row.size
+                for info_column in info_columns:
+                    info = info_column[i]
+                    if info is None:
+                        payload[offset:offset + len(COPY_NULL_FIELD)] = COPY_NULL_FIELD
+                        offset += len(COPY_NULL_FIELD)
+                        continue
+                    field_len = len(JSONB_BINARY_VERSION) + len(info)
+                    COPY_FIELD_LENGTH.pack_into(payload, offset, field_len)
+                    offset += COPY_FIELD_LENGTH.size
+                    payload[offset:offset + field_len] = JSONB_BINARY_VERSION + info
+                    offset += field_len
+                if stages[i] == STAGE_UNKNOWN:
+                    payload[offset:offset + len(COPY_NULL_FIELD)] = COPY_NULL_FIELD
+                    offset += len(COPY_NULL_FIELD)
+                else:
+                    COPY_STAGE_FIELD.pack_into(payload, offset, 2, stages[i])
+                    offset += COPY_STAGE_FIELD.size
+                HW_METRIC_COPY_IO.pack_into(payload, offset, 8, read[i], 8, written[i], 8, read_ops[i], 8, write_ops[i],
+                                            8, major_faults[i], 8, io_wait[i])
+                offset += HW_METRIC_COPY_IO.size
+
+        payload[offset:] = COPY_BINARY_TRAILER
+        return payload
+
+    def insert_metrics(self, conn: psycopg.Connection, batches: List[Tuple[int, HWSampleBuffer]]) -> None:
+        formatted_metrics = [(r[0], cid, *r[1:]) for cid, metrics in batches for r in metrics.iter_rows()]
+        with conn.cursor() as cur:
+            cur.executemany(self.insert_sql, formatted_metrics)
+
+
+def write_stage_metrics(conn: psycopg.Connection, stage_metrics: List[StageMetrics]) -> None:
+    sql_query = """
+            INSERT INTO clients_in_round
+                    (client_id, round_id, start_time, end_time, loss, num_examples, accuracy,
+                     data_wait_time, compute_time, data_wait_fraction,
+                     set_params_time, get_params_time, params_bytes_in, params_bytes_out)
+            VALUES  (%(cdb_id)s, %(round_id)s, %(start_time)s,
+                     %(end_time)s, %(loss)s, %(num_examples)s, %(accuracy)s,
+                     %(data_wait_time)s, %(compute_time)s, %(data_wait_fraction)s,
+                     %(set_params_time)s, %(get_params_time)s, %(params_bytes_in)s, %(params_bytes_out)s)
+          """
+
+    formatted_metrics = [asdict(sm) for sm in stage_metrics]
+    with conn.cursor() as cur:
+        cur.executemany(sql_query, formatted_metrics)
+
+def write_training_metrics(conn: psycopg.Connection, client_db_id: int, training_records: bytes) -> None:
+    """
+        Writes packed TRAINING_RECORDs to the epochs and batches tables.
+        Records are linked to the clients_in_round row of their round, which must already be written.
+    """
+    epochs, batches = [], []
+    for kind, round_id, epoch_number, batch_number, *times, loss in TRAINING_RECORD.iter_unpack(training_records):
+        start_time, end_time, frwd_time, bkwd_time, opt_time = (
+            None if math.isnan(t) else datetime.fromtimestamp(t, timezone.utc) for t in times)
+        if kind == RECORD_EPOCH:
+            epochs.append((round_id, epoch_number, start_time, end_time))
+        elif kind == RECORD_BATCH:
+            batches.append((round_id, epoch_number, batch_number, start_time, end_time,
+                            None if math.isnan(loss) else loss, frwd_time, bkwd_time, opt_time))
+
+    # Each list is passed as an array, so a stage with many batches is written with a single statement
+    with conn.cursor() as cur:
+        if epochs:
+            cur.execute("""
+                INSERT INTO epochs (epoch_number, start_time, end_time, cir_id)
+                SELECT e.epoch_number, e.start_time, e.end_time, cir.cir_id
+                FROM unnest(%s::int[], %s::int[], %s::timestamptz[], %s::timestamptz[])
+                        AS e(round_id, epoch_number, start_time, end_time)
+                JOIN clients_in_round cir ON cir.client_id = %s AND cir.round_id = e.round_id
+            """, (*map(list, zip(*epochs)), client_db_id))
+        if batches:
+            cur.execute("""
+                INSERT INTO batches
+                        (batch_number, start_time, end_time, loss, frwd_pass_time, bkwd_pass_time, opt_step_time, epoch_id)
+                SELECT b.batch_number, b.start_time, b.end_time, b.loss,
+                       b.frwd_pass_time, b.bkwd_pass_time, b.opt_step_time, ep.epoch_id
+                FROM unnest(%s::int[], %s::int[], %s::int[], %s::timestamptz[], %s::timestamptz[], %s::float8[],
+                            %s::timestamptz[], %s::timestamptz[], %s::timestamptz[])
+                        AS b(round_id, epoch_number, batch_number, start_time, end_time, loss,
+                             frwd_pass_time, bkwd_pass_time, opt_step_time)
+                JOIN clients_in_round cir ON cir.client_id = %s AND cir.round_id = b.round_id
+                JOIN epochs ep ON ep.cir_id = cir.cir_id AND ep.epoch_number = b.epoch_number
+            """, (*map(list, zip(*batches)), client_db_id))
+
+def write_hw_windows(conn: psycopg.Connection, client_db_id: int, hw_windows: List[HWWindowMetrics]) -> None:
+    sql_query = sql.SQL(
+        "INSERT INTO device_measurement_windows ({cols}) VALUES ({placeholders})"
+    ).format(cols=sql.SQL(", ").join(map(sql.Identifier, HW_WINDOW_COLUMNS)),
+             placeholders=sql.SQL(", ").join(sql.Placeholder() * len(HW_WINDOW_COLUMNS)))
+
+    formatted_windows = [
+        (w.start_time, w.end_time, client_db_id, w.n_samples, w.energy,
+         *(w.stats[field][stat] for field in HW_GAUGE_FIELDS for stat in HW_WINDOW_STATS),
+         # Windows spooled before a counter was added lack it
+         *(w.counters.get(field) for field in HW_COUNTER_FIELDS))
+        for w in hw_windows]
+    with conn.cursor() as cur:
+        cur.executemany(sql_query, formatted_windows)
+
+def write_monitoring_telemetry(conn: psycopg.Connection, client_db_id: int, telemetry_rows: List[Tuple]) -> None:
+    sql_query = sql.SQL(
+        "INSERT INTO monitoring_telemetry ({cols}) VALUES ({placeholders})"
+    ).format(cols=sql.SQL(", ").join(map(sql.Identifier, MONITORING_TELEMETRY_COLUMNS)),
+             placeholders=sql.SQL(", ").join(sql.Placeholder() * len(MONITORING_TELEMETRY_COLUMNS)))
+
+    with conn.cursor() as cur:
+        cur.executemany(sql_query, [(client_db_id, *row) for row in telemetry_rows])
+
+def write_client_processes(conn: psycopg.Connection, client_db_id: int, process_rows: List[Tuple]) -> None:
+    sql_query = sql.SQL(
+        "INSERT INTO client_processes ({cols}) VALUES ({placeholders})"
+    ).format(cols=sql.SQL(", ").join(map(sql.Identifier, CLIENT_PROCESS_COLUMNS)),
+             placeholders=sql.SQL(", ").join(sql.Placeholder() * len(CLIENT_PROCESS_COLUMNS)))
+
+    with conn.cursor() as cur:
+        cur.executemany(sql_query, [(client_db_id, *row) for row in process_rows])
+
+def write_client_net_scope(conn: psycopg.Connection, client_db_id: int, net_scope: str) -> None:
+    with conn.cursor() as cur:
+        cur.execute("UPDATE clients SET net_scope = %s WHERE client_id = %s", (net_scope, client_db_id))
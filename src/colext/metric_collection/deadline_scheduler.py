@@ -0,0 +1,85 @@
+import time
+import threading
+from datetime import datetime, timezone
+from typing import Optional
+
+# With high_res, waits end by spinning for this long to avoid the sleep wakeup latency
+HIGH_RES_SPIN_NS = 1_000_000
+
+class AnchoredClock():
+    """
+        Wall-clock time derived from a single anchor plus monotonic offsets.
+
+        Timestamps keep the spacing measured by the monotonic clock even if the system
+        clock is stepped (e.g. by NTP) during the job.
+        The monotonic clock is system wide, so a clock created in the client process
+        can be passed to the metric manager process to timestamp on the same time base.
+    """
+    def __init__(self) -> None:
+        self.anchor_wall_ns = time.time_ns()
+        self.anchor_mono_ns = time.monotonic_ns()
+
+    def time_s(self, mono_ns: Optional[int] = None) -> float:
+        """ Seconds since the epoch at mono_ns, which defaults to now. """
+        if mono_ns is None:
+            mono_ns = time.monotonic_ns()
+        return (self.anchor_wall_ns + (mono_ns - self.anchor_mono_ns)) / 1e9
+
+    def now(self) -> datetime:
+        return datetime.fromtimestamp(self.time_s(), timezone.utc)
+
+class DeadlineScheduler():
+    """
+        Schedules ticks at absolute deadlines (start + k * interval) on the monotonic clock.
+
+        Deadlines do not depend on how long each tick took, so ticks do not drift.
+        If a tick overruns past later deadlines, those ticks are skipped and counted in
+        n_missed_ticks, and the next tick starts right away to get back on schedule.
+        With high_res, the last HIGH_RES_SPIN_NS of each wait are spent spinning,
+        trading some CPU for sub-millisecond tick accuracy.
+    """
+    def __init__(self, interval_s: float, high_res: bool = False) -> None:
+        self.interval_ns = max(round(interval_s * 1e9), 1)
+        self.high_res = high_res
+        self.start_ns = None
+        self.tick_i = 0
+        self.n_missed_ticks = 0
+
+    def start(self) -> int:
+        """ Sets tick 0 to now. Returns its time. """
+        self.start_ns = time.monotonic_ns()
+        self.tick_i = 0
+        return self.start_ns
+
+    def restart(self, interval_s: float) -> int:
+        """ Switches to interval_s and sets tick 0 to now. Returns its time. """
+        self.interval_ns = max(round(interval_s * 1e9), 1)
+        return self.start()
+
+    def advance(self) -> int:
+        """ Moves to the next tick that is not missed and returns its deadline. """
+        self.tick_i += 1
+        late_ns = time.monotonic_ns() - self.deadline_ns(self.tick_i)
+        if late_ns > self.interval_ns:
+            n_missed = late_ns // self.interval_ns
+            self.n_missed_ticks += n_missed
+            self.tick_i += n_missed
+        return self.deadline_ns(self.tick_i)
+
+    def deadline_ns(self, tick_i: int) -> int:
+        return self.start_ns + tick_i * self.interval_ns
+
+    @staticmethod
+    def time_until(deadline_ns: int) -> float:
+        return (deadline_ns - time.monotonic_ns()) / 1e9
+
+    def sleep_until(self, deadline_ns: int, stop_event: threading.Event) -> bool:
+        """ Waits for deadline_ns. Returns False if stop_event was set instead. """
+        spin_ns = HIGH_RES_SPIN_NS if self.high_res else 0
+        remaining_ns = deadline_ns - time.monotonic_ns() - spin_ns
+        if remaining_ns > 0 and stop_event.wait(remaining_ns / 1e9):
+            return False
+
+        while time.monotonic_ns() < deadline_ns:
+            pass
+        return not stop_event.is_set()
@@ -1,4 +1,21 @@
-from .flwr_client_decorator import MonitorFlwrClient
-from .flwr_server_decorator import MonitorFlwrStrategy
+import importlib
+from typing import TYPE_CHECKING
 
-__all__ = [ MonitorFlwrClient, MonitorFlwrStrategy ] 
\ No newline at end of file
+# Decorators are imported on first access (PEP 562), so clients don't import the strategy decorator
+_DECORATOR_MODULES = {
+    "MonitorFlwrClient": ".flwr_client_decorator",
+    "MonitorFlwrStrategy": ".flwr_server_decorator",
+}
+
+if TYPE_CHECKING:
+    from .flwr_client_decorator import MonitorFlwrClient
+    from .flwr_server_decorator import MonitorFlwrStrategy
+
+def __getattr__(name):
+    if name not in _DECORATOR_MODULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_DECORATOR_MODULES[name], __name__), name)
+    globals()[name] = value
+    return value
+
+__all__ = [ "MonitorFlwrClient", "MonitorFlwrStrategy" ]
@@ -1,11 +1,16 @@
 import os
+import time
 import atexit
+import threading
 import multiprocessing
-from datetime import datetime, timezone
+from typing import Optional
 
 from colext.common.logger import log
 from colext.common.utils import get_colext_env_var_or_exit
-from colext.metric_collection.metric_manager import MetricManager
+from colext.metric_collection.deadline_scheduler import AnchoredClock
+from colext.metric_collection.monitor_cpu import MONITOR_THREAD_PREFIX
+from colext.metric_collection.stage_ring import StageMetricRing, STAGE_FIT, STAGE_EVAL
+from colext.metric_collection.training_monitor import TrainingMetricRing, TrainingRecorder, set_recorder
 from colext.metric_collection.typing import StageMetrics
 
 # Class inheritence inside a decorator was inspired by:
@@ -23,14 +28,32 @@ def MonitorFlwrClient(FlwrClientClass):
         def __init__(self, *args, **kwargs):
             log.debug("init function")
 
-            self.client_db_id = get_colext_env_var_or_exit("COLEXT_CLIENT_DB_ID")
+            self.client_db_id = int(get_colext_env_var_or_exit("COLEXT_CLIENT_DB_ID"))
             self.client_id = int(get_colext_env_var_or_exit("COLEXT_CLIENT_ID"))
 
-            self.mm_proc_stop_event = multiprocessing.Event()
-            mm_proc_ready_event = multiprocessing.Event()
-            self.stage_timings_queue = multiprocessing.Queue()
-            self.mm_proc = multiprocessing.Process(
-                target=MetricManager_as_bg_process, args=(self.mm_proc_stop_event, mm_proc_ready_event, self.stage_timings_queue), daemon=True)
+            # process: runs the metric manager in a child process. thread: runs it as threads of this process,
+            # which saves the startup time and memory of a second interpreter
+            monitor_mode = get_colext_env_var_or_exit("COLEXT_MONITORING_MODE")
+            in_process = monitor_mode == "thread"
+            self.mm_proc_stop_event = threading.Event() if in_process else multiprocessing.Event()
+            mm_proc_ready_event = threading.Event() if in_process else multiprocessing.Event()
+            self.stage_ring = StageMetricRing()
+            self.training_ring = TrainingMetricRing(self.stage_ring)
+            # Stage timings and HW samples are timestamped from the same anchor
+            self.clock = AnchoredClock()
+            # Epochs and batches are recorded by the training loop through the training_monitor functions
+            batch_sampling = int(get_colext_env_var_or_exit("COLEXT_MONITORING_BATCH_SAMPLING"))
+            self.training_recorder = TrainingRecorder(self.training_ring, self.clock, batch_sampling)
+            set_recorder(self.training_recorder)
+            # Time spent in set_parameters and get_parameters since the start of the stage
+            self.set_params_time = 0.0
+            self.get_params_time = 0.0
+            mm_args = (self.mm_proc_stop_event, mm_proc_ready_event, self.stage_ring, self.training_ring, self.clock)
+            if in_process:
+                self.mm_proc = threading.Thread(target=MetricManager_as_thread, args=mm_args,
+                                                name=f"{MONITOR_THREAD_PREFIX}metric-manager", daemon=True)
+            else:
+                self.mm_proc = multiprocessing.Process(target=MetricManager_as_bg_process, args=mm_args, daemon=True)
             self.mm_proc.start()
             # Wait for metric manager to finish startup
             mm_proc_ready_event.wait()
@@ -44,10 +67,19 @@ def MonitorFlwrClient(FlwrClientClass):
         def clean_up(self):
             log.debug("Stopping metric manager")
             self.mm_proc_stop_event.set()
+            # Wake up the metric manager so it notices the stop event right away
+            self.stage_ring.notify()
             log.info("Waiting for metric manager to finish. Max 15sec.")
             self.mm_proc.join(timeout=15)
+            if isinstance(self.mm_proc, threading.Thread):
+                # The thread shares the rings and frees them when it finishes
+                if self.mm_proc.is_alive():
+                    log.error("Metric manager thread is still alive... Ignoring it")
+                return
             if self.mm_proc.exitcode != 0:
                 log.error("Process terminated with non zero exitcode!")
+            self.stage_ring.unlink()
+            self.training_ring.unlink()
             log.debug("Metric manager stopped")
 
         # ====== Flower functions ======
@@ -57,16 +89,24 @@ def MonitorFlwrClient(FlwrClientClass):
             log.debug("fit function")
             round_id = config["COLEXT_ROUND_ID"]
 
-            start_fit_time = datetime.now(timezone.utc)
+            start_fit_time = self.clock.now()
+            self.stage_ring.put_stage_start(STAGE_FIT, self.client_db_id, round_id, start_fit_time)
+            self.training_recorder.start_stage(round_id)
+            self.set_params_time = self.get_params_time = 0.0
             fit_result = super().fit(parameters, config)
-            end_fit_time = datetime.now(timezone.utc)
+            end_fit_time = self.clock.now()
+            # Epoch and batch records must be in the training ring before the stage end
+            self.training_recorder.end_stage()
 
             num_examples = fit_result[1]
             loss = fit_result[2].get("loss")
             acc = fit_result[2].get("accuracy")
             st = StageMetrics(self.client_db_id, round_id,
-                              start_fit_time, end_fit_time, loss, num_examples, acc)
-            self.stage_timings_queue.put(st)
+                              start_fit_time, end_fit_time, loss, num_examples, acc,
+                              *self.training_recorder.input_pipeline_times(),
+                              self.set_params_time, self.get_params_time,
+                              parameters_nbytes(parameters), parameters_nbytes(fit_result[0]))
+            self.stage_ring.put_stage_end(STAGE_FIT, st)
 
             return fit_result
 
@@ -76,16 +116,24 @@ def MonitorFlwrClient(FlwrClientClass):
             log.debug("evaluate function")
             round_id = config["COLEXT_ROUND_ID"]
 
-            start_eval_time = datetime.now(timezone.utc)
+            start_eval_time = self.clock.now()
+            self.stage_ring.put_stage_start(STAGE_EVAL, self.client_db_id, round_id, start_eval_time)
+            self.training_recorder.start_stage(round_id)
+            self.set_params_time = self.get_params_time = 0.0
             eval_result = super().evaluate(parameters, config)
-            end_eval_time = datetime.now(timezone.utc)
+            end_eval_time = self.clock.now()
+            self.training_recorder.end_stage()
 
             loss = eval_result[0]
             num_examples = eval_result[1]
             acc = eval_result[2].get("accuracy")
+            # evaluate does not return parameters
             st = StageMetrics(self.client_db_id, round_id,
-                              start_eval_time, end_eval_time, loss, num_examples, acc)
-            self.stage_timings_queue.put(st)
+                              start_eval_time, end_eval_time, loss, num_examples, acc,
+                              *self.training_recorder.input_pipeline_times(),
+                              self.set_params_time, self.get_params_time,
+                              parameters_nbytes(parameters), None)
+            self.stage_ring.put_stage_end(STAGE_EVAL, st)
 
             return eval_result
 
@@ -93,21 +141,47 @@ def MonitorFlwrClient(FlwrClientClass):
         #     log.debug("get_properties function")
         #     return super().get_properties(config)
 
-        # get/set_parameters are not functions called by flower directly
-        # but they're still pretty standard and we could benefit from having them here
-        # def get_parameters(self, *args, **kwargs):
-        #     log.debug("get_parameters function")
-        #     return super().get_parameters(config)
-        # def set_parameters(self, *args, **kwargs):
-        #     log.debug("set_parameters function")
-        #     super().set_parameters(*args, **kwargs)
+        # get_parameters is called by flower, set_parameters is a common convention of user clients.
+        # Both convert the model from/to NumPy arrays, which is timed per stage
+        if hasattr(FlwrClientClass, "get_parameters"):
+            def get_parameters(self, *args, **kwargs):
+                start_time = time.perf_counter()
+                parameters = super().get_parameters(*args, **kwargs)
+                self.get_params_time += time.perf_counter() - start_time
+                return parameters
+
+        if hasattr(FlwrClientClass, "set_parameters"):
+            def set_parameters(self, *args, **kwargs):
+                start_time = time.perf_counter()
+                result = super().set_parameters(*args, **kwargs)
+                self.set_params_time += time.perf_counter() - start_time
+                return result
 
     return _MonitorFlwrClient
 
 
+def parameters_nbytes(parameters) -> Optional[int]:
+    """ Size of a list of NumPy arrays from ndarray.nbytes, without copying them. None if they're not arrays. """
+    try:
+        return sum(array.nbytes for array in parameters)
+    except (TypeError, AttributeError):
+        return None
+
 def MetricManager_as_bg_process(*args, **kwargs):
+    # Imported when monitoring starts, so importing the decorator does not import psycopg and the scrapers
+    from colext.metric_collection.metric_manager import MetricManager
     mm = MetricManager(*args, **kwargs)
 
     # runs until finish_event is set
     mm.start_metric_gathering()
     mm.stop_metric_gathering()
+
+def MetricManager_as_thread(stop_event, ready_event, stage_ring: StageMetricRing, training_ring: TrainingMetricRing,
+                            clock: AnchoredClock):
+    # The client only waits 15s for the metric manager. A thread can outlive clean_up,
+    # so it frees the rings it shares with the client once it stopped using them
+    try:
+        MetricManager_as_bg_process(stop_event, ready_event, stage_ring, training_ring, clock)
+    finally:
+        stage_ring.unlink()
+        training_ring.unlink()
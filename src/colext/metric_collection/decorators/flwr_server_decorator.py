@@ -1,11 +1,14 @@
+from __future__ import annotations
 from datetime import datetime, timezone
 import os
-import psycopg
-from psycopg import sql
-from typing import List, Tuple, Union, Optional, Dict
-from flwr.common import (FitIns, Parameters, FitRes, Scalar, EvaluateIns, EvaluateRes)
-from flwr.server.client_manager import ClientManager
-from flwr.server.client_proxy import ClientProxy
+from typing import TYPE_CHECKING, List, Tuple, Union, Optional, Dict
+
+# Flower types are only used in annotations. psycopg is imported by the decorated strategy,
+# so importing the decorator outside of the CoLExT environment stays cheap
+if TYPE_CHECKING:
+    from flwr.common import (FitIns, Parameters, FitRes, Scalar, EvaluateIns, EvaluateRes)
+    from flwr.server.client_manager import ClientManager
+    from flwr.server.client_proxy import ClientProxy
 
 from colext.common.logger import log
 from colext.common.utils import get_colext_env_var_or_exit
@@ -33,6 +36,7 @@ def MonitorFlwrStrategy(FlwrStrategy):
             self.current_round_id = None
 
         def create_db_connection(self):
+            import psycopg
             # DB parameters are read from env variables
             return psycopg.connect()
 
@@ -76,6 +80,7 @@ def MonitorFlwrStrategy(FlwrStrategy):
             cursor.close()
 
         def record_server_round_metric(self, metric, value):
+            from psycopg import sql
             cursor = self.DB_CONNECTION.cursor()
 
             query = sql.SQL("""
@@ -0,0 +1,113 @@
+import math
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from colext.metric_collection.sample_buffer import HW_SAMPLE_IO_FIELDS, HWSampleBuffer, none_if_nan
+from colext.metric_collection.typing import HWWindowMetrics
+
+# Fields summarized with min/mean/max/last
+HW_GAUGE_FIELDS = ("cpu_util", "gpu_util", "mem_util", "power_consumption", "net_usage_out", "net_usage_in")
+# Cumulative fields, only the last value is kept
+HW_COUNTER_FIELDS = ("n_bytes_sent", "n_bytes_rcvd", *HW_SAMPLE_IO_FIELDS)
+HW_WINDOW_STATS = ("min", "mean", "max", "last")
+
+class HWWindowAggregator():
+    """
+        Folds HW samples into fixed windows aligned to multiples of window_s.
+
+        Means are weighted by the time since the previous sample, the same rule
+        metric_retriever uses to integrate power. The window energy is accumulated
+        with that rule as well, so summing window energies gives the same result
+        as integrating the raw samples.
+        A window is emitted once a sample from a later window arrives or on flush.
+    """
+    def __init__(self, window_s: float) -> None:
+        self.window_s = window_s
+        self.window_i = None
+        self.prev_time = None
+        self.start_window(None)
+
+    def start_window(self, start_time: Optional[float]) -> None:
+        self.start_time = start_time
+        self.end_time = start_time
+        self.n_samples = 0
+        self.energy = 0.0
+        self.mins = dict.fromkeys(HW_GAUGE_FIELDS, math.inf)
+        self.maxs = dict.fromkeys(HW_GAUGE_FIELDS, -math.inf)
+        self.lasts = dict.fromkeys(HW_GAUGE_FIELDS, math.nan)
+        self.weighted_sums = dict.fromkeys(HW_GAUGE_FIELDS, 0.0)
+        self.weights = dict.fromkeys(HW_GAUGE_FIELDS, 0.0)
+        self.counters = dict.fromkeys(HW_COUNTER_FIELDS, 0)
+
+    def add(self, samples: HWSampleBuffer) -> List[HWWindowMetrics]:
+        """ Folds samples into the open window. Returns the windows closed by these samples. """
+        closed_windows = []
+        columns = {field: samples.column(field) for field in HW_GAUGE_FIELDS + HW_COUNTER_FIELDS}
+        times = samples.column("time")
+        for i in range(len(samples)):
+            t = times[i]
+            window_i = math.floor(t / self.window_s)
+            if self.window_i is None:
+                self.window_i = window_i
+                self.start_window(t)
+            elif window_i != self.window_i:
+                closed_windows.append(self.close_window())
+                self.window_i = window_i
+                # Integration continues from the last sample of the previous window
+                self.start_window(self.prev_time)
+
+            dt = 0.0 if self.prev_time is None else t - self.prev_time
+            for field in HW_GAUGE_FIELDS:
+                value = columns[field][i]
+                if math.isnan(value):
+                    continue
+                self.mins[field] = min(self.mins[field], value)
+                self.maxs[field] = max(self.maxs[field], value)
+                self.lasts[field] = value
+                self.weighted_sums[field] += value * dt
+                self.weights[field] += dt
+            for field in HW_COUNTER_FIELDS:
+                self.counters[field] = columns[field][i]
+
+            power = columns["power_consumption"][i]
+            if not math.isnan(power):
+                self.energy += power * dt
+
+            self.n_samples += 1
+            self.end_time = t
+            self.prev_time = t
+
+        return closed_windows
+
+    def flush(self) -> List[HWWindowMetrics]:
+        """ Closes the open window, if it has samples. """
+        if self.n_samples == 0:
+            return []
+
+        window = self.close_window()
+        self.window_i = None
+        self.start_window(None)
+        return [window]
+
+    def close_window(self) -> HWWindowMetrics:
+        stats = {}
+        for field in HW_GAUGE_FIELDS:
+            last = self.lasts[field]
+            if math.isnan(last):
+                stats[field] = dict.fromkeys(HW_WINDOW_STATS, None)
+                continue
+
+            # A window holding only the first sample has no elapsed time to weigh by
+            mean = self.weighted_sums[field] / self.weights[field] if self.weights[field] > 0 else last
+            stats[field] = {"min": self.mins[field], "mean": mean, "max": self.maxs[field], "last": last}
+
+        start_time = datetime.fromtimestamp(self.start_time, timezone.utc)
+        end_time = datetime.fromtimestamp(self.end_time, timezone.utc)
+        # Keep mean power consistent with the window energy over the stored timestamps
+        duration = (end_time - start_time).total_seconds()
+        if duration > 0 and stats["power_consumption"]["mean"] is not None:
+            stats["power_consumption"]["mean"] = self.energy / duration
+
+        counters = {field: none_if_nan(value) for field, value in self.counters.items()}
+        return HWWindowMetrics(start_time, end_time, self.n_samples, none_if_nan(self.energy),
+                               stats, counters)
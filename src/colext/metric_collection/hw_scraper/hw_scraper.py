@@ -1,26 +1,72 @@
-import os
 import time
-import queue
 import threading
+from typing import List, Optional, Tuple
 
 from colext.common.logger import log
 from colext.common.utils import get_colext_env_var_or_exit
-from .scrapers.general_scraper import GeneralScrapper
-from .scrapers.scraper_base import ProcessMetrics, ScraperBase
+from colext.metric_collection.deadline_scheduler import AnchoredClock, DeadlineScheduler
+from colext.metric_collection.monitor_cpu import MONITOR_THREAD_PREFIX, MonitorCPUMeter
+from colext.metric_collection.sample_buffer import HWSampleBuffer
+from colext.metric_collection.self_telemetry import (
+    MonitoringTelemetry, MISSED_SCRAPES, SCRAPE_INTERVAL, SCRAPE_JITTER, SCRAPE_TOTAL_COST)
+from colext.metric_collection.stage_ring import STAGE_EVAL, STAGE_FIT, STAGE_IDLE, STAGE_NAMES
+from .scrapers.scraper_base import ProcessMetrics
+from .scrapers.scraper_registry import create_scraper
 
 class HWScraper():
-    def __init__(self, pid: int, metric_queue: queue.Queue) -> None:
-        self.collection_interval_s = float(get_colext_env_var_or_exit("COLEXT_MONITORING_SCRAPE_INTERVAL"))
-        log.info(f"Metric collection interval: {self.collection_interval_s}")
-        self.metric_queue = metric_queue
+    """
+        Scrapes HW metrics from a background thread at the scraping interval of the current client stage.
+
+        The metric manager reports stage changes with set_stage. They wake up the scraping loop,
+        which scrapes right away and restarts its schedule at the interval of the new stage.
+        Each sample is tagged with the stage it was scraped in.
+
+        When the metric manager runs in the client process, monitor_cpu measures the monitoring threads.
+        Their CPU is removed from the scraped cpu_util, or is the only CPU reported if measure_self is set.
+    """
+    def __init__(self, pid: int, buffer_capacity: int = 64, telemetry: MonitoringTelemetry = None,
+                 clock: AnchoredClock = None, monitor_cpu: Optional[MonitorCPUMeter] = None,
+                 measure_self: bool = False) -> None:
+        base_interval_s = float(get_colext_env_var_or_exit("COLEXT_MONITORING_SCRAPE_INTERVAL"))
+        # Stage intervals set to 0 use the base interval
+        self.stage_intervals = {}
+        for stage, env_var in ((STAGE_IDLE, "COLEXT_MONITORING_SCRAPE_INTERVAL_IDLE"),
+                               (STAGE_FIT, "COLEXT_MONITORING_SCRAPE_INTERVAL_FIT"),
+                               (STAGE_EVAL, "COLEXT_MONITORING_SCRAPE_INTERVAL_EVAL")):
+            stage_interval_s = float(get_colext_env_var_or_exit(env_var))
+            self.stage_intervals[stage] = stage_interval_s if stage_interval_s > 0 else base_interval_s
+        # Shortest interval. Scrapers and buffers are sized for it
+        self.collection_interval_s = min(self.stage_intervals.values())
+        high_res_sampling = get_colext_env_var_or_exit("COLEXT_MONITORING_HIGH_RES_SAMPLING") == "True"
+        log.info("Metric collection intervals: %s. High resolution: %s",
+                 {STAGE_NAMES[stage]: interval_s for stage, interval_s in self.stage_intervals.items()}, high_res_sampling)
         self.pid = pid
+        self.telemetry = telemetry if telemetry is not None else MonitoringTelemetry()
+        # Sample timestamps are derived from clock instead of reading the wall clock on every scrape
+        self.clock = clock if clock is not None else AnchoredClock()
+        self.monitor_cpu = monitor_cpu
+        self.measure_self = measure_self
+        self.monitor_cpu_excess = 0.0
+        # Clients start idle
+        self.stage = STAGE_IDLE
+        self.scheduler = DeadlineScheduler(self.stage_intervals[self.stage], high_res_sampling)
+
+        # Scraped metrics are appended to sample_buffer until it's swapped out by the metric manager
+        self.sample_buffer = HWSampleBuffer(buffer_capacity)
+        self.sample_buffer_lock = threading.Lock()
 
-        scraperAgent = HWScraper.get_scrapper_agent_for_device()
-        self.scrapper = scraperAgent(self.pid, self.collection_interval_s)
+        # Base scraper and components, see scraper_registry
+        scraper_spec = get_colext_env_var_or_exit("COLEXT_MONITORING_SCRAPER")
+        dev_type = get_colext_env_var_or_exit("COLEXT_DEVICE_TYPE")
+        self.scrapper = create_scraper(scraper_spec, dev_type, self.pid, self.collection_interval_s,
+                                       self.telemetry, self.clock)
 
         self.finish_event = threading.Event()
-        # scraping_loop_th is interrupted using the finish_event
-        self.scraping_loop_th = threading.Thread(target=self.scraping_loop, daemon=True)
+        # Interrupts the wait for the next scrape on stage changes and when scraping stops
+        self.wake_event = threading.Event()
+        # scraping_loop_th is interrupted using the finish_event and wake_event
+        self.scraping_loop_th = threading.Thread(target=self.scraping_loop, name=f"{MONITOR_THREAD_PREFIX}hw-scraper",
+                                                 daemon=True)
 
     def start_scraping(self) -> None:
         self.scraping_loop_th.start()
@@ -28,39 +74,81 @@ class HWScraper():
     def stop_scraping(self) -> None:
         log.info("Stopping HW scraping.")
         self.finish_event.set()
+        self.wake_event.set()
         log.info("Waiting for scraper loop thread. Max 15sec.")
         self.scraping_loop_th.join(timeout=15)
         if self.scraping_loop_th.is_alive():
             log.error("Thread is still alive... Ignoring it")
+        self.scrapper.close()
+        self.telemetry.increment(MISSED_SCRAPES, self.scheduler.n_missed_ticks)
         log.info("HW scraping stopped")
 
-    def record_metric(self, metric: ProcessMetrics) -> None:
-        self.metric_queue.put(metric)
+    def process_summary_rows(self) -> List[Tuple]:
+        """ Per process summaries when the process tree is measured. Read after stop_scraping. """
+        return self.scrapper.process_summary_rows()
+
+    def net_scope(self) -> str:
+        """ Effective scope of the network counters. """
+        return self.scrapper.net_scope()
+
+    def set_stage(self, stage: int) -> None:
+        """ Switches to the scraping interval of stage. Called by the metric manager when the client stage changes. """
+        if stage == self.stage:
+            return
+        self.stage = stage
+        self.wake_event.set()
+
+    def record_metric(self, metric: ProcessMetrics, stage: int) -> None:
+        with self.sample_buffer_lock:
+            self.sample_buffer.append_metric(metric, stage)
+
+    def swap_buffer(self, empty_buffer: HWSampleBuffer) -> HWSampleBuffer:
+        """ Replaces the current sample buffer with empty_buffer and returns the filled one. """
+        with self.sample_buffer_lock:
+            filled_buffer = self.sample_buffer
+            self.sample_buffer = empty_buffer
+        return filled_buffer
 
     def scraping_loop(self) -> None:
+        deadline_ns = self.scheduler.start()
+        prev_start_ns = None
         while self.finish_event.is_set() is False:
-            start_m_time = time.time()
+            start_ns = time.monotonic_ns()
+            stage = self.stage
             p_metrics = self.scrapper.scrape_process_metrics()
-            self.record_metric(p_metrics)
-            stop_m_time = time.time()
-
-            remaining_time = self.collection_interval_s - (stop_m_time - start_m_time)
-            remaining_time = max(remaining_time, 0)
+            if self.monitor_cpu is not None:
+                self.separate_monitor_cpu(p_metrics)
+            self.record_metric(p_metrics, stage)
+            stop_ns = time.monotonic_ns()
 
-            time.sleep(remaining_time)
-
-    @staticmethod
-    def get_scrapper_agent_for_device() -> ScraperBase:
-        dev_type = get_colext_env_var_or_exit("COLEXT_DEVICE_TYPE")
+            self.record_scrape_telemetry(deadline_ns, prev_start_ns, start_ns, stop_ns)
+            prev_start_ns = start_ns
 
-        scrapper_class = GeneralScrapper # Default
+            deadline_ns = self.scheduler.advance()
+            if not self.scheduler.sleep_until(deadline_ns, self.wake_event) and not self.finish_event.is_set():
+                # Stage changed. Cleared before reading the stage so later changes wake up the loop again
+                self.wake_event.clear()
+                deadline_ns = self.scheduler.restart(self.stage_intervals[self.stage])
 
-        if "Jetson" in dev_type:
-            from .scrapers.jetson_scraper import JetsonScraper
-            scrapper_class = JetsonScraper
+    def separate_monitor_cpu(self, p_metrics: ProcessMetrics) -> None:
+        # Measured right after the scrape, so both utilizations cover about the same interval
+        monitor_cpu_util = self.monitor_cpu.cpu_util()
+        if self.measure_self:
+            p_metrics.cpu_util = round(monitor_cpu_util, 1)
+        elif p_metrics.cpu_util is not None:
+            # Process CPU is counted in clock ticks and can be below the monitor CPU of the same interval.
+            # The excess is removed from the next samples instead of clamping, which would bias cpu_util up
+            client_cpu_util = p_metrics.cpu_util - monitor_cpu_util - self.monitor_cpu_excess
+            self.monitor_cpu_excess = max(-client_cpu_util, 0.0)
+            p_metrics.cpu_util = round(max(client_cpu_util, 0.0), 1)
 
-        return scrapper_class
+    def record_scrape_telemetry(self, deadline_ns: int, prev_start_ns, start_ns: int, stop_ns: int) -> None:
+        scrape_duration = (stop_ns - start_ns) / 1e9
+        self.telemetry.record_duration(SCRAPE_TOTAL_COST, scrape_duration)
+        if scrape_duration * 1e9 > self.scheduler.interval_ns:
+            log.warning(f"scrape_process_metrics time exceeded colection interval = {scrape_duration}")
 
-    @staticmethod
-    def has_smart_plug() -> bool:
-        return os.getenv("SP_IP_ADDRESS") is not None
+        # Delay between the scheduled and actual scrape start
+        self.telemetry.record_duration(SCRAPE_JITTER, (start_ns - deadline_ns) / 1e9)
+        if prev_start_ns is not None:
+            self.telemetry.record_duration(SCRAPE_INTERVAL, (start_ns - prev_start_ns) / 1e9)
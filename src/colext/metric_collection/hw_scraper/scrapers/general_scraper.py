@@ -1,70 +1,146 @@
-from datetime import datetime, timezone
-from concurrent.futures import ThreadPoolExecutor
+import os
 import time
-import psutil
+from typing import List, Optional, Tuple
 
 from colext.common.logger import log
-from .smart_plug import SmartPlug
+from colext.common.utils import get_colext_env_var_or_exit
+from colext.metric_collection.deadline_scheduler import AnchoredClock
+from colext.metric_collection.monitor_sockets import MONITOR_SOCKET_INODES
+from colext.metric_collection.self_telemetry import (
+    MonitoringTelemetry, PROCESS_TREE_SIZE, SCRAPE_PROCESS_TREE_COST, SCRAPE_PROCFS_COST, SCRAPE_PSUTIL_COST,
+    SCRAPE_THERMAL_COST)
+from .io_counters import create_io_counters
+from .net_counters import create_net_counters
+from .proc_readers import ProcfsReader, create_proc_reader
+from .process_tree import ProcessTree
+from .thermal_reader import ThermalReader
 from .scraper_base import ScraperBase, ProcessMetrics
 
 
 class GeneralScrapper(ScraperBase):
     """
-        Base scraper using psutil.
-        This scraper tries to collect power consumption using smart plugs.
-        It does not capture GPU utilization
+        Base scraper using psutil, or reading /proc directly with the procfs scrape backend.
+        With process_tree, CPU and memory cover the process and all its descendants.
+        Their summed PSS and per process values are added to cpu_info["process_tree"].
+        Network bytes are counted over net_scope, see net_counters. The process scope also covers the process tree.
+        Disk I/O covers the same processes as CPU and memory, see io_counters.
+        Every thermal_interval, clock frequencies, temperatures and throttling state are added
+        to cpu_info/gpu_info, see ThermalReader.
+        It does not capture power consumption nor GPU utilization.
+        Other sources are added with scraper components, see scraper_registry.
     """
-    def __init__(self, pid:int , collection_interval_s: float):
-        super().__init__(pid, collection_interval_s)
-        self.proc = psutil.Process(pid)
+    def __init__(self, pid:int , collection_interval_s: float, telemetry: MonitoringTelemetry, clock: AnchoredClock):
+        super().__init__(pid, collection_interval_s, telemetry, clock)
+        backend = get_colext_env_var_or_exit("COLEXT_MONITORING_SCRAPE_BACKEND")
+        self.proc_reader = create_proc_reader(backend, pid)
+        if isinstance(self.proc_reader, ProcfsReader):
+            self.scrape_cost_metric = SCRAPE_PROCFS_COST
+        else:
+            self.scrape_cost_metric = SCRAPE_PSUTIL_COST
+        log.info(f"Scrape backend: {type(self.proc_reader).__name__}")
+
+        self.process_tree = None
+        if get_colext_env_var_or_exit("COLEXT_MONITORING_PROCESS_TREE") == "True":
+            # The metric manager is a child of the client. Its cost is not part of the client's
+            exclude_pids = {os.getpid()} if pid != os.getpid() else set()
+            self.process_tree = ProcessTree(pid, exclude_pids)
+            self.scrape_cost_metric = SCRAPE_PROCESS_TREE_COST
+            log.info("Measuring the process tree of %s", pid)
 
-        self.prev_net_stat = psutil.net_io_counters(nowrap=True)
+        self.io_counters = create_io_counters(pid, self.process_tree)
+
+        net_scope = get_colext_env_var_or_exit("COLEXT_MONITORING_NET_SCOPE")
+        # In thread mode the client process also holds the sockets of the monitoring.
+        # They're left out, or are the only ones counted when measuring the monitoring itself
+        monitor_inodes = None
+        if get_colext_env_var_or_exit("COLEXT_MONITORING_MODE") == "thread":
+            monitor_inodes = MONITOR_SOCKET_INODES
+        measure_self = get_colext_env_var_or_exit("COLEXT_MONITORING_MEASURE_SELF") == "True"
+        self.net_counters = create_net_counters(net_scope, pid, self.proc_reader, monitor_inodes, measure_self,
+                                                self.process_tree)
+        log.info(f"Network scope: {self.net_counters.scope}")
+        self.prev_net_stat = self.net_counters.read_net()
         self.total_bytes_sent = 0
         self.total_bytes_recv = 0
-        self.last_scrape_time = datetime.now(timezone.utc)
+        self.last_scrape_ns = time.monotonic_ns()
 
-        try:
-            self.smart_plug = SmartPlug()
-        except EnvironmentError as e:
-            log.warning(e)
-            self.smart_plug = None
+        # Thermal state changes slowly and is read at its own, lower rate
+        self.thermal_reader: Optional[ThermalReader] = None
+        thermal_interval_s = float(get_colext_env_var_or_exit("COLEXT_MONITORING_THERMAL_INTERVAL"))
+        if thermal_interval_s > 0:
+            self.thermal_reader = ThermalReader()
+            if self.thermal_reader.is_empty():
+                log.info("No clock frequencies or thermal zones found in sysfs")
+            self.thermal_interval_ns = round(thermal_interval_s * 1e9)
+            self.next_thermal_ns = time.monotonic_ns()
 
     def scrape_process_metrics(self) -> ProcessMetrics:
-        start_scrape_time = time.time()
-        if self.smart_plug:
-             # Use a ThreadPoolExecutor to run _scrape_psutils and get power concurrently
-            with ThreadPoolExecutor() as executor:
-                psutils_future = executor.submit(self._scrape_psutils)
-                get_power_future = executor.submit(self.smart_plug.get_power_consumption)
-
-                # Wait for both tasks to complete
-                p_metrics = psutils_future.result()
-                p_metrics.power_consumption = get_power_future.result()
-        else:
-            p_metrics = self._scrape_psutils()
+        p_metrics = self._timed_scrape_proc()
+        if self.thermal_reader is not None and time.monotonic_ns() >= self.next_thermal_ns:
+            self.add_thermal_info(p_metrics)
+
+        return p_metrics
+
+    def add_thermal_info(self, p_metrics: ProcessMetrics) -> None:
+        start_time = time.perf_counter()
+        cpu_info, gpu_info = self.read_thermal_info()
+        p_metrics.cpu_info = {**(p_metrics.cpu_info or {}), **cpu_info}
+        if gpu_info:
+            p_metrics.gpu_info = {**(p_metrics.gpu_info or {}), **gpu_info}
+        self.telemetry.record_duration(SCRAPE_THERMAL_COST, time.perf_counter() - start_time)
 
-        end_scrape_time = time.time()
-        scrape_duration = end_scrape_time - start_scrape_time
-        if scrape_duration > self.collection_interval_s:
-            log.warning(f"scrape_process_metrics time exceeded colection interval = {scrape_duration}")
+        # At most one reading per scrape if the thermal interval is shorter than the scraping interval
+        self.next_thermal_ns = max(self.next_thermal_ns + self.thermal_interval_ns, time.monotonic_ns())
 
+    def read_thermal_info(self) -> Tuple[dict, dict]:
+        """ (cpu_info, gpu_info) thermal details. Scrapers with other sources of them can extend it. """
+        return self.thermal_reader.read()
+
+    def close(self) -> None:
+        self.net_counters.close()
+        self.proc_reader.close()
+        if self.io_counters is not None:
+            self.io_counters.close()
+        if self.thermal_reader is not None:
+            self.thermal_reader.close()
+
+    def net_scope(self) -> str:
+        return self.net_counters.scope
+
+    def process_summary_rows(self) -> List[Tuple]:
+        if self.process_tree is None:
+            return []
+        return self.process_tree.summary_rows()
+
+    def _timed_scrape_proc(self) -> ProcessMetrics:
+        start_time = time.perf_counter()
+        p_metrics = self._scrape_proc()
+        self.telemetry.record_duration(self.scrape_cost_metric, time.perf_counter() - start_time)
         return p_metrics
 
-    def _scrape_psutils(self) -> ProcessMetrics:
-        with self.proc.oneshot():
-            cpu_util = self.proc.cpu_percent()
-            mem_util = self.proc.memory_full_info().rss
 
-        current_net_stat = psutil.net_io_counters(nowrap=True)
-        n_bytes_sent = current_net_stat.bytes_sent - self.prev_net_stat.bytes_sent
-        n_bytes_rcvd = current_net_stat.bytes_recv - self.prev_net_stat.bytes_recv
+    def _scrape_proc(self) -> ProcessMetrics:
+        cpu_info = None
+        if self.process_tree is not None:
+            # mem_util stays the RSS, as without the tree. The summed PSS, which does not count the pages
+            # shared between forked processes more than once, and the per process values go in cpu_info
+            cpu_util, mem_util, total_pss = self.process_tree.scrape(self.clock.time_s())
+            cpu_info = {"process_tree": self.process_tree.last_scrape_info(total_pss)}
+            self.telemetry.record_size(PROCESS_TREE_SIZE, len(self.process_tree))
+        else:
+            cpu_util, mem_util = self.proc_reader.read_process()
+
+        current_net_stat = self.net_counters.read_net()
+        n_bytes_sent = current_net_stat[0] - self.prev_net_stat[0]
+        n_bytes_rcvd = current_net_stat[1] - self.prev_net_stat[1]
         self.total_bytes_sent += n_bytes_sent
         self.total_bytes_recv += n_bytes_rcvd
         self.prev_net_stat = current_net_stat
 
-        current_time = datetime.now(timezone.utc)
-        time_between_scrapes = (current_time - self.last_scrape_time).total_seconds()
-        self.last_scrape_time = current_time
+        current_ns = time.monotonic_ns()
+        time_between_scrapes = (current_ns - self.last_scrape_ns) / 1e9
+        self.last_scrape_ns = current_ns
+        current_time = self.clock.time_s(current_ns)
 
         net_usage_out = round(n_bytes_sent / time_between_scrapes, 5) # B/s
         net_usage_in  = round(n_bytes_rcvd / time_between_scrapes, 5) # B/s
@@ -73,5 +149,8 @@ class GeneralScrapper(ScraperBase):
         gpu_util = 0
         p_metrics = ProcessMetrics(
                         current_time, cpu_util, gpu_util, mem_util, power_consumption,
-                        self.total_bytes_sent, self.total_bytes_recv, net_usage_out, net_usage_in)
+                        self.total_bytes_sent, self.total_bytes_recv, net_usage_out, net_usage_in, cpu_info)
+        if self.io_counters is not None:
+            (p_metrics.n_bytes_read, p_metrics.n_bytes_written, p_metrics.n_read_ops, p_metrics.n_write_ops,
+             p_metrics.n_major_faults, p_metrics.io_wait_time) = self.io_counters.read_io()
         return p_metrics
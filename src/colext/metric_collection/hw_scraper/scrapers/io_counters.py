@@ -0,0 +1,155 @@
+import os
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+
+from colext.common.logger import log
+from .proc_readers import pread_all
+
+# Values returned by read_io, cumulative since the first reading
+IO_COUNTER_FIELDS = ("n_bytes_read", "n_bytes_written", "n_read_ops", "n_write_ops", "n_major_faults", "io_wait_time")
+# /proc/<pid>/io: "rchar: N\nwchar: N\nsyscr: N\nsyscw: N\nread_bytes: N\nwrite_bytes: N\ncancelled_write_bytes: N"
+# Positions of the values once split on whitespace
+PROC_IO_SYSCR = 5
+PROC_IO_SYSCW = 7
+PROC_IO_READ_BYTES = 9
+PROC_IO_WRITE_BYTES = 11
+# /proc/<pid>/stat fields counted after the closing parenthesis of the process name
+PROC_STAT_MAJFLT = 9
+PROC_STAT_CMAJFLT = 10
+PROC_STAT_BLKIO_TICKS = 39 # delayacct_blkio_ticks
+TASK_DELAYACCT_PATH = "/proc/sys/kernel/task_delayacct"
+
+def delayacct_enabled() -> bool:
+    """ Block I/O wait is only accounted with delay accounting. Linux 5.14+ disables it by default. """
+    try:
+        with open(TASK_DELAYACCT_PATH, "rb") as f:
+            return f.read().strip() != b"0"
+    except OSError:
+        # Older kernels have no switch and account delays unless booted with nodelayacct
+        return True
+
+class ProcessIOFiles():
+    """
+        Reads the I/O counters of one process from /proc/<pid>/io and /proc/<pid>/stat.
+
+        read() returns (read bytes, written bytes, read syscalls, write syscalls, major faults, blkio ticks).
+        Bytes are the ones that reached the block layer, page cache hits are not counted.
+        Bytes, syscalls and major faults include the children reaped by the process.
+    """
+    def __init__(self, pid: int) -> None:
+        self.io_fd = os.open(f"/proc/{pid}/io", os.O_RDONLY)
+        try:
+            self.stat_fd = os.open(f"/proc/{pid}/stat", os.O_RDONLY)
+        except OSError:
+            os.close(self.io_fd)
+            raise
+
+    def read(self) -> Tuple[int, int, int, int, int, int]:
+        io = pread_all(self.io_fd).split()
+        stat = pread_all(self.stat_fd)
+        stat_fields = stat[stat.rindex(b")") + 2:].split(b" ", PROC_STAT_BLKIO_TICKS + 1)
+        return (int(io[PROC_IO_READ_BYTES]), int(io[PROC_IO_WRITE_BYTES]),
+                int(io[PROC_IO_SYSCR]), int(io[PROC_IO_SYSCW]),
+                int(stat_fields[PROC_STAT_MAJFLT]) + int(stat_fields[PROC_STAT_CMAJFLT]),
+                int(stat_fields[PROC_STAT_BLKIO_TICKS]))
+
+    def close(self) -> None:
+        os.close(self.io_fd)
+        os.close(self.stat_fd)
+
+class IOCounters():
+    """
+        Disk I/O counters summed over the processes returned by get_pids.
+
+        read_io returns the IO_COUNTER_FIELDS values: bytes read and written, read and write
+        syscalls (the closest per process measure of IOPS), major page faults and the time spent
+        waiting for block I/O in seconds. io_wait_time is None without delay accounting.
+        When a process exits, its parent adds its bytes, syscalls and major faults to its own
+        once it reaps it, so the sum over the live processes keeps counting them. The I/O wait
+        of processes that exit is kept from their last reading.
+        Totals never decrease, processes that exited but were not reaped yet briefly go missing from the sum.
+    """
+    def __init__(self, get_pids: Callable[[], Iterable[int]]) -> None:
+        self.get_pids = get_pids
+        self.clock_ticks = os.sysconf("SC_CLK_TCK")
+        self.with_io_wait = delayacct_enabled()
+        if not self.with_io_wait:
+            log.info("Delay accounting is disabled (kernel.task_delayacct = 0). I/O wait time is not measured.")
+
+        self.files: Dict[int, ProcessIOFiles] = {}
+        self.last_blkio_ticks: Dict[int, int] = {}
+        self.exited_blkio_ticks = 0
+        # Processes we are not allowed to read
+        self.unreadable_pids: Set[int] = set()
+        self.totals = [0] * len(IO_COUNTER_FIELDS)
+        self.baseline = None
+
+    def read_io(self) -> Tuple[int, int, int, int, int, Optional[float]]:
+        pids = set(self.get_pids())
+        for pid in list(self.files):
+            if pid not in pids:
+                self.remove(pid)
+        self.unreadable_pids &= pids
+
+        sums = [0] * len(IO_COUNTER_FIELDS)
+        sums[-1] = self.exited_blkio_ticks
+        for pid in pids:
+            if pid in self.unreadable_pids:
+                continue
+            try:
+                files = self.files.get(pid)
+                if files is None:
+                    files = self.files[pid] = ProcessIOFiles(pid)
+                values = files.read()
+            except PermissionError:
+                self.unreadable_pids.add(pid)
+                if pid in self.files:
+                    self.files.pop(pid).close()
+                continue
+            except (OSError, ValueError, IndexError):
+                # Exited
+                if pid in self.files:
+                    self.remove(pid)
+                continue
+
+            self.last_blkio_ticks[pid] = values[-1]
+            for i, value in enumerate(values):
+                sums[i] += value
+
+        self.totals = [max(total, value) for total, value in zip(self.totals, sums)]
+        if self.baseline is None:
+            self.baseline = self.totals
+        *counters, blkio_ticks = (total - base for total, base in zip(self.totals, self.baseline))
+        io_wait_time = blkio_ticks / self.clock_ticks if self.with_io_wait else None
+        return (*counters, io_wait_time)
+
+    def remove(self, pid: int) -> None:
+        self.files.pop(pid).close()
+        self.exited_blkio_ticks += self.last_blkio_ticks.pop(pid, 0)
+
+    def close(self) -> None:
+        for files in self.files.values():
+            files.close()
+        self.files = {}
+
+def create_io_counters(pid: int, process_tree=None) -> Optional[IOCounters]:
+    """
+        Creates the I/O counters of pid, or of every process in process_tree if given.
+        Returns None if the I/O counters of pid cannot be read.
+    """
+    if process_tree is not None:
+        io_counters = IOCounters(lambda: process_tree.processes.keys())
+    else:
+        io_counters = IOCounters(lambda: (pid,))
+
+    try:
+        files = ProcessIOFiles(pid)
+        try:
+            files.read()
+        finally:
+            files.close()
+    except (OSError, ValueError, IndexError) as err:
+        log.warning(f"Could not read the I/O counters of {pid} ({err}). Disk I/O is not measured.")
+        return None
+    # Counts start from the first reading
+    io_counters.read_io()
+    return io_counters
@@ -1,62 +1,153 @@
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
 from .scraper_base import ProcessMetrics
 from .general_scraper import GeneralScrapper
-from datetime import datetime, timezone
-from jtop import jtop
 from colext.common.logger import log
-import time
+from colext.metric_collection.deadline_scheduler import AnchoredClock
+from colext.metric_collection.self_telemetry import MonitoringTelemetry, SCRAPE_JTOP_COST
 
-class JetsonScraper(GeneralScrapper):
-    def __init__(self, pid: int, collection_interval_s: float):
-        super().__init__(pid, collection_interval_s)
+# Readings older than this many collection intervals are not reported
+MAX_READING_AGE_INTERVALS = 5
+
+def create_jtop(interval: float):
+    # Imported when the scraper is created, so importing the scrapers does not import jtop
+    try:
+        from jtop import jtop
+    except ImportError:
+        raise ImportError("Jetson device detected -> expected jtop package to be installed but it could not be found.")
+    return jtop(interval)
+
+class JtopReading():
+    """ Values published by jtop in one update. """
+    __slots__ = ("time_s", "power_mw", "gpu_load", "gpu_freq", "emc", "temperatures")
+
+    def __init__(self, time_s: float, power_mw: Optional[float], gpu_load: Optional[float], gpu_freq: Optional[dict],
+                 emc: Optional[dict], temperatures: Dict[str, float]) -> None:
+        self.time_s = time_s
+        self.power_mw = power_mw
+        self.gpu_load = gpu_load
+        # Frequencies are in kHz
+        self.gpu_freq = gpu_freq
+        self.emc = emc
+        self.temperatures = temperatures
+
+class JtopSubscriber():
+    """
+        Caches the latest jtop update.
+
+        on_update is attached to jtop and runs in jtop's thread every time the jtop service
+        publishes new stats. Readings are timestamped with clock when they are received.
+    """
+    def __init__(self, clock: AnchoredClock, telemetry: MonitoringTelemetry) -> None:
+        self.clock = clock
+        self.telemetry = telemetry
+        self.reading: Optional[JtopReading] = None
+        self.reading_lock = threading.Lock()
+        self.failing = False
+        self.gpu_warning_logged = False
+
+    def on_update(self, jetson) -> None:
+        start_time = time.perf_counter()
+        try:
+            reading = self.read_stats(jetson)
+        except (KeyError, TypeError, ValueError) as err:
+            # Raising here would stop jtop's thread
+            if not self.failing:
+                log.warning(f"Could not parse jtop stats ({err}). Skipping them until they can be parsed.")
+            self.failing = True
+            return
+        self.failing = False
+        with self.reading_lock:
+            self.reading = reading
+        self.telemetry.record_duration(SCRAPE_JTOP_COST, time.perf_counter() - start_time)
 
-        # For some reason jetson.gpu returns a list of gpus. We only have 1 so we query it's name and cache it here
-        with jtop() as jetson:
-            gpu_stats = jetson.gpu
-            gpu_list = list(gpu_stats.keys())
+    def read_stats(self, jetson) -> JtopReading:
+        time_s = self.clock.time_s()
+        power_mw = jetson.power["tot"]["power"]
 
-            if len(gpu_stats) != 1:
-                log.error(f"Expected to find a single gpu with jtop, found = {gpu_stats.keys()}")
-                exit(1)
+        # jetson.gpu is a dict of gpus. Jetsons have a single one
+        gpu_stats = jetson.gpu
+        gpu_load = None
+        gpu_freq = None
+        if len(gpu_stats) == 1:
+            gpu = next(iter(gpu_stats.values()))
+            gpu_load = gpu["status"]["load"]
+            gpu_freq = gpu.get("freq")
+        elif not self.gpu_warning_logged:
+            log.error(f"Expected to find a single gpu with jtop, found = {list(gpu_stats.keys())}")
+            self.gpu_warning_logged = True
 
-            self.gpu_key = gpu_list[0]
+        emc = jetson.memory.get("EMC")
+        temperatures = {name: sensor["temp"] for name, sensor in jetson.temperature.items()
+                        if sensor.get("online", True)}
+        return JtopReading(time_s, power_mw, gpu_load, dict(gpu_freq) if gpu_freq is not None else None,
+                           dict(emc) if emc is not None else None, temperatures)
 
-        # 0.15 (magic number) is roughly the time psutils takes to run
-        # jtop provides metrics at half of the speed we want
-        interval = (collection_interval_s - 0.15) / 2
-        log.debug(f"jtop interval = {interval}")
-        self.jetson = jtop(interval)
+    def latest(self) -> Optional[JtopReading]:
+        with self.reading_lock:
+            return self.reading
+
+class JetsonScraper(GeneralScrapper):
+    """
+        Scraper for Nvidia Jetsons. Power and GPU load come from the jtop service.
+
+        jtop pushes its stats to a JtopSubscriber, so scrapes never wait for jtop and use the
+        latest update instead. Updates older than MAX_READING_AGE_INTERVALS collection intervals
+        are not reported.
+        jtop_factory(interval) creates the jtop connection and can be replaced to mock the jtop service.
+    """
+    jtop_factory = staticmethod(create_jtop)
+
+    def __init__(self, pid: int, collection_interval_s: float, telemetry: MonitoringTelemetry, clock: AnchoredClock):
+        super().__init__(pid, collection_interval_s, telemetry, clock)
+        self.max_reading_age_s = MAX_READING_AGE_INTERVALS * collection_interval_s
+
+        self.jtop_subscriber = JtopSubscriber(clock, telemetry)
+        # close() can run even if connecting to jtop fails
+        self.jetson = None
+        self.jetson = self.jtop_factory(collection_interval_s)
+        self.jetson.attach(self.jtop_subscriber.on_update)
         self.jetson.start()
 
     def scrape_process_metrics(self) -> ProcessMetrics:
-        start_ps_m_time = time.time()
         p_metrics: ProcessMetrics = super().scrape_process_metrics()
-        end_ps_m_time = time.time()
-        log.debug(f"psutil time = {end_ps_m_time - start_ps_m_time}")
-
-        # jetson.ok is needed to avoid getting stats in an inconsistent state
-        # jetson.ok blocks until ready to retrieve new metrics
-        # https://rnext.it/jetson_stats/reference/jtop.html#jtop.jtop.ok
-        start_jtop_m_time = time.time()
-        if not self.jetson.ok():
-            log.error("jetson.ok returned false!")
 
         # Override general metrics
-        p_metrics.power_consumption = self.jetson.power["tot"]["power"]
-        p_metrics.gpu_util = self.jetson.gpu[self.gpu_key]["status"]["load"]
-
-        end_jtop_m_time = time.time()
-        log.debug(f"jtop time = {end_jtop_m_time - start_jtop_m_time}")
-
-        timestamp = datetime.now(timezone.utc)
-        p_metrics.time = timestamp
+        p_metrics.power_consumption = None
+        p_metrics.gpu_util = None
+        reading = self.jtop_subscriber.latest()
+        if reading is not None and abs(p_metrics.time - reading.time_s) <= self.max_reading_age_s:
+            p_metrics.power_consumption = reading.power_mw
+            p_metrics.gpu_util = reading.gpu_load
         return p_metrics
 
+    def read_thermal_info(self) -> Tuple[dict, dict]:
+        """ Adds the GPU and EMC frequencies published by jtop. Temperatures come from jtop as well. """
+        cpu_info, gpu_info = super().read_thermal_info()
+        reading = self.jtop_subscriber.latest()
+        if reading is None:
+            return cpu_info, gpu_info
+
+        if reading.temperatures:
+            cpu_info["temp_c"] = reading.temperatures
+        if reading.gpu_freq is not None and reading.gpu_freq.get("cur") is not None:
+            gpu_info["freq_mhz"] = reading.gpu_freq["cur"] // 1000
+            if reading.gpu_freq.get("max") is not None:
+                gpu_info["max_freq_mhz"] = reading.gpu_freq["max"] // 1000
+        if reading.emc is not None and reading.emc.get("cur") is not None:
+            gpu_info["emc_freq_mhz"] = reading.emc["cur"] // 1000
+            if reading.emc.get("val") is not None:
+                gpu_info["emc_util"] = reading.emc["val"]
+        return cpu_info, gpu_info
 
     # If we don't close the jtop connection, the jtop service may crash
-    def __del__(self):
-        if self.jetson:
-            log.info("Closing jtop connection")
-            self.jetson.close()
-            log.info("jtop connection closed")
-        else:
-            log.info("jtop connection was never established!")
+    def close(self) -> None:
+        super().close()
+        if self.jetson is None:
+            return
+        log.info("Closing jtop connection")
+        self.jetson.close()
+        self.jetson = None
+        log.info("jtop connection closed")
@@ -0,0 +1,222 @@
+import os
+import socket
+import struct
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+
+from colext.common.logger import log
+from .proc_readers import NET_DEV_IFACE_LINE, NowrapCounters, pread_all
+
+# Scopes of the network counters:
+#  namespace: all interfaces of the client's network namespace (the pod, or the host with the local_py deployer)
+#  interface:<name>: a single interface of the client's network namespace
+#  process: TCP sockets owned by the client process, or by the processes of its tree with process_tree
+NET_SCOPE_NAMESPACE = "namespace"
+NET_SCOPE_INTERFACE_PREFIX = "interface:"
+NET_SCOPE_PROCESS = "process"
+
+# sock_diag netlink interface: linux/netlink.h, linux/sock_diag.h, linux/inet_diag.h
+NETLINK_SOCK_DIAG = 4
+SOCK_DIAG_BY_FAMILY = 20
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+INET_DIAG_INFO = 2
+NLMSG_HEADER = struct.Struct("=IHHII") # len, type, flags, seq, pid
+# family, protocol, ext, pad, states, inet_diag_sockid (48 bytes)
+INET_DIAG_REQ_V2 = struct.Struct("=BBBxI48x")
+# family, state, timer, retrans, inet_diag_sockid (48 bytes), expires, rqueue, wqueue, uid, inode
+INET_DIAG_MSG = struct.Struct("=BBBB48xIIIII")
+RTATTR_HEADER = struct.Struct("=HH") # len, type
+# struct tcp_info offsets (linux/tcp.h)
+TCP_INFO_U64 = struct.Struct("=Q")
+TCP_INFO_BYTES_ACKED_OFFSET = 120
+TCP_INFO_BYTES_RECEIVED_OFFSET = 128
+TCP_INFO_BYTES_SENT_OFFSET = 200 # Linux 4.19+. Includes retransmissions
+TCP_STATES_ALL = 0xFFFFFFFF
+NETLINK_RECV_SIZE = 65536
+
+class NamespaceNetCounters():
+    """ Byte counters of all interfaces, read by the scraper's proc reader. """
+    def __init__(self, proc_reader) -> None:
+        self.scope = NET_SCOPE_NAMESPACE
+        self.proc_reader = proc_reader
+
+    def read_net(self) -> Tuple[int, int]:
+        return self.proc_reader.read_net()
+
+    def close(self) -> None:
+        # The proc reader is closed by its owner
+        pass
+
+class InterfaceNetCounters():
+    """ Byte counters of a single interface in the network namespace of pid. """
+    def __init__(self, pid: int, interface: str) -> None:
+        self.interface = interface.encode()
+        self.scope = f"{NET_SCOPE_INTERFACE_PREFIX}{interface}"
+        self.net_dev_fd = os.open(f"/proc/{pid}/net/dev", os.O_RDONLY)
+        self.net_counters = NowrapCounters()
+        try:
+            self.read_net()
+        except ValueError:
+            self.close()
+            raise
+
+    def read_net(self) -> Tuple[int, int]:
+        """ Returns (bytes sent, bytes received) of the interface. """
+        for name, rx_bytes, tx_bytes in NET_DEV_IFACE_LINE.findall(pread_all(self.net_dev_fd)):
+            if name == self.interface:
+                return self.net_counters.update(int(tx_bytes), int(rx_bytes))
+        raise ValueError(f"Interface {self.interface.decode()} not found")
+
+    def close(self) -> None:
+        os.close(self.net_dev_fd)
+
+class SocketNetCounters():
+    """
+        Byte counters of the TCP sockets owned by pid, or by the processes returned by get_pids.
+
+        Sockets are found through the file descriptors of the processes. A socket shared between processes
+        (e.g. inherited by a forked worker) is counted once. Their byte counts are read from
+        tcp_info with a sock_diag netlink dump of the TCP sockets in the network namespace.
+        Bytes of sockets that closed are kept as seen on the last read, so traffic between
+        the last read and the close is not counted.
+        Counts payload bytes only, unlike interface counters which include protocol headers.
+        When the monitoring runs in pid, its sockets are left out by passing their inodes as monitor_inodes,
+        or are the only ones counted if monitor_only is set.
+    """
+    def __init__(self, pid: int, monitor_inodes: Optional[Set[int]] = None, monitor_only: bool = False,
+                 get_pids: Optional[Callable[[], Iterable[int]]] = None) -> None:
+        self.pid = pid
+        self.scope = NET_SCOPE_PROCESS
+        self.get_pids = get_pids if get_pids is not None else lambda: (pid,)
+        # The fds of pid must be readable. Other processes may exit at any time
+        os.listdir(f"/proc/{pid}/fd")
+        # Filled while monitoring, e.g. when the DB pool reconnects
+        self.monitor_inodes = monitor_inodes
+        self.monitor_only = monitor_only
+        self.nl_sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_SOCK_DIAG)
+        self.seq = 0
+        # inode -> (bytes sent, bytes received) on the last read
+        self.open_sockets: Dict[int, Tuple[int, int]] = {}
+        self.closed_bytes = [0, 0]
+        try:
+            self.read_net()
+        except OSError:
+            self.close()
+            raise
+
+    def read_net(self) -> Tuple[int, int]:
+        """ Returns (bytes sent, bytes received) by the sockets of the processes, including the ones that closed. """
+        inodes = self.socket_inodes()
+        current_sockets = {}
+        for family in (socket.AF_INET, socket.AF_INET6):
+            for inode, byte_counts in self.dump_tcp_sockets(family):
+                if inode in inodes:
+                    current_sockets[inode] = byte_counts
+
+        for inode, (bytes_sent, bytes_recv) in self.open_sockets.items():
+            if inode not in current_sockets:
+                self.closed_bytes[0] += bytes_sent
+                self.closed_bytes[1] += bytes_recv
+        self.open_sockets = current_sockets
+
+        bytes_sent = self.closed_bytes[0] + sum(s for s, _ in current_sockets.values())
+        bytes_recv = self.closed_bytes[1] + sum(r for _, r in current_sockets.values())
+        return bytes_sent, bytes_recv
+
+    def socket_inodes(self) -> Set[int]:
+        inodes = set()
+        for pid in list(self.get_pids()):
+            fd_dir = f"/proc/{pid}/fd"
+            try:
+                fds = os.listdir(fd_dir)
+            except (FileNotFoundError, ProcessLookupError):
+                # Exited
+                continue
+            for fd in fds:
+                try:
+                    target = os.readlink(os.path.join(fd_dir, fd))
+                except FileNotFoundError:
+                    # Closed
+                    continue
+                if target.startswith("socket:["):
+                    inodes.add(int(target[len("socket:["):-1]))
+        if self.monitor_inodes is not None:
+            inodes = {inode for inode in inodes if (inode in self.monitor_inodes) == self.monitor_only}
+        return inodes
+
+    def dump_tcp_sockets(self, family: int):
+        """ Yields (inode, (bytes sent, bytes received)) for each TCP socket of family. """
+        self.seq += 1
+        request = INET_DIAG_REQ_V2.pack(family, socket.IPPROTO_TCP, 1 << (INET_DIAG_INFO - 1), TCP_STATES_ALL)
+        header = NLMSG_HEADER.pack(NLMSG_HEADER.size + len(request), SOCK_DIAG_BY_FAMILY,
+                                   NLM_F_REQUEST | NLM_F_DUMP, self.seq, 0)
+        self.nl_sock.send(header + request)
+
+        while True:
+            data = self.nl_sock.recv(NETLINK_RECV_SIZE)
+            offset = 0
+            while offset + NLMSG_HEADER.size <= len(data):
+                msg_len, msg_type, _, _, _ = NLMSG_HEADER.unpack_from(data, offset)
+                if msg_type == NLMSG_DONE:
+                    return
+                if msg_type == NLMSG_ERROR:
+                    (error,) = struct.unpack_from("=i", data, offset + NLMSG_HEADER.size)
+                    if error == 0:
+                        return
+                    raise OSError(-error, os.strerror(-error))
+
+                msg_offset = offset + NLMSG_HEADER.size
+                inode = INET_DIAG_MSG.unpack_from(data, msg_offset)[-1]
+                byte_counts = parse_tcp_info_bytes(data, msg_offset + INET_DIAG_MSG.size, offset + msg_len)
+                if byte_counts is not None:
+                    yield inode, byte_counts
+                offset += align4(msg_len)
+
+    def close(self) -> None:
+        self.nl_sock.close()
+
+def parse_tcp_info_bytes(data: bytes, attr_offset: int, end_offset: int):
+    """ Finds INET_DIAG_INFO in the attributes of a diag message. Returns (bytes sent, bytes received) or None. """
+    while attr_offset + RTATTR_HEADER.size <= end_offset:
+        attr_len, attr_type = RTATTR_HEADER.unpack_from(data, attr_offset)
+        if attr_len < RTATTR_HEADER.size:
+            return None
+        if attr_type == INET_DIAG_INFO:
+            info_offset = attr_offset + RTATTR_HEADER.size
+            info_len = attr_len - RTATTR_HEADER.size
+            if info_len < TCP_INFO_BYTES_RECEIVED_OFFSET + 8:
+                return None
+            (bytes_recv,) = TCP_INFO_U64.unpack_from(data, info_offset + TCP_INFO_BYTES_RECEIVED_OFFSET)
+            if info_len >= TCP_INFO_BYTES_SENT_OFFSET + 8:
+                (bytes_sent,) = TCP_INFO_U64.unpack_from(data, info_offset + TCP_INFO_BYTES_SENT_OFFSET)
+            else:
+                (bytes_sent,) = TCP_INFO_U64.unpack_from(data, info_offset + TCP_INFO_BYTES_ACKED_OFFSET)
+            return bytes_sent, bytes_recv
+        attr_offset += align4(attr_len)
+    return None
+
+def align4(length: int) -> int:
+    return (length + 3) & ~3
+
+def create_net_counters(net_scope: str, pid: int, namespace_reader, monitor_inodes: Optional[Set[int]] = None,
+                        monitor_only: bool = False, process_tree=None):
+    """
+        Creates the network counters for net_scope.
+        namespace_reader provides the namespace counters and is used if net_scope cannot be counted.
+        monitor_inodes and monitor_only select the sockets of the process scope, see SocketNetCounters.
+        With process_tree, the process scope counts the sockets of every process in the tree.
+        The returned counters have read_net(), close() and the effective scope.
+    """
+    try:
+        if net_scope.startswith(NET_SCOPE_INTERFACE_PREFIX):
+            return InterfaceNetCounters(pid, net_scope[len(NET_SCOPE_INTERFACE_PREFIX):])
+        if net_scope == NET_SCOPE_PROCESS:
+            get_pids = (lambda: process_tree.processes.keys()) if process_tree is not None else None
+            return SocketNetCounters(pid, monitor_inodes, monitor_only, get_pids)
+        if net_scope != NET_SCOPE_NAMESPACE:
+            log.warning(f"Unknown network scope {net_scope}. Counting the network namespace.")
+    except (OSError, ValueError) as err:
+        log.warning(f"Could not count network traffic with scope {net_scope} ({err}). Counting the network namespace.")
+    return NamespaceNetCounters(namespace_reader)
@@ -0,0 +1,136 @@
+import os
+import re
+import time
+from typing import Tuple
+import psutil
+
+from colext.common.logger import log
+
+VALID_SCRAPE_BACKENDS = ["psutil", "procfs"]
+
+# /proc/net/dev: "<iface>: rx_bytes rx_packets rx_errs rx_drop rx_fifo rx_frame rx_compressed rx_multicast tx_bytes ..."
+NET_DEV_LINE = re.compile(rb"^\s*[^:\s]+:\s*(\d+)(?:\s+\d+){7}\s+(\d+)", re.MULTILINE)
+# Same as NET_DEV_LINE, also capturing the interface name
+NET_DEV_IFACE_LINE = re.compile(rb"^\s*([^:\s]+):\s*(\d+)(?:\s+\d+){7}\s+(\d+)", re.MULTILINE)
+# /proc files are generated on read, so each one is read in as few calls as possible
+PROC_READ_SIZE = 4096
+
+def pread_all(fd: int) -> bytes:
+    data = os.pread(fd, PROC_READ_SIZE, 0)
+    if len(data) < PROC_READ_SIZE:
+        return data
+
+    # Files like /proc/net/dev grow with the number of interfaces
+    chunks = [data]
+    offset = len(data)
+    while len(data) > 0:
+        data = os.pread(fd, PROC_READ_SIZE, offset)
+        chunks.append(data)
+        offset += len(data)
+    return b"".join(chunks)
+
+class NowrapCounters():
+    """ Same as psutil nowrap: keeps (sent, recv) totals increasing if a counter wraps or a source goes away. """
+    def __init__(self) -> None:
+        self.offsets = [0, 0]
+        self.prev = None
+
+    def update(self, bytes_sent: int, bytes_recv: int) -> Tuple[int, int]:
+        if self.prev is not None:
+            if bytes_sent < self.prev[0]:
+                self.offsets[0] += self.prev[0]
+            if bytes_recv < self.prev[1]:
+                self.offsets[1] += self.prev[1]
+        self.prev = (bytes_sent, bytes_recv)
+        return bytes_sent + self.offsets[0], bytes_recv + self.offsets[1]
+
+class PsutilReader():
+    """ Reads process and network counters with psutil. """
+    def __init__(self, pid: int) -> None:
+        self.proc = psutil.Process(pid)
+
+    def read_process(self) -> Tuple[float, int]:
+        """ Returns (cpu_util %, rss bytes). cpu_util is measured since the previous call. """
+        with self.proc.oneshot():
+            cpu_util = self.proc.cpu_percent()
+            mem_util = self.proc.memory_full_info().rss
+        return cpu_util, mem_util
+
+    @staticmethod
+    def read_net() -> Tuple[int, int]:
+        """ Returns (bytes sent, bytes received) over all interfaces. """
+        net_stat = psutil.net_io_counters(nowrap=True)
+        return net_stat.bytes_sent, net_stat.bytes_recv
+
+    def close(self) -> None:
+        pass
+
+class ProcfsReader():
+    """
+        Reads process and network counters straight from /proc.
+
+        File descriptors stay open between scrapes and files are read with pread from offset 0.
+        Reports the same values as PsutilReader: cpu_util from utime + stime in /proc/<pid>/stat
+        and rss from /proc/<pid>/statm.
+        Unlike psutil's memory_full_info, rss does not require walking /proc/<pid>/smaps.
+    """
+    def __init__(self, pid: int) -> None:
+        self.clock_ticks = os.sysconf("SC_CLK_TCK")
+        self.page_size = os.sysconf("SC_PAGE_SIZE")
+        self.stat_fd = os.open(f"/proc/{pid}/stat", os.O_RDONLY)
+        self.statm_fd = os.open(f"/proc/{pid}/statm", os.O_RDONLY)
+        self.net_dev_fd = os.open("/proc/net/dev", os.O_RDONLY)
+
+        self.prev_cpu_ticks = None
+        self.prev_cpu_time = None
+        self.net_counters = NowrapCounters()
+
+    def read_process(self) -> Tuple[float, int]:
+        """ Returns (cpu_util %, rss bytes). cpu_util is measured since the previous call. """
+        now = time.monotonic()
+        stat = pread_all(self.stat_fd)
+        # The process name may contain spaces, fields are counted after its closing parenthesis
+        stat_fields = stat[stat.rindex(b")") + 2:].split(b" ", 13)
+        cpu_ticks = int(stat_fields[11]) + int(stat_fields[12]) # utime + stime
+
+        cpu_util = 0.0
+        if self.prev_cpu_ticks is not None and now > self.prev_cpu_time:
+            cpu_util = (cpu_ticks - self.prev_cpu_ticks) / self.clock_ticks / (now - self.prev_cpu_time) * 100
+        self.prev_cpu_ticks = cpu_ticks
+        self.prev_cpu_time = now
+
+        statm = pread_all(self.statm_fd)
+        mem_util = int(statm.split(b" ", 2)[1]) * self.page_size
+        return round(cpu_util, 1), mem_util
+
+    def read_net(self) -> Tuple[int, int]:
+        """ Returns (bytes sent, bytes received) over all interfaces. """
+        net_dev = pread_all(self.net_dev_fd)
+        bytes_recv = 0
+        bytes_sent = 0
+        for rx_bytes, tx_bytes in NET_DEV_LINE.findall(net_dev):
+            bytes_recv += int(rx_bytes)
+            bytes_sent += int(tx_bytes)
+        return self.net_counters.update(bytes_sent, bytes_recv)
+
+    def close(self) -> None:
+        for fd in (self.stat_fd, self.statm_fd, self.net_dev_fd):
+            os.close(fd)
+
+def create_proc_reader(backend: str, pid: int):
+    """ Creates the reader for backend. Falls back to psutil if /proc cannot be used. """
+    if backend not in VALID_SCRAPE_BACKENDS:
+        log.warning(f"Unknown scrape backend {backend}. Using psutil.")
+    elif backend == "procfs":
+        reader = None
+        try:
+            reader = ProcfsReader(pid)
+            # Make sure the files can be parsed on this kernel
+            reader.read_process()
+            reader.read_net()
+            return reader
+        except (OSError, ValueError, IndexError) as err:
+            log.warning(f"Could not read process metrics from /proc ({err}). Falling back to psutil.")
+            if reader is not None:
+                reader.close()
+    return PsutilReader(pid)
@@ -0,0 +1,218 @@
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Set, Tuple
+import psutil
+
+from colext.common.logger import log
+
+# PSS is read from smaps_rollup, which costs ~20us per MB of RSS. Each process rereads it every
+# PSS_REFRESH_SCRAPES scrapes and extrapolates it from RSS changes in between
+PSS_REFRESH_SCRAPES = 10
+
+class ProcessStats():
+    """ Running summary of the samples taken from one process. """
+    __slots__ = ("pid", "ppid", "name", "first_seen", "last_seen", "n_samples",
+                 "cpu_util_sum", "cpu_util_max", "rss_sum", "rss_max", "pss_sum", "pss_max")
+
+    def __init__(self, pid: int, ppid: int, name: str) -> None:
+        self.pid = pid
+        self.ppid = ppid
+        self.name = name
+        self.first_seen = None
+        self.last_seen = None
+        self.n_samples = 0
+        self.cpu_util_sum = 0.0
+        self.cpu_util_max = 0.0
+        self.rss_sum = 0
+        self.rss_max = 0
+        self.pss_sum = 0
+        self.pss_max = 0
+
+    def add(self, time_s: float, cpu_util: float, rss: int, pss: int) -> None:
+        if self.first_seen is None:
+            self.first_seen = time_s
+        self.last_seen = time_s
+        self.n_samples += 1
+        self.cpu_util_sum += cpu_util
+        self.cpu_util_max = max(self.cpu_util_max, cpu_util)
+        self.rss_sum += rss
+        self.rss_max = max(self.rss_max, rss)
+        self.pss_sum += pss
+        self.pss_max = max(self.pss_max, pss)
+
+    def to_row(self) -> Tuple:
+        """ Returns a row following CLIENT_PROCESS_COLUMNS without client_id. """
+        return (self.pid, self.ppid, self.name,
+                datetime.fromtimestamp(self.first_seen, timezone.utc),
+                datetime.fromtimestamp(self.last_seen, timezone.utc),
+                self.n_samples,
+                self.cpu_util_sum / self.n_samples, self.cpu_util_max,
+                self.rss_sum / self.n_samples, self.rss_max,
+                self.pss_sum / self.n_samples, self.pss_max)
+
+class TrackedProcess():
+    """ A process in the tree with its last PSS reading. """
+    __slots__ = ("proc", "stats", "pss", "pss_rss", "scrapes_to_pss", "pss_phase", "sampled")
+
+    def __init__(self, proc: psutil.Process, stats: ProcessStats, pss_phase: int) -> None:
+        self.proc = proc
+        self.stats = stats
+        self.pss = 0
+        self.pss_rss = 0
+        # PSS is read on the first sample. pss_phase delays the second read, so processes
+        # started together do not read PSS on the same scrapes
+        self.scrapes_to_pss = 0
+        self.pss_phase = pss_phase
+        self.sampled = False
+
+    def sample(self) -> Tuple[float, int, int]:
+        """ Returns (cpu_util %, rss bytes, pss bytes). Raises psutil.Error if the process exited. """
+        with self.proc.oneshot():
+            cpu_util = self.proc.cpu_percent()
+            if not self.sampled:
+                # cpu_percent has no previous call to measure from. Use the average since the process started
+                cpu_times = self.proc.cpu_times()
+                lifetime_s = time.time() - self.proc.create_time()
+                cpu_util = round((cpu_times.user + cpu_times.system) / lifetime_s * 100, 1) if lifetime_s > 0 else 0.0
+                self.sampled = True
+            if self.scrapes_to_pss == 0:
+                mem_info = self.proc.memory_full_info()
+                self.pss, self.pss_rss = mem_info.pss, mem_info.rss
+                self.scrapes_to_pss = PSS_REFRESH_SCRAPES + self.pss_phase
+                self.pss_phase = 0
+            else:
+                mem_info = self.proc.memory_info()
+        self.scrapes_to_pss -= 1
+
+        # Pages mapped since the last PSS reading are assumed to be private
+        pss = max(self.pss + mem_info.rss - self.pss_rss, 0)
+        return cpu_util, mem_info.rss, pss
+
+class ProcessTree():
+    """
+        Measures a process together with all its descendants (e.g. DataLoader workers).
+
+        psutil.Process objects are cached per pid, so cpu_percent of each process is measured
+        between its consecutive scrapes.
+        Membership is refreshed on every scrape by reading /proc/<pid>/task/<tid>/children of the
+        processes in the tree, so the cost grows with the size of the tree and not with the number
+        of processes on the device. If the kernel does not expose these files, psutil's children()
+        is used instead, which scans every process.
+        Processes in exclude_pids are not measured, nor are their descendants.
+        PSS reads are staggered between processes, see PSS_REFRESH_SCRAPES.
+    """
+    def __init__(self, root_pid: int, exclude_pids: Iterable[int] = ()) -> None:
+        self.root_pid = root_pid
+        self.exclude_pids = set(exclude_pids)
+        self.processes: Dict[int, TrackedProcess] = {}
+        # Summary of every process seen, including the ones that exited
+        self.process_stats: List[ProcessStats] = []
+        # pid -> (cpu_util %, rss bytes, pss bytes) of the processes sampled by the last scrape
+        self.last_samples: Dict[int, Tuple[float, int, int]] = {}
+        self.n_added = 0
+        self.use_children_files = os.path.exists(f"/proc/{root_pid}/task/{root_pid}/children")
+        if not self.use_children_files:
+            log.info("/proc/<pid>/task/<tid>/children is not available. Using psutil to find child processes.")
+
+        self.root = psutil.Process(root_pid)
+        self.refresh()
+
+    def __len__(self) -> int:
+        return len(self.processes)
+
+    def refresh(self) -> None:
+        """ Starts tracking new descendants and stops tracking the ones that exited. """
+        if self.use_children_files:
+            alive_pids = self.find_tree_pids()
+        else:
+            alive_pids = {self.root_pid}
+            try:
+                alive_pids.update(p.pid for p in self.root.children(recursive=True) if p.pid not in self.exclude_pids)
+            except psutil.NoSuchProcess:
+                alive_pids = set()
+
+        for pid in list(self.processes):
+            if pid not in alive_pids:
+                self.remove(pid)
+        for pid in alive_pids:
+            if pid not in self.processes:
+                self.add(pid)
+
+    def find_tree_pids(self) -> Set[int]:
+        tree_pids = set()
+        pending_pids = [self.root_pid]
+        while pending_pids:
+            pid = pending_pids.pop()
+            try:
+                children = self.read_children(pid)
+            except (FileNotFoundError, ProcessLookupError):
+                # Exited
+                continue
+            tree_pids.add(pid)
+            pending_pids.extend(c for c in children if c not in self.exclude_pids)
+        return tree_pids
+
+    @staticmethod
+    def read_children(pid: int) -> List[int]:
+        # Children are listed under the thread that created them
+        children = []
+        for tid in os.listdir(f"/proc/{pid}/task"):
+            try:
+                with open(f"/proc/{pid}/task/{tid}/children", "rb") as f:
+                    children.extend(map(int, f.read().split()))
+            except FileNotFoundError:
+                # Thread exited
+                pass
+        return children
+
+    def add(self, pid: int) -> None:
+        try:
+            proc = self.root if pid == self.root_pid else psutil.Process(pid)
+            with proc.oneshot():
+                stats = ProcessStats(pid, proc.ppid(), proc.name())
+        except psutil.Error:
+            return
+
+        self.processes[pid] = TrackedProcess(proc, stats, self.n_added % PSS_REFRESH_SCRAPES)
+        self.process_stats.append(stats)
+        self.n_added += 1
+
+    def remove(self, pid: int) -> None:
+        del self.processes[pid]
+
+    def scrape(self, time_s: float) -> Tuple[float, int, int]:
+        """
+            Refreshes the tree and samples every process in it.
+            Returns the total (cpu_util %, rss bytes, pss bytes).
+        """
+        self.refresh()
+
+        total_cpu_util = 0.0
+        total_rss = 0
+        total_pss = 0
+        self.last_samples = {}
+        for pid, tracked in list(self.processes.items()):
+            try:
+                cpu_util, rss, pss = tracked.sample()
+            except psutil.Error:
+                # Exited since the refresh
+                self.remove(pid)
+                continue
+
+            tracked.stats.add(time_s, cpu_util, rss, pss)
+            self.last_samples[pid] = (cpu_util, rss, pss)
+            total_cpu_util += cpu_util
+            total_rss += rss
+            total_pss += pss
+        return total_cpu_util, total_rss, total_pss
+
+    def last_scrape_info(self, total_pss: int) -> dict:
+        """ cpu_info details of the last scrape: the total PSS and the cpu_util, rss and pss of each process. """
+        processes = {str(pid): {"cpu_util": cpu_util, "rss": rss, "pss": pss}
+                     for pid, (cpu_util, rss, pss) in self.last_samples.items()}
+        return {"pss": total_pss, "processes": processes}
+
+    def summary_rows(self) -> List[Tuple]:
+        """ Rows following CLIENT_PROCESS_COLUMNS without client_id. Processes that were never sampled are skipped. """
+        return [stats.to_row() for stats in self.process_stats if stats.n_samples > 0]
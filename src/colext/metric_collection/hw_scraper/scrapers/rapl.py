@@ -0,0 +1,157 @@
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from colext.common.logger import log
+from colext.metric_collection.deadline_scheduler import AnchoredClock
+from colext.metric_collection.self_telemetry import MonitoringTelemetry, SCRAPE_RAPL_COST
+from .proc_readers import pread_all
+from .scraper_base import ProcessMetrics, ScraperComponent
+
+POWERCAP_ROOT = "/sys/class/powercap"
+# intel-rapl-mmio zones mirror the package zones of intel-rapl and would be counted twice
+RAPL_ZONE_PREFIX = "intel-rapl:"
+
+class RaplDomain():
+    """ Energy counter of one RAPL zone, e.g. package-0, core or dram. """
+    __slots__ = ("name", "energy_fd", "max_energy_uj", "prev_energy_uj", "total_energy_uj", "is_package")
+
+    def __init__(self, name: str, zone_path: str, is_package: bool) -> None:
+        self.name = name
+        self.is_package = is_package
+        self.max_energy_uj = read_int(os.path.join(zone_path, "max_energy_range_uj"))
+        self.energy_fd = os.open(os.path.join(zone_path, "energy_uj"), os.O_RDONLY)
+        self.prev_energy_uj = self.read_energy_uj()
+        self.total_energy_uj = 0
+
+    def read_energy_uj(self) -> int:
+        return int(pread_all(self.energy_fd))
+
+    def update(self, energy_uj: int) -> int:
+        """ Sets the counter to energy_uj. Returns the energy consumed since the previous update in uJ. """
+        delta_uj = energy_uj - self.prev_energy_uj
+        if delta_uj < 0:
+            # The counter wrapped around max_energy_range_uj
+            delta_uj += self.max_energy_uj
+        self.prev_energy_uj = energy_uj
+        self.total_energy_uj += delta_uj
+        return delta_uj
+
+    def close(self) -> None:
+        os.close(self.energy_fd)
+
+class RaplReader():
+    """
+        Reads the RAPL energy counters exposed by the powercap framework.
+
+        Top level zones are packages (package-<i>) or the platform (psys). Their subzones
+        (core, uncore, dram) are named <package>/<subzone>.
+        energy_uj files are kept open and reread on every update.
+        powercap_root can point to a fake sysfs tree with the same layout.
+    """
+    def __init__(self, powercap_root: str = POWERCAP_ROOT) -> None:
+        self.domains: List[RaplDomain] = []
+        try:
+            for zone, parent in RaplReader.find_zones(powercap_root):
+                zone_path = os.path.join(powercap_root, zone)
+                name = read_text(os.path.join(zone_path, "name"))
+                if parent is not None:
+                    parent_name = read_text(os.path.join(powercap_root, parent, "name"))
+                    name = f"{parent_name}/{name}"
+                self.domains.append(RaplDomain(name, zone_path, parent is None and name.startswith("package")))
+        except (OSError, ValueError):
+            self.close()
+            raise
+
+        if not self.domains:
+            raise FileNotFoundError(f"No RAPL zones found in {powercap_root}")
+        self.prev_update_ns = time.monotonic_ns()
+
+    @staticmethod
+    def find_zones(powercap_root: str) -> List[Tuple[str, Optional[str]]]:
+        """ Returns (zone, parent zone or None) pairs. e.g. intel-rapl:0:1 has intel-rapl:0 as parent. """
+        zones = sorted(z for z in os.listdir(powercap_root) if z.startswith(RAPL_ZONE_PREFIX))
+        zone_parents = []
+        for zone in zones:
+            parent = zone.rpartition(":")[0]
+            zone_parents.append((zone, parent if parent in zones else None))
+        return zone_parents
+
+    @staticmethod
+    def is_available(powercap_root: str = POWERCAP_ROOT) -> bool:
+        """ True if there is at least one readable RAPL energy counter. """
+        try:
+            zones = RaplReader.find_zones(powercap_root)
+        except OSError:
+            return False
+        return any(os.access(os.path.join(powercap_root, zone, "energy_uj"), os.R_OK) for zone, _ in zones)
+
+    def update(self) -> Tuple[Optional[float], Dict[str, Dict[str, float]]]:
+        """
+            Reads every counter. If a read fails, no counter is updated.
+            Returns the power of all packages in mW since the previous update and the per domain
+            {"energy_uj": total energy since the reader was created, "power_mw": power since the previous update}.
+        """
+        energies_uj = [domain.read_energy_uj() for domain in self.domains]
+        now_ns = time.monotonic_ns()
+        elapsed_s = (now_ns - self.prev_update_ns) / 1e9
+        self.prev_update_ns = now_ns
+
+        package_power_mw = None
+        domains = {}
+        for domain, energy_uj in zip(self.domains, energies_uj):
+            delta_uj = domain.update(energy_uj)
+            power_mw = round(delta_uj / elapsed_s / 1000, 3) if elapsed_s > 0 else None
+            domains[domain.name] = {"energy_uj": domain.total_energy_uj, "power_mw": power_mw}
+            if domain.is_package and power_mw is not None:
+                package_power_mw = (package_power_mw or 0) + power_mw
+        return package_power_mw, domains
+
+    def close(self) -> None:
+        for domain in self.domains:
+            domain.close()
+        self.domains = []
+
+class RaplComponent(ScraperComponent):
+    """
+        Adds the RAPL energy counters exposed by powercap on x86 devices.
+
+        Per domain energy and power are stored in cpu_info["rapl"] and power_consumption is
+        set to the power of all packages in mW. Combined with a smart plug component listed after it,
+        power_consumption is the power of the whole device instead.
+        powercap_root can be overridden to scrape a fake sysfs tree.
+    """
+    powercap_root = POWERCAP_ROOT
+
+    def __init__(self, collection_interval_s: float, telemetry: MonitoringTelemetry, clock: AnchoredClock) -> None:
+        super().__init__(collection_interval_s, telemetry, clock)
+        self.rapl_reader = RaplReader(self.powercap_root)
+        log.info(f"RAPL domains: {[d.name for d in self.rapl_reader.domains]}")
+        self.rapl_failing = False
+
+    def update(self, p_metrics: ProcessMetrics) -> None:
+        start_time = time.perf_counter()
+        try:
+            package_power_mw, domains = self.rapl_reader.update()
+        except (OSError, ValueError) as err:
+            if not self.rapl_failing:
+                log.warning(f"Could not read RAPL energy counters ({err}). Skipping them until they can be read.")
+            self.rapl_failing = True
+            # Unknown rather than the 0 W of the base scraper
+            p_metrics.power_consumption = None
+            return
+        self.rapl_failing = False
+        self.telemetry.record_duration(SCRAPE_RAPL_COST, time.perf_counter() - start_time)
+
+        p_metrics.power_consumption = package_power_mw
+        p_metrics.cpu_info = {**(p_metrics.cpu_info or {}), "rapl": domains}
+
+    def close(self) -> None:
+        self.rapl_reader.close()
+
+def read_text(path: str) -> str:
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read().strip()
+
+def read_int(path: str) -> int:
+    return int(read_text(path))
@@ -0,0 +1,110 @@
+import csv
+import json
+import re
+import time
+from bisect import bisect_right
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+from colext.common.logger import log
+from colext.common.utils import get_colext_env_var_or_exit
+from colext.metric_collection.deadline_scheduler import AnchoredClock
+from colext.metric_collection.self_telemetry import MonitoringTelemetry
+from .io_counters import IO_COUNTER_FIELDS
+from .scraper_base import ProcessMetrics, ScraperBase
+
+REPLAY_GAUGE_FIELDS = ("cpu_util", "gpu_util", "mem_util", "power_consumption", "net_usage_out", "net_usage_in")
+# Counters keep increasing when the recording loops
+REPLAY_COUNTER_FIELDS = ("n_bytes_sent", "n_bytes_rcvd", *IO_COUNTER_FIELDS)
+REPLAY_INFO_FIELDS = ("cpu_info", "gpu_info")
+# Timestamps written by postgres, e.g. 2024-05-01 10:00:00.12+00
+PG_TIMESTAMP = re.compile(r"(.*?)(?:\.(\d+))?(?:([+-]\d\d)(?::?(\d\d))?)?")
+
+class ReplayScraper(ScraperBase):
+    """
+        Re-emits the HW metrics of a client recorded in a hw_metrics.csv, as written by colext_get_metrics.
+
+        Samples are replayed at their recorded pace: each scrape returns the recorded sample at the
+        same time since the start of the recording, looping over the recording when it ends.
+        Scraping faster than the recording repeats samples and scraping slower skips them.
+        Client i replays the i-th client of the recording, modulo the number of recorded clients.
+        Columns missing from the recording are not reported.
+    """
+    def __init__(self, pid: int, collection_interval_s: float, telemetry: MonitoringTelemetry, clock: AnchoredClock,
+                 file: Optional[str] = None) -> None:
+        super().__init__(pid, collection_interval_s, telemetry, clock)
+        if file is None:
+            raise ValueError("The replay scraper needs a recording, set the scraper to replay:<hw_metrics.csv>")
+        client_id = int(get_colext_env_var_or_exit("COLEXT_CLIENT_ID"))
+        self.offsets_s, self.samples = load_recording(file, client_id)
+        self.duration_s = self.offsets_s[-1]
+        self.last_counters = self.samples[-1][len(REPLAY_GAUGE_FIELDS):len(REPLAY_GAUGE_FIELDS) + len(REPLAY_COUNTER_FIELDS)]
+        log.info(f"Replaying {len(self.samples)} samples over {self.duration_s:.1f}s from {file}")
+        self.start_ns = time.monotonic_ns()
+
+    def scrape_process_metrics(self) -> ProcessMetrics:
+        current_ns = time.monotonic_ns()
+        elapsed_s = (current_ns - self.start_ns) / 1e9
+        if self.duration_s > 0:
+            n_loops, position_s = divmod(elapsed_s, self.duration_s)
+        else:
+            n_loops, position_s = 0, 0.0
+        sample = self.samples[bisect_right(self.offsets_s, position_s) - 1]
+
+        n_gauges, n_counters = len(REPLAY_GAUGE_FIELDS), len(REPLAY_COUNTER_FIELDS)
+        cpu_util, gpu_util, mem_util, power_consumption, net_usage_out, net_usage_in = sample[:n_gauges]
+        counters = [None if value is None else value + int(n_loops) * (last or 0)
+                    for value, last in zip(sample[n_gauges:n_gauges + n_counters], self.last_counters)]
+        cpu_info, gpu_info = sample[n_gauges + n_counters:]
+
+        n_bytes_sent, n_bytes_rcvd, *io_counters = counters
+        p_metrics = ProcessMetrics(self.clock.time_s(current_ns), cpu_util, gpu_util, mem_util, power_consumption,
+                                   round(n_bytes_sent or 0), round(n_bytes_rcvd or 0), net_usage_out, net_usage_in,
+                                   cpu_info, gpu_info)
+        (p_metrics.n_bytes_read, p_metrics.n_bytes_written, p_metrics.n_read_ops, p_metrics.n_write_ops,
+         p_metrics.n_major_faults, p_metrics.io_wait_time) = io_counters
+        return p_metrics
+
+def load_recording(file: str, client_id: int) -> Tuple[List[float], List[Tuple]]:
+    """
+        Reads the samples of one client from a hw_metrics.csv.
+        Returns the time of each sample since the first one and the samples as
+        REPLAY_GAUGE_FIELDS + REPLAY_COUNTER_FIELDS + REPLAY_INFO_FIELDS tuples.
+    """
+    rows_by_client = {}
+    with open(file, "r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            rows_by_client.setdefault(row["client_id"], []).append(row)
+    if not rows_by_client:
+        raise ValueError(f"No samples found in {file}")
+
+    recorded_ids = sorted(rows_by_client, key=int)
+    rows = rows_by_client[recorded_ids[client_id % len(recorded_ids)]]
+    times = [parse_pg_timestamp(row["time"]) for row in rows]
+    order = sorted(range(len(rows)), key=times.__getitem__)
+
+    offsets_s = [(times[i] - times[order[0]]).total_seconds() for i in order]
+    samples = []
+    for i in order:
+        row = rows[i]
+        samples.append((*(float_or_none(row.get(field)) for field in REPLAY_GAUGE_FIELDS),
+                        *(float_or_none(row.get(field)) for field in REPLAY_COUNTER_FIELDS),
+                        *(json.loads(row[field]) if row.get(field) else None for field in REPLAY_INFO_FIELDS)))
+    return offsets_s, samples
+
+def parse_pg_timestamp(text: str) -> datetime:
+    """ Parses the timestamps written by postgres, which datetime.fromisoformat only accepts from Python 3.11. """
+    match = PG_TIMESTAMP.fullmatch(text.strip())
+    base, fraction, tz_hours, tz_minutes = match.groups()
+    ts = datetime.strptime(base.replace("T", " "), "%Y-%m-%d %H:%M:%S")
+    if fraction:
+        ts += timedelta(microseconds=int(fraction[:6].ljust(6, "0")))
+    if tz_hours:
+        offset = timedelta(hours=int(tz_hours))
+        if tz_minutes:
+            offset += timedelta(minutes=int(tz_minutes)) * (-1 if tz_hours.startswith("-") else 1)
+        ts = ts.replace(tzinfo=timezone(offset))
+    return ts
+
+def float_or_none(value: Optional[str]) -> Optional[float]:
+    return float(value) if value else None
@@ -1,11 +1,52 @@
 from abc import ABC, abstractmethod
+from typing import List, Tuple
 from colext.metric_collection.typing import ProcessMetrics
+from colext.metric_collection.self_telemetry import MonitoringTelemetry
+from colext.metric_collection.deadline_scheduler import AnchoredClock
 
 class ScraperBase(ABC):
-    def __init__(self, pid: int, collection_interval_s: float) -> None:
+    def __init__(self, pid: int, collection_interval_s: float, telemetry: MonitoringTelemetry,
+                 clock: AnchoredClock) -> None:
         self.monitor_pid = pid
         self.collection_interval_s = collection_interval_s
+        # Scrapers record the cost of each metric source here
+        self.telemetry = telemetry
+        # Sample timestamps are taken from clock
+        self.clock = clock
 
     @abstractmethod
     def scrape_process_metrics(self) -> ProcessMetrics:
         pass
+
+    def close(self) -> None:
+        """ Releases resources held by the scraper, like background pollers. """
+
+    def process_summary_rows(self) -> List[Tuple]:
+        """ Per process summary rows when the whole process tree is measured. """
+        return []
+
+    def net_scope(self) -> str:
+        """ What the network counters cover, e.g. namespace, interface:<name> or process. """
+        return "namespace"
+
+class ScraperComponent(ABC):
+    """
+        Adds the metrics of one source (e.g. RAPL or a smart plug) to the samples of a base scraper.
+        Components are combined with a base scraper by ComposedScraper, which runs update every
+        interval of the component.
+        Raising OSError or ValueError from __init__ marks the source as unavailable.
+    """
+    # Metrics set by update. Samples between two updates hold their last values
+    held_fields: Tuple[str, ...] = ("power_consumption",)
+
+    def __init__(self, collection_interval_s: float, telemetry: MonitoringTelemetry, clock: AnchoredClock) -> None:
+        self.collection_interval_s = collection_interval_s
+        self.telemetry = telemetry
+        self.clock = clock
+
+    @abstractmethod
+    def update(self, p_metrics: ProcessMetrics) -> None:
+        """ Adds the metrics of the source to p_metrics. """
+
+    def close(self) -> None:
+        """ Releases resources held by the component. """
@@ -0,0 +1,149 @@
+import importlib
+import os
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Type, Union
+
+from colext.common.logger import log
+from colext.metric_collection.deadline_scheduler import AnchoredClock
+from colext.metric_collection.self_telemetry import MonitoringTelemetry
+from .rapl import RaplComponent, RaplReader
+from .scraper_base import ProcessMetrics, ScraperBase, ScraperComponent
+
+AUTO_SCRAPER = "auto"
+# Base scrapers produce the samples and components add the metrics of other sources to them.
+# Entries are classes or "<module>:<class>" paths relative to this package. Paths are imported on first use,
+# so scrapers with optional dependencies (e.g. jtop) are only imported where they are used
+SCRAPERS: Dict[str, Union[Type[ScraperBase], str]] = {
+    "general": ".general_scraper:GeneralScrapper",
+    "jetson": ".jetson_scraper:JetsonScraper",
+    "synthetic": ".synthetic_scraper:SyntheticScraper",
+    "replay": ".replay_scraper:ReplayScraper",
+}
+COMPONENTS: Dict[str, Union[Type[ScraperComponent], str]] = {
+    "rapl": ".rapl:RaplComponent",
+    "smart_plug": ".smart_plug:SmartPlugComponent",
+}
+
+class ScraperSpec(NamedTuple):
+    scraper: str
+    # Passed to the scraper, e.g. the file of the replay scraper
+    arg: Optional[str]
+    # (component, interval_s). Components with a 0 interval update every sample
+    components: List[Tuple[str, float]]
+
+def register_scraper(name: str, scraper_class: Union[Type[ScraperBase], str]) -> None:
+    SCRAPERS[name] = scraper_class
+
+def register_component(name: str, component_class: Union[Type[ScraperComponent], str]) -> None:
+    COMPONENTS[name] = component_class
+
+def parse_scraper_spec(spec: str) -> ScraperSpec:
+    """
+        Parses <scraper>[:<arg>][+<component>[@<interval_s>]]..., e.g. general+rapl@1+smart_plug or replay:hw_metrics.csv
+        Raises ValueError if the spec is not valid.
+    """
+    scraper, *components = spec.split("+")
+    scraper, _, arg = scraper.partition(":")
+    if scraper not in SCRAPERS:
+        raise ValueError(f"Unknown scraper '{scraper}'. Available scrapers: {list(SCRAPERS)}")
+
+    parsed_components = []
+    for component in components:
+        name, _, interval = component.partition("@")
+        if name not in COMPONENTS:
+            raise ValueError(f"Unknown scraper component '{name}'. Available components: {list(COMPONENTS)}")
+        try:
+            interval_s = float(interval) if interval else 0.0
+        except ValueError:
+            raise ValueError(f"Invalid interval for scraper component {name}: '{interval}'") from None
+        if interval_s < 0:
+            raise ValueError(f"Invalid interval for scraper component {name}: '{interval}'")
+        parsed_components.append((name, interval_s))
+    return ScraperSpec(scraper, arg or None, parsed_components)
+
+def auto_scraper_spec(dev_type: str) -> str:
+    """ Scraper spec for the device: jtop on Jetsons, RAPL on x86 devices that expose it and the smart plug if there is one. """
+    if "Jetson" in dev_type:
+        # jtop reports the power of the whole board
+        return "jetson"
+    spec = "general"
+    if RaplReader.is_available(RaplComponent.powercap_root):
+        spec += "+rapl"
+    if os.getenv("SP_IP_ADDRESS") is not None:
+        spec += "+smart_plug"
+    return spec
+
+def resolve(entry: Union[type, str]) -> type:
+    if not isinstance(entry, str):
+        return entry
+    module_name, _, class_name = entry.partition(":")
+    module = importlib.import_module(module_name, package=__package__)
+    return getattr(module, class_name)
+
+def create_scraper(spec: str, dev_type: str, pid: int, collection_interval_s: float,
+                   telemetry: MonitoringTelemetry, clock: AnchoredClock) -> "ComposedScraper":
+    """
+        Creates the scraper described by spec, or the one for dev_type if spec is auto.
+        Components whose source is not available are skipped with a warning.
+    """
+    if spec == AUTO_SCRAPER:
+        spec = auto_scraper_spec(dev_type)
+    parsed_spec = parse_scraper_spec(spec)
+    log.info(f"Scraper: {spec}")
+
+    scraper_args = [] if parsed_spec.arg is None else [parsed_spec.arg]
+    scraper = resolve(SCRAPERS[parsed_spec.scraper])(pid, collection_interval_s, telemetry, clock, *scraper_args)
+
+    components = []
+    for name, interval_s in parsed_spec.components:
+        try:
+            component = resolve(COMPONENTS[name])(collection_interval_s, telemetry, clock)
+        except (OSError, ValueError) as err:
+            log.warning(f"Could not use the {name} scraper component ({err}). Skipping it.")
+            continue
+        components.append((component, interval_s))
+    return ComposedScraper(scraper, components)
+
+class ComposedScraper(ScraperBase):
+    """
+        Runs a base scraper and adds the metrics of its components to the samples.
+
+        Each component updates the first sample taken once its interval has elapsed, or every
+        sample if its interval is 0. Samples in between hold the held_fields of its last update,
+        so power is not reported as 0 between readings and the energy derived from it is not underestimated.
+        Components update samples in order, so later components overwrite the values set by earlier ones.
+    """
+    def __init__(self, scraper: ScraperBase, components: List[Tuple[ScraperComponent, float]]) -> None:
+        super().__init__(scraper.monitor_pid, scraper.collection_interval_s, scraper.telemetry, scraper.clock)
+        self.scraper = scraper
+        self.components = [component for component, _ in components]
+        self.intervals_ns = [round(interval_s * 1e9) for _, interval_s in components]
+        self.next_updates_ns = [time.monotonic_ns()] * len(components)
+        # held_fields of the last update of each component
+        self.last_values: List[Optional[Dict[str, Any]]] = [None] * len(components)
+
+    def scrape_process_metrics(self) -> ProcessMetrics:
+        p_metrics = self.scraper.scrape_process_metrics()
+        now_ns = time.monotonic_ns()
+        for i, component in enumerate(self.components):
+            if now_ns < self.next_updates_ns[i]:
+                if self.last_values[i] is not None:
+                    for field, value in self.last_values[i].items():
+                        setattr(p_metrics, field, value)
+                continue
+            component.update(p_metrics)
+            self.last_values[i] = {field: getattr(p_metrics, field) for field in component.held_fields}
+            # At most one update per sample if the interval is shorter than the scraping interval
+            self.next_updates_ns[i] = max(self.next_updates_ns[i] + self.intervals_ns[i], now_ns)
+        return p_metrics
+
+    def close(self) -> None:
+        for component in self.components:
+            component.close()
+        self.scraper.close()
+
+    def process_summary_rows(self) -> List[Tuple]:
+        return self.scraper.process_summary_rows()
+
+    def net_scope(self) -> str:
+        return self.scraper.net_scope()
@@ -1,39 +1,188 @@
 import os
+import time
 import asyncio
-from tapo import ApiClient
+import threading
+from bisect import bisect_left
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+from colext.common.logger import log
+from colext.common.utils import get_colext_env_var_or_exit
+from colext.metric_collection.deadline_scheduler import AnchoredClock
+from colext.metric_collection.monitor_cpu import MONITOR_THREAD_PREFIX
+from colext.metric_collection.self_telemetry import MonitoringTelemetry, SCRAPE_SMART_PLUG_COST
+from .scraper_base import ProcessMetrics, ScraperComponent
+
+# Readings older than this many poll intervals are not reported
+MAX_READING_AGE_INTERVALS = 5
+
+async def connect_tapo_p110(username: str, password: str, ip_address: str):
+    from tapo import ApiClient
+    client = ApiClient(username, password)
+    return await client.p110(ip_address)
 
 class SmartPlug:
     """
     A plugin for collecting metrics from a smart plug device.
     """
-    def __init__(self) -> None:
+    def __init__(self, connect_fn: Optional[Callable[[str, str, str], Awaitable]] = None) -> None:
         """
         Initialize a SmartPlug
 
         The TAPO_USERNAME, TAPO_PASSWORD and SP_IP_ADDRESS environment variables
         must be set.
+        connect_fn(username, password, ip_address) returns the device session.
+        It defaults to a Tapo P110 session and can be replaced to mock the plug.
         """
-        tapo_username = os.getenv("TAPO_USERNAME")
-        tapo_password = os.getenv("TAPO_PASSWORD")
-        ip_address = os.getenv("SP_IP_ADDRESS")
+        self.tapo_username = os.getenv("TAPO_USERNAME")
+        self.tapo_password = os.getenv("TAPO_PASSWORD")
+        self.ip_address = os.getenv("SP_IP_ADDRESS")
 
-        if tapo_username is None or tapo_password is None or ip_address is None:
+        if self.tapo_username is None or self.tapo_password is None or self.ip_address is None:
             raise EnvironmentError(
                 "SmartPlugPlugin requires the environment variables below to be set:\n" \
                 "TAPO_USERNAME, TAPO_PASSWORD and SP_IP_ADDRESS "
             )
 
-        self.client = ApiClient(tapo_username, tapo_password)
-        self.asyncio_loop = asyncio.get_event_loop()
-        self.device = self.asyncio_loop.run_until_complete(self.client.p110(ip_address))
+        self.connect_fn = connect_fn if connect_fn is not None else connect_tapo_p110
+        self.device = None
+
+    async def connect(self) -> None:
+        self.device = await self.connect_fn(self.tapo_username, self.tapo_password, self.ip_address)
 
-    def get_power_consumption(self) -> int:
+    async def get_power_consumption(self) -> int:
         """
         Retrieves the power consumption of the smart plug device in Milliwatts.
         """
 
         # Getting current power from get_energy_usage because it's in mW.
         #         get_current_power has less precision. It's in W
-        # Made call sync and we later run it concurrently using ThreadPoolExecutor
-        energy_usage = self.asyncio_loop.run_until_complete(self.device.get_energy_usage())
+        if self.device is None:
+            await self.connect()
+        energy_usage = await self.device.get_energy_usage()
         return energy_usage.current_power
+
+class SmartPlugPoller:
+    """
+        Polls a smart plug from a background thread so plug latency does not delay scrapes.
+
+        The thread owns one event loop and keeps the plug session open across polls.
+        Readings are timestamped with clock and kept in a ring of history_size entries.
+        power_at interpolates between the readings around a sample time, or holds the
+        latest reading for sample times after it.
+        If a poll fails, the session is reopened on the next poll.
+    """
+    def __init__(self, smart_plug: SmartPlug, poll_interval_s: float, clock: AnchoredClock,
+                 telemetry: MonitoringTelemetry, history_size: int = 64) -> None:
+        self.smart_plug = smart_plug
+        self.poll_interval_s = poll_interval_s
+        self.clock = clock
+        self.telemetry = telemetry
+        self.max_reading_age_s = MAX_READING_AGE_INTERVALS * poll_interval_s
+
+        # (time_s, power) readings, oldest first
+        self.readings = deque(maxlen=history_size)
+        self.readings_lock = threading.Lock()
+
+        self.loop = asyncio.new_event_loop()
+        self.poll_task = None
+        # Covers stop being called before the poll task exists
+        self.stopped = False
+        self.poller_th = threading.Thread(target=self.run_loop, name=f"{MONITOR_THREAD_PREFIX}smart-plug", daemon=True)
+
+    def start(self) -> None:
+        self.poller_th.start()
+
+    def stop(self) -> None:
+        self.stopped = True
+        if not self.poller_th.is_alive():
+            return
+        self.loop.call_soon_threadsafe(self.cancel_poll_task)
+        self.poller_th.join(timeout=5)
+        if self.poller_th.is_alive():
+            log.error("Smart plug poller thread is still alive... Ignoring it")
+
+    def cancel_poll_task(self) -> None:
+        if self.poll_task is not None:
+            self.poll_task.cancel()
+
+    def run_loop(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.poll_task = self.loop.create_task(self.poll_loop())
+        try:
+            self.loop.run_until_complete(self.poll_task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.loop.close()
+
+    async def poll_loop(self) -> None:
+        interval_ns = round(self.poll_interval_s * 1e9)
+        next_poll_ns = time.monotonic_ns()
+        failing = False
+        while not self.stopped:
+            start_ns = time.monotonic_ns()
+            try:
+                power = await self.smart_plug.get_power_consumption()
+                failing = False
+            except Exception as err:
+                if not failing:
+                    log.warning("Could not read power from the smart plug (%s). Retrying.", err)
+                failing = True
+                self.smart_plug.device = None
+            else:
+                # Plug latency is split evenly between the request and the response
+                read_ns = (start_ns + time.monotonic_ns()) // 2
+                with self.readings_lock:
+                    self.readings.append((self.clock.time_s(read_ns), power))
+            self.telemetry.record_duration(SCRAPE_SMART_PLUG_COST, (time.monotonic_ns() - start_ns) / 1e9)
+
+            # Absolute deadlines. Polls overlapped by a slow one are skipped
+            now_ns = time.monotonic_ns()
+            next_poll_ns += interval_ns
+            if next_poll_ns < now_ns:
+                next_poll_ns += (now_ns - next_poll_ns) // interval_ns * interval_ns + interval_ns
+            await asyncio.sleep((next_poll_ns - now_ns) / 1e9)
+
+    def latest(self):
+        """ Returns the latest (time_s, power) reading or None. """
+        with self.readings_lock:
+            return self.readings[-1] if self.readings else None
+
+    def power_at(self, time_s: float) -> Optional[float]:
+        """ Power at time_s. None if there are no readings close enough to time_s. """
+        with self.readings_lock:
+            readings = list(self.readings)
+        if not readings:
+            return None
+
+        last_time, last_power = readings[-1]
+        if time_s >= last_time:
+            return last_power if time_s - last_time <= self.max_reading_age_s else None
+
+        i = bisect_left(readings, (time_s,))
+        if i == 0:
+            return readings[0][1]
+        (t0, p0), (t1, p1) = readings[i - 1], readings[i]
+        return p0 + (p1 - p0) * (time_s - t0) / (t1 - t0)
+
+class SmartPlugComponent(ScraperComponent):
+    """
+        Sets power_consumption to the power of the whole device measured by a smart plug.
+        The plug is polled in the background every smart_plug_interval, see SmartPlugPoller.
+    """
+    def __init__(self, collection_interval_s: float, telemetry: MonitoringTelemetry, clock: AnchoredClock) -> None:
+        super().__init__(collection_interval_s, telemetry, clock)
+        smart_plug = SmartPlug()
+        poll_interval_s = float(get_colext_env_var_or_exit("COLEXT_MONITORING_SMART_PLUG_INTERVAL"))
+        if poll_interval_s <= 0:
+            poll_interval_s = collection_interval_s
+        log.info(f"Smart plug poll interval: {poll_interval_s}")
+        self.poller = SmartPlugPoller(smart_plug, poll_interval_s, clock, telemetry)
+        self.poller.start()
+
+    def update(self, p_metrics: ProcessMetrics) -> None:
+        p_metrics.power_consumption = self.poller.power_at(p_metrics.time)
+
+    def close(self) -> None:
+        self.poller.stop()
@@ -0,0 +1,92 @@
+import random
+import time
+from typing import Optional
+
+from colext.common.utils import get_colext_env_var_or_exit
+from colext.metric_collection.deadline_scheduler import AnchoredClock
+from colext.metric_collection.self_telemetry import MonitoringTelemetry
+from .scraper_base import ProcessMetrics, ScraperBase
+
+# Each cycle is a training burst followed by an idle period
+SYNTHETIC_FIT_S = 20.0
+SYNTHETIC_IDLE_S = 10.0
+# The model is downloaded at the start of each burst and uploaded at its end
+SYNTHETIC_MODEL_BYTES = 40 * 1024 * 1024
+SYNTHETIC_TRANSFER_S = 2.0
+# The dataset is read from storage while training
+SYNTHETIC_DATASET_READ_BPS = 5 * 1024 * 1024
+SYNTHETIC_READ_OP_BYTES = 128 * 1024
+SYNTHETIC_MAJOR_FAULTS_PS = 20
+# (idle, training) mean of each gauge and the standard deviation of its noise
+SYNTHETIC_CPU_UTIL = ((3.0, 280.0), 15.0) # %
+SYNTHETIC_GPU_UTIL = ((0.0, 70.0), 10.0) # %
+SYNTHETIC_MEM_UTIL = ((600e6, 1000e6), 20e6) # Bytes
+SYNTHETIC_POWER = ((2500.0, 7000.0), 300.0) # mW
+
+class SyntheticScraper(ScraperBase):
+    """
+        Generates HW metrics that look like the ones of an FL client, without reading the device.
+        Used to load test the ingest path and the metric retriever.
+
+        The load cycles between training bursts of SYNTHETIC_FIT_S and idle periods of SYNTHETIC_IDLE_S,
+        aligned to the clock so all clients train at the same time, like in FL rounds.
+        Bursts download the model at their start, upload it at their end and read the dataset
+        from storage while they run. Gauges are drawn around the mean of the current phase.
+        Draws are seeded with seed, or the client id by default, so runs are reproducible.
+        Scrapes only cost a few random draws, so the scraping interval sets the sample rate.
+    """
+    def __init__(self, pid: int, collection_interval_s: float, telemetry: MonitoringTelemetry, clock: AnchoredClock,
+                 seed: Optional[str] = None) -> None:
+        super().__init__(pid, collection_interval_s, telemetry, clock)
+        if seed is None:
+            seed = get_colext_env_var_or_exit("COLEXT_CLIENT_ID")
+        self.rng = random.Random(int(seed))
+        self.cycle_s = SYNTHETIC_FIT_S + SYNTHETIC_IDLE_S
+
+        self.n_bytes_sent = 0.0
+        self.n_bytes_rcvd = 0.0
+        self.n_bytes_read = 0.0
+        self.n_read_ops = 0.0
+        self.n_major_faults = 0.0
+        self.last_scrape_ns = time.monotonic_ns()
+
+    def scrape_process_metrics(self) -> ProcessMetrics:
+        current_ns = time.monotonic_ns()
+        elapsed_s = (current_ns - self.last_scrape_ns) / 1e9
+        self.last_scrape_ns = current_ns
+        current_time = self.clock.time_s(current_ns)
+
+        cycle_time = current_time % self.cycle_s
+        training = cycle_time < SYNTHETIC_FIT_S
+        phase = 1 if training else 0
+
+        sent_bps = rcvd_bps = 0.0
+        if training and cycle_time < SYNTHETIC_TRANSFER_S:
+            rcvd_bps = SYNTHETIC_MODEL_BYTES / SYNTHETIC_TRANSFER_S
+        elif training and cycle_time >= SYNTHETIC_FIT_S - SYNTHETIC_TRANSFER_S:
+            sent_bps = SYNTHETIC_MODEL_BYTES / SYNTHETIC_TRANSFER_S
+        read_bps = SYNTHETIC_DATASET_READ_BPS if training else 0.0
+
+        self.n_bytes_sent += sent_bps * elapsed_s
+        self.n_bytes_rcvd += rcvd_bps * elapsed_s
+        self.n_bytes_read += read_bps * elapsed_s
+        self.n_read_ops += read_bps / SYNTHETIC_READ_OP_BYTES * elapsed_s
+        if training:
+            self.n_major_faults += self.rng.expovariate(1) * SYNTHETIC_MAJOR_FAULTS_PS * elapsed_s
+
+        p_metrics = ProcessMetrics(
+            current_time,
+            self.draw(SYNTHETIC_CPU_UTIL, phase), self.draw(SYNTHETIC_GPU_UTIL, phase, upper=100.0),
+            self.draw(SYNTHETIC_MEM_UTIL, phase), self.draw(SYNTHETIC_POWER, phase),
+            int(self.n_bytes_sent), int(self.n_bytes_rcvd), sent_bps, rcvd_bps)
+        p_metrics.n_bytes_read = int(self.n_bytes_read)
+        p_metrics.n_bytes_written = 0
+        p_metrics.n_read_ops = int(self.n_read_ops)
+        p_metrics.n_write_ops = 0
+        p_metrics.n_major_faults = int(self.n_major_faults)
+        return p_metrics
+
+    def draw(self, gauge, phase: int, upper: Optional[float] = None) -> float:
+        means, stddev = gauge
+        value = max(self.rng.gauss(means[phase], stddev), 0.0)
+        return min(value, upper) if upper is not None else value
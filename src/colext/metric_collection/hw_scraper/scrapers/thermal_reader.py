@@ -0,0 +1,181 @@
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+from .proc_readers import pread_all
+
+SYSFS_ROOT = "/sys"
+# Cooling devices with these words in their type cool the device without slowing it down
+NON_THROTTLING_COOLING_TYPES = ("fan",)
+
+class ThermalReader():
+    """
+        Reads clock frequencies, temperatures and throttling state from sysfs.
+
+        - CPU: scaling_cur_freq of each core. A core is capped when scaling_max_freq is below cpuinfo_max_freq
+        - devfreq devices (e.g. GPUs and memory controllers): cur_freq
+        - Temperatures of every thermal zone, keyed by zone type
+        - Throttling: cooling devices in use and, on x86, thermal throttle events
+        Files are opened once and reread with pread. Files that are missing or unreadable
+        are skipped, so the reader works with whatever the device exposes.
+        sysfs_root can point to a fake sysfs tree with the same layout.
+    """
+    def __init__(self, sysfs_root: str = SYSFS_ROOT) -> None:
+        self.fds: List[int] = []
+        cpu_dir = os.path.join(sysfs_root, "devices", "system", "cpu")
+        # (cur_freq fd, scaling_max_freq fd, cpuinfo_max_freq) per core
+        self.cores: List[Tuple[Optional[int], Optional[int], Optional[int]]] = []
+        self.throttle_count_fds: List[int] = []
+        for cpu in sorted_numbered(list_dir(cpu_dir), "cpu"):
+            cpufreq_dir = os.path.join(cpu_dir, cpu, "cpufreq")
+            cur_freq_fd = self.open(os.path.join(cpufreq_dir, "scaling_cur_freq"))
+            max_freq_fd = self.open(os.path.join(cpufreq_dir, "scaling_max_freq"))
+            hw_max_freq = read_int_or_none(os.path.join(cpufreq_dir, "cpuinfo_max_freq"))
+            if cur_freq_fd is not None:
+                self.cores.append((cur_freq_fd, max_freq_fd, hw_max_freq))
+            for counter in ("core_throttle_count", "package_throttle_count"):
+                fd = self.open(os.path.join(cpu_dir, cpu, "thermal_throttle", counter))
+                if fd is not None:
+                    self.throttle_count_fds.append(fd)
+        self.prev_throttle_count = None
+
+        thermal_dir = os.path.join(sysfs_root, "class", "thermal")
+        # (type, fd)
+        self.zones = self.open_typed(thermal_dir, "thermal_zone", "temp")
+        self.cooling_devices = self.open_typed(thermal_dir, "cooling_device", "cur_state")
+
+        devfreq_dir = os.path.join(sysfs_root, "class", "devfreq")
+        self.devfreq_devices = []
+        for device in sorted(list_dir(devfreq_dir)):
+            fd = self.open(os.path.join(devfreq_dir, device, "cur_freq"))
+            if fd is not None:
+                self.devfreq_devices.append((device, fd))
+
+    def open(self, path: str) -> Optional[int]:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            return None
+        self.fds.append(fd)
+        return fd
+
+    def open_typed(self, class_dir: str, prefix: str, value_file: str) -> List[Tuple[str, int]]:
+        """ Opens value_file of each <prefix><i> device. Devices are named by their type, e.g. cpu-thermal """
+        devices = []
+        for device in sorted_numbered(list_dir(class_dir), prefix):
+            device_type = read_text_or_none(os.path.join(class_dir, device, "type")) or device
+            fd = self.open(os.path.join(class_dir, device, value_file))
+            if fd is not None:
+                devices.append((device_type, fd))
+        return devices
+
+    def is_empty(self) -> bool:
+        return not (self.cores or self.zones or self.cooling_devices or self.devfreq_devices)
+
+    def read(self) -> Tuple[dict, dict]:
+        """
+            Returns (cpu_info, gpu_info):
+            cpu_info = {"freq_mhz": [per core], "temp_c": {zone: temp},
+                        "throttle": {"throttled": .., "capped_cores": .., "cooling": {device: state}, "throttle_events": ..}}
+            gpu_info = {"devfreq_mhz": {device: freq}}
+            Missing values are left out. throttle_events counts the x86 throttle events since the previous read.
+        """
+        freqs_mhz = []
+        capped_cores = 0
+        for cur_freq_fd, max_freq_fd, hw_max_freq in self.cores:
+            cur_freq = pread_int_or_none(cur_freq_fd)
+            freqs_mhz.append(None if cur_freq is None else cur_freq // 1000)
+            max_freq = pread_int_or_none(max_freq_fd) if max_freq_fd is not None else None
+            if max_freq is not None and hw_max_freq is not None and max_freq < hw_max_freq:
+                capped_cores += 1
+
+        temps_c = {}
+        for zone_type, fd in self.zones:
+            temp = pread_int_or_none(fd)
+            if temp is not None:
+                temps_c[unique_key(temps_c, zone_type)] = round(temp / 1000, 1)
+
+        cooling = {}
+        cooling_throttles = False
+        for device_type, fd in self.cooling_devices:
+            state = pread_int_or_none(fd)
+            if state is None:
+                continue
+            cooling[unique_key(cooling, device_type)] = state
+            if state > 0 and not any(t in device_type.lower() for t in NON_THROTTLING_COOLING_TYPES):
+                cooling_throttles = True
+
+        throttle = {"capped_cores": capped_cores, "cooling": cooling}
+        throttle_events = self.read_throttle_events()
+        if throttle_events is not None:
+            throttle["throttle_events"] = throttle_events
+        throttle["throttled"] = capped_cores > 0 or cooling_throttles or bool(throttle_events)
+
+        cpu_info = {"temp_c": temps_c, "throttle": throttle}
+        if self.cores:
+            cpu_info["freq_mhz"] = freqs_mhz
+
+        gpu_info = {}
+        devfreq_mhz = {}
+        for device, fd in self.devfreq_devices:
+            freq = pread_int_or_none(fd)
+            if freq is not None:
+                devfreq_mhz[device] = freq // 1_000_000
+        if devfreq_mhz:
+            gpu_info["devfreq_mhz"] = devfreq_mhz
+        return cpu_info, gpu_info
+
+    def read_throttle_events(self) -> Optional[int]:
+        if not self.throttle_count_fds:
+            return None
+        count = sum(pread_int_or_none(fd) or 0 for fd in self.throttle_count_fds)
+        events = 0 if self.prev_throttle_count is None else max(count - self.prev_throttle_count, 0)
+        self.prev_throttle_count = count
+        return events
+
+    def close(self) -> None:
+        for fd in self.fds:
+            os.close(fd)
+        self.fds = []
+
+def list_dir(path: str) -> List[str]:
+    try:
+        return os.listdir(path)
+    except OSError:
+        return []
+
+def sorted_numbered(names: List[str], prefix: str) -> List[str]:
+    """ <prefix><i> names sorted by i. """
+    pattern = re.compile(re.escape(prefix) + r"(\d+)")
+    numbered = [(int(m.group(1)), name) for name in names for m in [pattern.fullmatch(name)] if m]
+    return [name for _, name in sorted(numbered)]
+
+def unique_key(d: Dict, key: str) -> str:
+    """ Several zones can share a type. Later ones get a suffix """
+    if key not in d:
+        return key
+    i = 1
+    while f"{key}.{i}" in d:
+        i += 1
+    return f"{key}.{i}"
+
+def pread_int_or_none(fd: int) -> Optional[int]:
+    # Some sensors fail to read while powered down
+    try:
+        return int(pread_all(fd))
+    except (OSError, ValueError):
+        return None
+
+def read_text_or_none(path: str) -> Optional[str]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def read_int_or_none(path: str) -> Optional[int]:
+    text = read_text_or_none(path)
+    try:
+        return None if text is None else int(text)
+    except ValueError:
+        return None
@@ -0,0 +1,88 @@
+import time
+import queue
+import threading
+from typing import Callable, List, Optional
+
+from colext.common.logger import log
+from colext.metric_collection.monitor_cpu import MONITOR_THREAD_PREFIX
+from colext.metric_collection.typing import HWWindowMetrics, StageMetrics
+from colext.metric_collection.sample_buffer import HWSampleBuffer
+
+class MetricFlusher():
+    """
+        Ships metric batches to the DB from a dedicated writer thread.
+
+        At most max_in_flight batches wait for the writer.
+        When that limit is reached, submit returns False and the caller keeps buffering.
+        This way a slow DB applies backpressure without blocking metric collection.
+    """
+    def __init__(self, push_fn: Callable[[HWSampleBuffer, List[HWWindowMetrics], List[StageMetrics], bytes], None],
+                 max_in_flight: int = 2) -> None:
+        self.push_fn = push_fn
+        self.batch_queue = queue.Queue(maxsize=max_in_flight)
+
+        self.n_batches = 0
+        self.n_failed_batches = 0
+        self.last_batch_latency_s = 0.0
+        self.max_batch_latency_s = 0.0
+        self.total_batch_latency_s = 0.0
+
+        # writer_th is interrupted by submitting a None batch
+        self.writer_th = threading.Thread(target=self.writer_loop, name=f"{MONITOR_THREAD_PREFIX}metric-flusher", daemon=True)
+
+    def start(self) -> None:
+        self.writer_th.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """ Waits for the submitted batches to be pushed and stops the writer thread. """
+        self.batch_queue.put(None)
+        self.writer_th.join(timeout=timeout)
+        if self.writer_th.is_alive():
+            log.error("Metric writer thread is still alive... Ignoring it")
+
+        log.info("Metric writer pushed %s batches (%s failed). Batch latency avg = %.3fs max = %.3fs",
+                 self.n_batches, self.n_failed_batches, self.avg_batch_latency_s, self.max_batch_latency_s)
+
+    def submit(self, hw_metrics: HWSampleBuffer, hw_windows: List[HWWindowMetrics],
+               stage_metrics: List[StageMetrics], training_records: bytes, block: bool = False) -> bool:
+        """
+            Hands the batch over to the writer thread. The caller must not modify the batch afterwards.
+            Returns False if the writer has max_in_flight batches pending and block is False.
+        """
+        try:
+            self.batch_queue.put((hw_metrics, hw_windows, stage_metrics, training_records), block=block)
+        except queue.Full:
+            return False
+        return True
+
+    def is_full(self) -> bool:
+        return self.batch_queue.full()
+
+    def queue_depth(self) -> int:
+        return self.batch_queue.qsize()
+
+    @property
+    def avg_batch_latency_s(self) -> float:
+        if self.n_batches == 0:
+            return 0.0
+        return self.total_batch_latency_s / self.n_batches
+
+    def writer_loop(self) -> None:
+        while True:
+            batch = self.batch_queue.get()
+            if batch is None:
+                break
+
+            start_push_time = time.perf_counter()
+            try:
+                self.push_fn(*batch)
+            except Exception:
+                log.exception("Could not push metric batch to DB. Dropping it.")
+                self.n_failed_batches += 1
+            batch_latency_s = time.perf_counter() - start_push_time
+
+            self.n_batches += 1
+            self.last_batch_latency_s = batch_latency_s
+            self.total_batch_latency_s += batch_latency_s
+            self.max_batch_latency_s = max(self.max_batch_latency_s, batch_latency_s)
+            log.debug("Pushed metric batch in %.3fs", batch_latency_s)
@@ -1,131 +1,428 @@
 import os
+import math
 import time
 import queue
-import multiprocessing as mp
+import threading
+from typing import List, Set, Union
 from multiprocessing.synchronize import Event as SyncEvent
-from dataclasses import asdict
-from psycopg_pool import ConnectionPool
+import psycopg
 
 from colext.common.logger import log
 from colext.common.utils import get_colext_env_var_or_exit
-from colext.metric_collection.typing import StageMetrics
+from colext.metric_collection.typing import HWWindowMetrics, StageMetrics
+from .collector_client import CollectorClient
+from .deadline_scheduler import AnchoredClock, DeadlineScheduler
+from .db_writer import (
+    HWMetricWriter, write_client_net_scope, write_client_processes, write_hw_windows, write_monitoring_telemetry, write_stage_metrics,
+    write_training_metrics)
+from .hw_aggregator import HWWindowAggregator
+from .metric_flusher import MetricFlusher
+from .metric_spool import MetricSpool
+from .sample_buffer import HWSampleBuffer
+from .self_telemetry import (
+    MonitoringTelemetry, DEFERRED_SUBMITS, MONITOR_CPU, DROPPED_STAGE_EVENTS, DROPPED_TRAINING_RECORDS, FAILED_BATCHES, FLUSHER_QUEUE_DEPTH,
+    HW_BATCH_SIZE, MISSED_PUSHES, PUSH_LATENCY, SPOOLED_BATCHES)
+from .stage_ring import StageMetricRing, EVENT_STAGE_START, STAGE_FIT, STAGE_IDLE, STAGE_NAMES
+from .training_monitor import TRAINING_RECORD, TrainingMetricRing
+from .monitor_cpu import MonitorCPUMeter
+from .monitor_sockets import register_monitor_socket
 from .hw_scraper.hw_scraper import HWScraper
-from .hw_scraper.scrapers.scraper_base import ProcessMetrics
+
+# Errors that make a batch be spooled. The collector client raises OSError
+PUSH_ERRORS = (psycopg.Error, OSError)
+# Seconds to wait for a DB connection. When the job ends the wait is short,
+# so the remaining pushes fit in the time the client waits for the metric manager
+DB_TIMEOUT_S = 30
+SHUTDOWN_DB_TIMEOUT_S = 2
+# Same for each send and ACK of the metric collector. A batch that times out is spooled
+SHUTDOWN_COLLECTOR_TIMEOUT_S = 2
+# Wait after a failed replay of spooled metrics, so pushes are not slowed down while the DB is unreachable
+SPOOL_REPLAY_BACKOFF_S = 60
+# Process events in process mode, thread events in thread mode
+MonitorEvent = Union[SyncEvent, threading.Event]
 
 class MetricManager():
-    def __init__(self, finish_event: SyncEvent, ready_event : SyncEvent, st_metric_queue: mp) -> None:
+    def __init__(self, finish_event: MonitorEvent, ready_event : MonitorEvent, stage_ring: StageMetricRing,
+                 training_ring: TrainingMetricRing, clock: AnchoredClock) -> None:
         self.live_metrics = get_colext_env_var_or_exit("COLEXT_MONITORING_LIVE_METRICS") == "True"
         self.push_metrics_interval = float(get_colext_env_var_or_exit("COLEXT_MONITORING_PUSH_INTERVAL"))
+        self.push_mode = get_colext_env_var_or_exit("COLEXT_MONITORING_PUSH_MODE")
+        self.agg_window = float(get_colext_env_var_or_exit("COLEXT_MONITORING_AGG_WINDOW"))
+        self.raw_retention = get_colext_env_var_or_exit("COLEXT_MONITORING_RAW_RETENTION")
+        self.collector_address = get_colext_env_var_or_exit("COLEXT_COLLECTOR_ADDRESS")
         log.info("Live metrics: %s", self.live_metrics)
         log.info("Push metrics interval: %s", self.push_metrics_interval)
+        log.info("Push metrics mode: %s", self.push_mode)
+        log.info("HW metric aggregation window: %s. Raw retention: %s", self.agg_window, self.raw_retention)
+        log.info("Metric collector: %s", self.collector_address or "None. Pushing directly to DB")
 
         self.stage_metrics = []
-        self.st_metric_queue = st_metric_queue
-        self.hw_metrics = []
-        self.hw_metric_queue = queue.Queue()
+        self.stage_ring = stage_ring
+        # Stage the client is currently running (STAGE_FIT/STAGE_EVAL) or STAGE_IDLE between stages
+        self.current_stage = STAGE_IDLE
+        # Packed TRAINING_RECORDs. They're pushed with the stage metrics of their round,
+        # since they're linked to the clients_in_round row written for it
+        self.training_ring = training_ring
+        self.training_records = bytearray()
+        self.ended_round_ids: Set[int] = set()
+        # (start, end) times of fit stages. Used to keep raw HW samples when raw_retention = fit
+        self.fit_time_ranges: List[List[float]] = []
         self.total_hw_metric_count = 0
+        self.total_hw_window_count = 0
+        # Without aggregation all raw samples are kept
+        self.hw_aggregator = HWWindowAggregator(self.agg_window) if self.agg_window > 0 else None
 
         self.finish_event = finish_event
+        # process: the metric manager runs in a child of the client. thread: it runs in the client process
+        self.monitor_mode = get_colext_env_var_or_exit("COLEXT_MONITORING_MODE")
+        log.info("Monitor mode: %s", self.monitor_mode)
         pid = os.getppid()
         measure_self = get_colext_env_var_or_exit("COLEXT_MONITORING_MEASURE_SELF") == "True"
-        if measure_self:
+        if measure_self or self.monitor_mode == "thread":
             pid = os.getpid()
-        self.hw_scraper = HWScraper(pid, self.hw_metric_queue)
+        # In the client process, the CPU of the monitoring threads is measured separately
+        self.monitor_cpu = MonitorCPUMeter() if self.monitor_mode == "thread" else None
+        # Histograms of the monitoring pipeline itself. Written to the DB at job end
+        self.telemetry = MonitoringTelemetry()
+        # Shared with the client process so HW samples and stage timings use the same time base
+        self.clock = clock
+        self.hw_scraper = HWScraper(pid, telemetry=self.telemetry, clock=self.clock,
+                                    monitor_cpu=self.monitor_cpu, measure_self=measure_self)
+        # HW sample buffers are recycled after being pushed
+        # They're sized to hold the samples scraped during a push interval
+        self.hw_buffer_capacity = math.ceil(self.push_metrics_interval / self.hw_scraper.collection_interval_s) + 1
+        self.free_hw_buffers = queue.SimpleQueue()
         self.hw_scraper.start_scraping()
 
         self.client_db_id = get_colext_env_var_or_exit("COLEXT_CLIENT_DB_ID")
-        # Pool required because we might be trying to push hw metrics + round metrics at the same time
-        self.db_pool = self.create_db_pool()
+        self.hw_metric_writer = HWMetricWriter(self.client_db_id, self.push_mode)
+        # Holds metrics while live metrics are disabled or the DB is unreachable
+        spool_dir = os.path.join(get_colext_env_var_or_exit("COLEXT_SPOOL_DIR"), f"client_{self.client_db_id}")
+        self.spool = MetricSpool(spool_dir)
+        self.next_replay_time = 0.0
+        self.db_timeout_s = DB_TIMEOUT_S
+        # Metrics go either through the metric collector or directly to the DB
+        self.collector = None
+        self.db_pool = None
+        if self.collector_address:
+            self.collector = CollectorClient(self.collector_address, self.client_db_id)
+        else:
+            # Pool required because we might be trying to push hw metrics + round metrics at the same time
+            self.db_pool = self.create_db_pool()
+        # Metrics are pushed from the flusher thread so a slow DB does not delay collection
+        self.flusher = MetricFlusher(self.push_metrics)
+        self.flusher.start()
 
         # Inform parent we're ready
         ready_event.set()
 
     def create_db_pool(self):
+        # Imported here since clients pushing through a collector don't use the pool
+        from psycopg_pool import ConnectionPool
         # DB parameters are read from env variables
-        return ConnectionPool(open=True, min_size=2, max_size=2)
+        # Pool connections are not counted as client traffic when the metric manager runs in the client process
+        return ConnectionPool(open=True, min_size=2, max_size=2,
+                              configure=lambda conn: register_monitor_socket(conn.fileno()))
 
     def start_metric_gathering(self):
         log.debug("Start metric gathering.")
 
+        push_scheduler = DeadlineScheduler(self.push_metrics_interval)
+        push_scheduler.start()
         while self.finish_event.is_set() is False:
-            start_m_time = time.time()
-
             self.collect_available_metrics()
-            if self.live_metrics:
-                self.push_current_metrics()
+            self.submit_current_metrics()
 
-            stop_m_time = time.time()
-            remaining_time = self.push_metrics_interval - (stop_m_time - start_m_time)
-            remaining_time = max(remaining_time, 0)
-            time.sleep(remaining_time)
+            # Stage events are collected as soon as they're published
+            next_push_deadline_ns = push_scheduler.advance()
+            remaining_time = push_scheduler.time_until(next_push_deadline_ns)
+            while remaining_time > 0 and self.finish_event.is_set() is False:
+                if self.stage_ring.wait(remaining_time):
+                    self.collect_available_metrics()
+                remaining_time = push_scheduler.time_until(next_push_deadline_ns)
 
-    def collect_available_metrics(self):
-        log.debug("Collecting available metrics in queues.")
-        while not self.hw_metric_queue.empty():
-            hw_metric: ProcessMetrics = self.hw_metric_queue.get()
-            self.hw_metrics.append(hw_metric)
+        self.telemetry.increment(MISSED_PUSHES, push_scheduler.n_missed_ticks)
 
-        while not self.st_metric_queue.empty():
-            st_metric: StageMetrics = self.st_metric_queue.get()
-            self.stage_metrics.append(st_metric)
+    def collect_available_metrics(self):
+        log.debug("Collecting available stage events.")
+        for event, stage, st_metric in self.stage_ring.drain():
+            if event == EVENT_STAGE_START:
+                log.debug("Client started %s stage of round %s", STAGE_NAMES.get(stage), st_metric.round_id)
+                self.current_stage = stage
+                self.hw_scraper.set_stage(stage)
+                if stage == STAGE_FIT:
+                    self.fit_time_ranges.append([st_metric.start_time.timestamp(), math.inf])
+            else:
+                log.debug("Client finished %s stage of round %s", STAGE_NAMES.get(stage), st_metric.round_id)
+                self.current_stage = STAGE_IDLE
+                self.hw_scraper.set_stage(STAGE_IDLE)
+                if stage == STAGE_FIT and self.fit_time_ranges:
+                    self.fit_time_ranges[-1][1] = st_metric.end_time.timestamp()
+                self.stage_metrics.append(st_metric)
+                self.ended_round_ids.add(st_metric.round_id)
+        # The client writes the records of a stage before its end event, so they're all drained here
+        self.training_records += self.training_ring.drain_bytes()
 
     def stop_metric_gathering(self) -> None:
         log.info("Shutting down metric manager.")
+        self.db_timeout_s = SHUTDOWN_DB_TIMEOUT_S
+        if self.collector is not None:
+            self.collector.set_timeout(SHUTDOWN_COLLECTOR_TIMEOUT_S)
 
         self.hw_scraper.stop_scraping()
         self.collect_available_metrics()
-        self.push_current_metrics()
+        self.submit_current_metrics(block=True, final=True)
+        self.flusher.stop()
+        self.replay_spool()
+        self.push_telemetry()
+        self.push_process_summary()
+        self.push_net_scope()
+        if self.collector is not None:
+            self.collector.close()
+        if self.stage_ring.n_dropped > 0:
+            log.error("%s stage events were dropped because the stage ring was full.", self.stage_ring.n_dropped)
+        if self.training_ring.n_dropped > 0:
+            log.warning("%s epoch and batch records were dropped because the training ring was full. "
+                        "Consider increasing batch_sampling.", self.training_ring.n_dropped)
+        self.stage_ring.close()
+        self.training_ring.close()
 
         log.info("Metric manager stopped.")
         log.info("Nr of HW metrics pushed = %s.", self.total_hw_metric_count)
+        if self.hw_aggregator is not None:
+            log.info("Nr of HW metric windows pushed = %s.", self.total_hw_window_count)
 
-    def push_current_metrics(self):
-        self.push_current_hw_metrics()
-        self.push_current_st_metrics()
+    def submit_current_metrics(self, block: bool = False, final: bool = False):
+        """
+            Swaps the current metric buffers for empty ones and hands the filled ones to the flusher.
+            If final is True, the open aggregation window is closed and the training records
+            of unfinished stages are submitted as well.
+        """
+        if not block and self.flusher.is_full():
+            log.debug("Metric writer is busy. Keeping metrics buffered.")
+            self.telemetry.increment(DEFERRED_SUBMITS)
+            return
 
-    def push_current_hw_metrics(self):
-        """ Pushes currently collected HW metrics and clears the vector holding them. """
+        hw_metrics = self.hw_scraper.swap_buffer(self.get_free_hw_buffer())
+        hw_windows = []
+        if self.hw_aggregator is not None:
+            hw_windows = self.hw_aggregator.add(hw_metrics)
+            if final:
+                hw_windows += self.hw_aggregator.flush()
+            hw_metrics = self.retain_raw_samples(hw_metrics)
 
-        if len(self.hw_metrics) == 0:
-            log.debug("No HW metrics to push.")
+        training_records = self.take_training_records(final)
+        if len(hw_metrics) == 0 and len(hw_windows) == 0 and len(self.stage_metrics) == 0 and len(training_records) == 0:
+            log.debug("No metrics to push.")
+            self.free_hw_buffers.put(hw_metrics)
             return
 
-        log.debug("Pushing %s HW metrics from client %s to DB", len(self.hw_metrics), self.client_db_id)
+        self.telemetry.record_size(FLUSHER_QUEUE_DEPTH, self.flusher.queue_depth())
+        self.telemetry.record_size(HW_BATCH_SIZE, len(hw_metrics))
+        self.flusher.submit(hw_metrics, hw_windows, self.stage_metrics, training_records, block=True)
+        self.stage_metrics = []
 
-        sql = """
-                INSERT INTO fl_testbed_logging.device_measurements
-                        (time, client_id, cpu_util, mem_util, gpu_util, power_consumption,
-                        n_bytes_sent, n_bytes_rcvd, net_usage_out, net_usage_in)
-                VALUES (%(time)s, %(client_id)s, %(cpu_util)s, %(mem_util)s, %(gpu_util)s, %(power_consumption)s,
-                        %(n_bytes_sent)s, %(n_bytes_rcvd)s, %(net_usage_out)s, %(net_usage_in)s);
-                """
+    def take_training_records(self, final: bool) -> bytes:
+        """ Takes the training records of the rounds that ended, or all of them if final is True. """
+        records = self.training_records
+        n_bytes = len(records)
+        if not final:
+            # Records are in time order, so the ones of ended rounds come first
+            n_bytes = 0
+            while n_bytes < len(records) and TRAINING_RECORD.unpack_from(records, n_bytes)[1] in self.ended_round_ids:
+                n_bytes += TRAINING_RECORD.size
 
-        cid_dict = {'client_id': self.client_db_id}
-        formatted_metrics = [{**asdict(m), **cid_dict} for m in self.hw_metrics]
-        with self.db_pool.connection() as conn:
-            with conn.cursor() as cur:
-                cur.executemany(sql, formatted_metrics)
+        taken = bytes(records[:n_bytes])
+        del records[:n_bytes]
+        return taken
 
-        self.total_hw_metric_count += len(self.hw_metrics)
-        self.hw_metrics.clear()
+    def retain_raw_samples(self, hw_metrics: HWSampleBuffer) -> HWSampleBuffer:
+        """ Applies the raw retention policy to already aggregated samples. """
+        if self.raw_retention == "all":
+            return hw_metrics
 
-    def push_current_st_metrics(self):
-        if len(self.stage_metrics) == 0:
-            log.debug("No Stage timings metrics to push.")
+        kept_metrics = self.get_free_hw_buffer()
+        if self.raw_retention == "fit" and len(hw_metrics) > 0:
+            times = hw_metrics.column("time")
+            for i in range(len(hw_metrics)):
+                if any(start <= times[i] <= end for start, end in self.fit_time_ranges):
+                    kept_metrics.append_from(hw_metrics, i)
+
+            # Later samples are newer than this batch, so finished ranges before it can be dropped
+            last_time = times[len(hw_metrics) - 1]
+            self.fit_time_ranges = [r for r in self.fit_time_ranges if r[1] >= last_time]
+
+        hw_metrics.clear()
+        self.free_hw_buffers.put(hw_metrics)
+        return kept_metrics
+
+    def get_free_hw_buffer(self) -> HWSampleBuffer:
+        try:
+            return self.free_hw_buffers.get_nowait()
+        except queue.Empty:
+            return HWSampleBuffer(self.hw_buffer_capacity)
+
+    def push_metrics(self, hw_metrics: HWSampleBuffer, hw_windows: List[HWWindowMetrics],
+                     stage_metrics: List[StageMetrics], training_records: bytes):
+        """
+            Runs in the flusher thread.
+            Metrics are spooled to disk if live metrics are disabled or the DB push fails.
+        """
+        try:
+            self.push_or_spool_metrics(hw_metrics, hw_windows, stage_metrics, training_records)
+        finally:
+            hw_metrics.clear()
+            self.free_hw_buffers.put(hw_metrics)
+
+    def push_or_spool_metrics(self, hw_metrics: HWSampleBuffer, hw_windows: List[HWWindowMetrics],
+                              stage_metrics: List[StageMetrics], training_records: bytes):
+        if not self.live_metrics:
+            self.spool.write(hw_metrics, hw_windows, stage_metrics, training_records)
+            self.telemetry.increment(SPOOLED_BATCHES)
+            # Full segments are pushed in the background, so at most the active segment is left when the job ends
+            self.replay_spool_segment(rotate=False)
+            return
+
+        start_push_time = time.perf_counter()
+        try:
+            if self.collector is not None:
+                self.push_to_collector(hw_metrics, hw_windows, stage_metrics, training_records)
+            else:
+                self.push_hw_metrics(hw_metrics)
+                # Drop pushed metrics so they're not spooled if a later push fails
+                hw_metrics.clear()
+                self.push_hw_windows(hw_windows)
+                hw_windows = []
+                self.push_st_metrics(stage_metrics, training_records)
+        except PUSH_ERRORS as err:
+            log.warning("Could not push metrics (%s). Spooling them to disk.", err)
+            self.spool.write(hw_metrics, hw_windows, stage_metrics, training_records)
+            self.telemetry.increment(SPOOLED_BATCHES)
             return
+        self.telemetry.record_duration(PUSH_LATENCY, time.perf_counter() - start_push_time)
 
-        log.debug("Pushing %s stage timings from client %s to DB", len(self.stage_metrics), self.client_db_id)
-        sql = """
-                INSERT INTO clients_in_round
-                        (client_id, round_id, start_time, end_time, loss, num_examples, accuracy)
-                VALUES  (%(cdb_id)s, %(round_id)s, %(start_time)s,
-                         %(end_time)s, %(loss)s, %(num_examples)s, %(accuracy)s)
-              """
+        # DB is reachable, replay previously spooled metrics incrementally
+        self.replay_spool_segment(rotate=True)
 
-        formatted_metrics = [asdict(sm) for sm in self.stage_metrics]
+    def replay_spool_segment(self, rotate: bool):
+        """
+            Replays the oldest spooled segment from the flusher thread. If rotate is False, the segment
+            being written is not replayed. After a failure, replays are retried after SPOOL_REPLAY_BACKOFF_S.
+        """
+        has_segment = self.spool.has_pending() if rotate else self.spool.has_closed_segments()
+        if not has_segment or time.monotonic() < self.next_replay_time:
+            return
+        try:
+            self.spool.replay(self.push_spooled_metrics, max_segments=1, rotate=rotate)
+        except PUSH_ERRORS as err:
+            log.warning("Could not replay spooled metrics (%s). Retrying in %ss.", err, SPOOL_REPLAY_BACKOFF_S)
+            self.next_replay_time = time.monotonic() + SPOOL_REPLAY_BACKOFF_S
 
-        with self.db_pool.connection() as conn:
-            with conn.cursor() as cur:
-                cur.executemany(sql, formatted_metrics)
-        self.stage_metrics.clear()
+    def replay_spool(self):
+        if not self.spool.has_pending():
+            return
+
+        log.info("Pushing spooled metrics to DB.")
+        try:
+            self.spool.replay(self.push_spooled_metrics)
+        except PUSH_ERRORS as err:
+            self.spool.close()
+            log.error("Could not push spooled metrics to DB (%s). They remain in %s and can be pushed with colext_replay_spool.",
+                      err, self.spool.spool_dir)
+
+    def push_telemetry(self):
+        self.telemetry.increment(FAILED_BATCHES, self.flusher.n_failed_batches)
+        self.telemetry.increment(DROPPED_STAGE_EVENTS, self.stage_ring.n_dropped)
+        self.telemetry.increment(DROPPED_TRAINING_RECORDS, self.training_ring.n_dropped)
+        # In process mode, the whole process is the metric manager
+        monitor_cpu_s = self.monitor_cpu.cpu_time_s() if self.monitor_cpu is not None else time.process_time()
+        self.telemetry.record_duration(MONITOR_CPU, monitor_cpu_s)
+        log.info("Monitoring telemetry:")
+        self.telemetry.log_summary(log.info)
+
+        try:
+            with self.job_end_connection() as conn:
+                write_monitoring_telemetry(conn, self.client_db_id, self.telemetry.summary_rows())
+        except psycopg.Error as err:
+            log.warning("Could not push monitoring telemetry to DB (%s).", err)
+
+    def push_process_summary(self):
+        process_rows = self.hw_scraper.process_summary_rows()
+        if len(process_rows) == 0:
+            return
+
+        log.info("Pushing the summary of %s client processes to DB", len(process_rows))
+        try:
+            with self.job_end_connection() as conn:
+                write_client_processes(conn, self.client_db_id, process_rows)
+        except psycopg.Error as err:
+            log.warning("Could not push the client process summary to DB (%s).", err)
+
+    def push_net_scope(self):
+        net_scope = self.hw_scraper.net_scope()
+        try:
+            with self.job_end_connection() as conn:
+                write_client_net_scope(conn, self.client_db_id, net_scope)
+        except psycopg.Error as err:
+            log.warning("Could not push the network scope to DB (%s).", err)
+
+    def job_end_connection(self):
+        """ DB connection for the metrics written once when the job ends """
+        if self.db_pool is not None:
+            return self.db_pool.connection(timeout=self.db_timeout_s)
+        # Clients pushing through the collector don't keep a DB connection
+        return psycopg.connect(connect_timeout=SHUTDOWN_DB_TIMEOUT_S)
+
+    def push_spooled_metrics(self, hw_metrics: HWSampleBuffer, hw_windows: List[HWWindowMetrics],
+                             stage_metrics: List[StageMetrics], training_records: bytes):
+        if self.collector is not None:
+            self.push_to_collector(hw_metrics, hw_windows, stage_metrics, training_records)
+            return
+
+        self.push_hw_metrics(hw_metrics)
+        self.push_hw_windows(hw_windows)
+        self.push_st_metrics(stage_metrics, training_records)
+
+    def push_to_collector(self, hw_metrics: HWSampleBuffer, hw_windows: List[HWWindowMetrics],
+                          stage_metrics: List[StageMetrics], training_records: bytes):
+        log.debug("Pushing %s HW metrics, %s HW metric windows, %s stage timings and %s training records "
+                  "from client %s to the collector", len(hw_metrics), len(hw_windows), len(stage_metrics),
+                  len(training_records) // TRAINING_RECORD.size, self.client_db_id)
+        self.collector.push(hw_metrics, hw_windows, stage_metrics, training_records)
+
+        self.total_hw_metric_count += len(hw_metrics)
+        self.total_hw_window_count += len(hw_windows)
+
+    def push_hw_metrics(self, hw_metrics: HWSampleBuffer):
+        if len(hw_metrics) == 0:
+            log.debug("No HW metrics to push.")
+            return
+
+        log.debug("Pushing %s HW metrics from client %s to DB", len(hw_metrics), self.client_db_id)
+
+        with self.db_pool.connection(timeout=self.db_timeout_s) as conn:
+            self.hw_metric_writer.write(conn, hw_metrics)
+
+        self.total_hw_metric_count += len(hw_metrics)
+
+    def push_hw_windows(self, hw_windows: List[HWWindowMetrics]):
+        if len(hw_windows) == 0:
+            return
+
+        log.debug("Pushing %s HW metric windows from client %s to DB", len(hw_windows), self.client_db_id)
+        with self.db_pool.connection(timeout=self.db_timeout_s) as conn:
+            write_hw_windows(conn, self.client_db_id, hw_windows)
+
+        self.total_hw_window_count += len(hw_windows)
+
+    def push_st_metrics(self, stage_metrics: List[StageMetrics], training_records: bytes):
+        """ Training records are written in the same transaction, after the stage metrics they're linked to. """
+        if len(stage_metrics) == 0 and len(training_records) == 0:
+            log.debug("No Stage timings metrics to push.")
+            return
 
+        log.debug("Pushing %s stage timings and %s training records from client %s to DB",
+                  len(stage_metrics), len(training_records) // TRAINING_RECORD.size, self.client_db_id)
+        with self.db_pool.connection(timeout=self.db_timeout_s) as conn:
+            write_stage_metrics(conn, stage_metrics)
+            write_training_metrics(conn, self.client_db_id, training_records)
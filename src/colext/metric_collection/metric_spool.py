@@ -0,0 +1,295 @@
+import os
+import json
+import struct
+import zlib
+from datetime import datetime
+from dataclasses import asdict
+from typing import Callable, List, Tuple
+
+from colext.common.logger import log
+from colext.metric_collection.typing import HWWindowMetrics, StageMetrics
+from colext.metric_collection.sample_buffer import HWSampleBuffer
+
+SEGMENT_MAGIC = b"CLXS"
+SEGMENT_VERSION = 2
+# Version 1 segments store HW samples as rows of HW_METRIC_STRUCT_V1 instead of a serialized HWSampleBuffer
+SUPPORTED_SEGMENT_VERSIONS = (1, SEGMENT_VERSION)
+SEGMENT_HEADER = struct.Struct("<4sB")
+# payload length, payload crc32, record type
+RECORD_HEADER = struct.Struct("<IIB")
+RECORD_HW_METRICS = 1
+RECORD_STAGE_METRICS = 2
+RECORD_HW_WINDOWS = 3
+# Packed TRAINING_RECORDs, see training_monitor
+RECORD_TRAINING_METRICS = 4
+BATCH_RECORD_TYPES = (RECORD_HW_METRICS, RECORD_STAGE_METRICS, RECORD_HW_WINDOWS, RECORD_TRAINING_METRICS)
+# time, cpu_util, gpu_util, mem_util, power_consumption, n_bytes_sent, n_bytes_rcvd, net_usage_out, net_usage_in
+HW_METRIC_STRUCT_V1 = struct.Struct("<dddddqqdd")
+
+DEFAULT_SEGMENT_SIZE = 4 * 1024 * 1024
+# Segments that could not be fully replayed are renamed with this suffix and kept for inspection
+BAD_SEGMENT_SUFFIX = ".bad"
+# Replay progress in the oldest segment: {"segment": <file name>, "offset": <offset of the next record>}
+REPLAY_OFFSET_FILE = "replay_offset.json"
+
+class MetricSpool():
+    """
+        Append-only on-disk spool for metrics that could not be pushed to the DB yet.
+
+        Metrics are appended to segment files as length-prefixed, checksummed records.
+        The active segment is rotated once it reaches segment_size bytes.
+        Closed segments are replayed in order and deleted once all their records were pushed.
+        The replay offset is saved to disk after each pushed record, so a replay that is interrupted
+        (e.g. the client stops waiting for the metric manager) resumes after the last pushed record.
+        Segments left behind by a previous run (e.g. the pod died) are picked up on startup.
+        A truncated or corrupted record ends the replay of its segment. The segment is then
+        renamed to <segment>.bad instead of deleted, so the records after it are not lost.
+    """
+    def __init__(self, spool_dir: str, segment_size: int = DEFAULT_SEGMENT_SIZE) -> None:
+        self.spool_dir = spool_dir
+        self.segment_size = segment_size
+        os.makedirs(self.spool_dir, exist_ok=True)
+
+        self.closed_segments = self.list_segments(self.spool_dir)
+        next_i = self.segment_index(self.closed_segments[-1]) + 1 if self.closed_segments else 0
+        self.next_segment_i = next_i
+        self.active_segment = None
+        self.active_segment_path = None
+        # Offset of the first record not yet replayed in closed_segments[0]
+        self.replay_offset_path = os.path.join(self.spool_dir, REPLAY_OFFSET_FILE)
+        self.replay_offset = self.load_replay_offset()
+
+        if self.closed_segments:
+            log.info("Found %s metric spool segments in %s", len(self.closed_segments), self.spool_dir)
+
+    # ====== Write path ======
+    def write(self, hw_metrics: HWSampleBuffer, hw_windows: List[HWWindowMetrics],
+              stage_metrics: List[StageMetrics], training_records: bytes) -> None:
+        for record_type, payload in encode_batch_records(hw_metrics, hw_windows, stage_metrics, training_records):
+            self.append_record(record_type, payload)
+
+    def append_record(self, record_type: int, payload: bytes) -> None:
+        if self.active_segment is None:
+            self.open_segment()
+
+        self.active_segment.write(encode_record(record_type, payload))
+        self.active_segment.flush()
+        os.fsync(self.active_segment.fileno())
+
+        if self.active_segment.tell() >= self.segment_size:
+            self.rotate()
+
+    def open_segment(self) -> None:
+        seg_name = f"segment_{self.next_segment_i:08d}.spool"
+        self.next_segment_i += 1
+        self.active_segment_path = os.path.join(self.spool_dir, seg_name)
+        self.active_segment = open(self.active_segment_path, "wb")
+        self.active_segment.write(SEGMENT_HEADER.pack(SEGMENT_MAGIC, SEGMENT_VERSION))
+
+    def rotate(self) -> None:
+        """ Closes the active segment, making it available for replay. """
+        if self.active_segment is None:
+            return
+
+        self.active_segment.close()
+        self.closed_segments.append(self.active_segment_path)
+        self.active_segment = None
+        self.active_segment_path = None
+
+    def close(self) -> None:
+        self.rotate()
+
+    # ====== Replay path ======
+    def has_pending(self) -> bool:
+        return len(self.closed_segments) > 0 or self.active_segment is not None
+
+    def has_closed_segments(self) -> bool:
+        return len(self.closed_segments) > 0
+
+    def replay(self, push_fn: Callable[[HWSampleBuffer, List[HWWindowMetrics], List[StageMetrics], bytes], None],
+               max_segments: int = None, rotate: bool = True) -> int:
+        """
+            Pushes spooled records with push_fn, oldest first. Returns the number of replayed records.
+            push_fn must have committed a record when it returns.
+            If rotate is False, the active segment is left to be written to and is not replayed.
+            Exceptions raised by push_fn are propagated. The failed record is retried on the next replay.
+        """
+        if rotate:
+            self.rotate()
+
+        n_records = 0
+        n_segments = 0
+        while self.closed_segments and (max_segments is None or n_segments < max_segments):
+            segment_path = self.closed_segments[0]
+            try:
+                for end_offset, *batch in self.read_segment(segment_path, self.replay_offset):
+                    push_fn(*batch)
+                    self.replay_offset = end_offset
+                    self.save_replay_offset(segment_path, end_offset)
+                    n_records += 1
+            except BadSegmentException as err:
+                self.quarantine_segment(segment_path, err)
+            else:
+                os.remove(segment_path)
+            self.closed_segments.pop(0)
+            self.replay_offset = SEGMENT_HEADER.size
+            # A saved offset of a removed segment is ignored, so a crash before this is harmless
+            self.remove_replay_offset()
+            n_segments += 1
+
+        if n_records > 0:
+            log.info("Replayed %s spooled metric records from %s segments", n_records, n_segments)
+        return n_records
+
+    def quarantine_segment(self, segment_path: str, err: "BadSegmentException") -> None:
+        """ Keeps a segment that could not be fully replayed as <segment>.bad, so it is not replayed again. """
+        n_bytes = os.path.getsize(segment_path) - err.offset
+        bad_path = segment_path + BAD_SEGMENT_SUFFIX
+        os.replace(segment_path, bad_path)
+        log.error("%s at offset %s. %s bytes were not replayed, the segment was kept as %s",
+                  err, err.offset, n_bytes, bad_path)
+
+    def load_replay_offset(self) -> int:
+        """ Offset saved by a previous replay of the oldest segment, or the first record if there is none. """
+        try:
+            with open(self.replay_offset_path, "r", encoding="utf-8") as f:
+                progress = json.load(f)
+        except FileNotFoundError:
+            return SEGMENT_HEADER.size
+        except (OSError, ValueError) as err:
+            log.warning("Could not read the spool replay offset (%s). Replaying from the start of the segment.", err)
+            return SEGMENT_HEADER.size
+
+        if self.closed_segments and progress.get("segment") == os.path.basename(self.closed_segments[0]):
+            log.info("Resuming the replay of %s at offset %s", self.closed_segments[0], progress["offset"])
+            return int(progress["offset"])
+        return SEGMENT_HEADER.size
+
+    def save_replay_offset(self, segment_path: str, offset: int) -> None:
+        # Replaced atomically so a crash leaves either the previous or the new offset
+        tmp_path = self.replay_offset_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"segment": os.path.basename(segment_path), "offset": offset}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.replay_offset_path)
+
+    def remove_replay_offset(self) -> None:
+        try:
+            os.remove(self.replay_offset_path)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def read_segment(segment_path: str, start_offset: int):
+        """
+            Yields (end_offset, hw_metrics, hw_windows, stage_metrics, training_records) for each record after start_offset.
+            Raises BadSegmentException at the first byte that cannot be replayed, e.g. a truncated header or a corrupted record.
+        """
+        with open(segment_path, "rb") as f:
+            # A crash right after the segment was created can leave it without a full header
+            header = f.read(SEGMENT_HEADER.size)
+            if len(header) < SEGMENT_HEADER.size:
+                raise BadSegmentException(f"Truncated segment header in {segment_path}", 0)
+            magic, version = SEGMENT_HEADER.unpack(header)
+            if magic != SEGMENT_MAGIC or version not in SUPPORTED_SEGMENT_VERSIONS:
+                raise BadSegmentException(f"Unknown spool segment format in {segment_path}", 0)
+
+            f.seek(start_offset)
+            while True:
+                offset = f.tell()
+                header = f.read(RECORD_HEADER.size)
+                if not header:
+                    return
+                if len(header) < RECORD_HEADER.size:
+                    raise BadSegmentException(f"Truncated record header in {segment_path}", offset)
+
+                payload_len, payload_crc, record_type = RECORD_HEADER.unpack(header)
+                payload = f.read(payload_len)
+                if len(payload) < payload_len or zlib.crc32(payload) != payload_crc:
+                    raise BadSegmentException(f"Truncated or corrupted record in {segment_path}", offset)
+                if record_type not in BATCH_RECORD_TYPES:
+                    raise BadSegmentException(f"Unknown spool record type {record_type} in {segment_path}", offset)
+
+                yield (f.tell(), *decode_batch_record(record_type, payload, version))
+
+    @staticmethod
+    def list_segments(spool_dir: str) -> List[str]:
+        segments = [f for f in os.listdir(spool_dir) if f.startswith("segment_") and f.endswith(".spool")]
+        return [os.path.join(spool_dir, f) for f in sorted(segments)]
+
+    @staticmethod
+    def segment_index(segment_path: str) -> int:
+        return int(os.path.basename(segment_path)[len("segment_"):-len(".spool")])
+
+
+class BadSegmentException(Exception):
+    """ Part of a spool segment cannot be replayed. offset is the first byte that was not replayed. """
+    def __init__(self, message: str, offset: int) -> None:
+        super().__init__(message)
+        self.offset = offset
+
+# Records are also used to ship metric batches to the metric collector
+def encode_record(record_type: int, payload: bytes) -> bytes:
+    return RECORD_HEADER.pack(len(payload), zlib.crc32(payload), record_type) + payload
+
+def encode_batch_records(hw_metrics: HWSampleBuffer, hw_windows: List[HWWindowMetrics],
+                         stage_metrics: List[StageMetrics], training_records: bytes) -> List[Tuple[int, bytes]]:
+    """
+        Encodes a metric batch as (record_type, payload) pairs. Empty parts are skipped.
+        Training records come after the stage metrics, which create the rows they're linked to.
+    """
+    records = []
+    if len(hw_metrics) > 0:
+        records.append((RECORD_HW_METRICS, hw_metrics.to_bytes()))
+    if hw_windows:
+        records.append((RECORD_HW_WINDOWS, json.dumps([encode_hw_window(w) for w in hw_windows]).encode()))
+    if stage_metrics:
+        records.append((RECORD_STAGE_METRICS, json.dumps([encode_stage_metric(sm) for sm in stage_metrics]).encode()))
+    if training_records:
+        records.append((RECORD_TRAINING_METRICS, bytes(training_records)))
+    return records
+
+def decode_batch_record(record_type: int, payload: bytes, segment_version: int = SEGMENT_VERSION) \
+        -> Tuple[HWSampleBuffer, List[HWWindowMetrics], List[StageMetrics], bytes]:
+    hw_metrics, hw_windows, stage_metrics, training_records = HWSampleBuffer(), [], [], b""
+    if record_type == RECORD_HW_METRICS and segment_version == 1:
+        hw_metrics = decode_hw_metrics_v1(payload)
+    elif record_type == RECORD_HW_METRICS:
+        hw_metrics = HWSampleBuffer.from_bytes(payload)
+    elif record_type == RECORD_HW_WINDOWS:
+        hw_windows = [decode_hw_window(w) for w in json.loads(payload)]
+    elif record_type == RECORD_STAGE_METRICS:
+        stage_metrics = [decode_stage_metric(sm) for sm in json.loads(payload)]
+    elif record_type == RECORD_TRAINING_METRICS:
+        training_records = payload
+    return hw_metrics, hw_windows, stage_metrics, training_records
+
+def decode_hw_metrics_v1(payload: bytes) -> HWSampleBuffer:
+    """ Missing values were stored as NaN, as in HWSampleBuffer. """
+    hw_metrics = HWSampleBuffer(len(payload) // HW_METRIC_STRUCT_V1.size)
+    for values in HW_METRIC_STRUCT_V1.iter_unpack(payload):
+        hw_metrics.append(*values)
+    return hw_metrics
+
+def encode_stage_metric(sm: StageMetrics) -> dict:
+    sm_dict = asdict(sm)
+    sm_dict["start_time"] = sm.start_time.isoformat()
+    sm_dict["end_time"] = sm.end_time.isoformat()
+    return sm_dict
+
+def decode_stage_metric(sm_dict: dict) -> StageMetrics:
+    sm_dict["start_time"] = datetime.fromisoformat(sm_dict["start_time"])
+    sm_dict["end_time"] = datetime.fromisoformat(sm_dict["end_time"])
+    return StageMetrics(**sm_dict)
+
+def encode_hw_window(w: HWWindowMetrics) -> dict:
+    w_dict = asdict(w)
+    w_dict["start_time"] = w.start_time.isoformat()
+    w_dict["end_time"] = w.end_time.isoformat()
+    return w_dict
+
+def decode_hw_window(w_dict: dict) -> HWWindowMetrics:
+    w_dict["start_time"] = datetime.fromisoformat(w_dict["start_time"])
+    w_dict["end_time"] = datetime.fromisoformat(w_dict["end_time"])
+    return HWWindowMetrics(**w_dict)
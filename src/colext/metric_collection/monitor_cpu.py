@@ -0,0 +1,50 @@
+import time
+import threading
+from typing import Dict
+
+from colext.common.logger import log
+
+# Threads of the monitoring pipeline are named with this prefix, so their CPU can be told apart
+# from the client's when the metric manager runs in the client process
+MONITOR_THREAD_PREFIX = "colext-"
+
+class MonitorCPUMeter():
+    """
+        Measures the CPU time of the monitoring threads from their per thread CPU clocks.
+
+        Used when the metric manager runs as threads of the client process (monitor_mode = thread),
+        where scraping the client process also measures the monitoring itself.
+        Threads of libraries used by the monitoring (e.g. DB pool workers) are not named and not measured.
+    """
+    def __init__(self) -> None:
+        self.supported = hasattr(time, "pthread_getcpuclockid")
+        if not self.supported:
+            log.warning("Per thread CPU clocks are not available. The CPU of the monitoring threads is not separated.")
+        # Last CPU time seen for each monitoring thread. Kept after a thread exits so the total does not go back
+        self.thread_cpu_s: Dict[threading.Thread, float] = {}
+        self.prev_cpu_s = None
+        self.prev_time_ns = None
+
+    def cpu_time_s(self) -> float:
+        """ CPU time (s) used by the monitoring threads so far. """
+        if not self.supported:
+            return 0.0
+        for thread in threading.enumerate():
+            if not thread.name.startswith(MONITOR_THREAD_PREFIX) or thread.ident is None:
+                continue
+            try:
+                self.thread_cpu_s[thread] = time.clock_gettime(time.pthread_getcpuclockid(thread.ident))
+            except OSError:
+                # The thread exited since it was listed
+                pass
+        return sum(self.thread_cpu_s.values())
+
+    def cpu_util(self) -> float:
+        """ CPU utilization (%) of the monitoring threads since the previous call. 0 on the first call. """
+        current_ns = time.monotonic_ns()
+        cpu_s = self.cpu_time_s()
+        cpu_util = 0.0
+        if self.prev_time_ns is not None and current_ns > self.prev_time_ns:
+            cpu_util = (cpu_s - self.prev_cpu_s) / ((current_ns - self.prev_time_ns) / 1e9) * 100
+        self.prev_cpu_s, self.prev_time_ns = cpu_s, current_ns
+        return cpu_util
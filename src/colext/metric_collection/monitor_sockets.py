@@ -0,0 +1,12 @@
+import os
+from typing import Set
+
+# Inodes of the sockets opened by the monitoring in this process: DB pool connections and the metric collector connection.
+# With monitor_mode = thread, they're sockets of the client process and net_scope = process would count pushing the
+# metrics as client traffic, see net_counters.
+# Only added to and checked for membership, so it's shared between threads without a lock
+MONITOR_SOCKET_INODES: Set[int] = set()
+
+def register_monitor_socket(fd: int) -> None:
+    """ Marks the socket behind fd as one of the monitoring. Bytes it carried before this may still be counted. """
+    MONITOR_SOCKET_INODES.add(os.fstat(fd).st_ino)
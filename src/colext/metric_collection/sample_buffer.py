@@ -0,0 +1,206 @@
+import json
+import math
+import struct
+from array import array
+from datetime import datetime, timezone
+from typing import Iterator, Optional, Tuple
+
+from colext.metric_collection.typing import ProcessMetrics
+
+# (field, array typecode). time is stored as seconds since the epoch
+HW_SAMPLE_FIELDS = (
+    ("time", "d"),
+    ("cpu_util", "d"),
+    ("gpu_util", "d"),
+    ("mem_util", "d"),
+    ("power_consumption", "d"),
+    ("n_bytes_sent", "q"),
+    ("n_bytes_rcvd", "q"),
+    ("net_usage_out", "d"),
+    ("net_usage_in", "d"),
+)
+# Optional per sample details, kept as encoded JSON or None. Stored in jsonb columns
+HW_SAMPLE_INFO_FIELDS = ("cpu_info", "gpu_info")
+# Client stage during the sample: STAGE_IDLE, STAGE_FIT or STAGE_EVAL from stage_ring.
+# Buffers serialized before stages were recorded have STAGE_UNKNOWN
+HW_SAMPLE_STAGE_TYPECODE = "b"
+STAGE_UNKNOWN = -1
+# Disk I/O counters. Stored as doubles so missing values can be NaN
+HW_SAMPLE_IO_FIELDS = ("n_bytes_read", "n_bytes_written", "n_read_ops", "n_write_ops", "n_major_faults", "io_wait_time")
+HW_SAMPLE_IO_TYPECODE = "d"
+# Serialized after the fixed size fields, in the order they were added so older serialized buffers stay readable
+HW_SAMPLE_SERIALIZED_EXTRAS = ("cpu_info", "stage", "gpu_info", *HW_SAMPLE_IO_FIELDS)
+# Typecodes of the extras kept in arrays. The other extras are info fields
+HW_SAMPLE_EXTRA_TYPECODES = {"stage": HW_SAMPLE_STAGE_TYPECODE,
+                             **{field: HW_SAMPLE_IO_TYPECODE for field in HW_SAMPLE_IO_FIELDS}}
+HW_SAMPLE_SIZE = struct.Struct("<I")
+
+class HWSampleBuffer():
+    """
+        Struct-of-arrays buffer for HW samples.
+
+        Each field is kept in a preallocated typed column, so appending a sample does not allocate.
+        Columns double in size if the buffer fills up.
+        Missing float values are stored as NaN.
+        Info fields are kept in lists, as JSON encoded bytes or None.
+        The client stage of each sample is kept in the stage column.
+        Disk I/O counters are kept in HW_SAMPLE_IO_FIELDS columns, NaN if not measured.
+    """
+    def __init__(self, capacity: int = 64) -> None:
+        self.capacity = max(capacity, 1)
+        self.size = 0
+        for field, typecode in HW_SAMPLE_FIELDS:
+            setattr(self, field, array(typecode, [0]) * self.capacity)
+        for field in HW_SAMPLE_INFO_FIELDS:
+            setattr(self, field, [None] * self.capacity)
+        self.stage = array(HW_SAMPLE_STAGE_TYPECODE, [STAGE_UNKNOWN]) * self.capacity
+        for field in HW_SAMPLE_IO_FIELDS:
+            setattr(self, field, array(HW_SAMPLE_IO_TYPECODE, [math.nan]) * self.capacity)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def clear(self) -> None:
+        self.size = 0
+
+    def grow(self) -> None:
+        extra_capacity = max(self.capacity, 1)
+        for field, typecode in HW_SAMPLE_FIELDS:
+            getattr(self, field).extend(array(typecode, [0]) * extra_capacity)
+        for field in HW_SAMPLE_INFO_FIELDS:
+            getattr(self, field).extend([None] * extra_capacity)
+        self.stage.extend(array(HW_SAMPLE_STAGE_TYPECODE, [STAGE_UNKNOWN]) * extra_capacity)
+        for field in HW_SAMPLE_IO_FIELDS:
+            getattr(self, field).extend(array(HW_SAMPLE_IO_TYPECODE, [math.nan]) * extra_capacity)
+        self.capacity += extra_capacity
+
+    def append(self, time_s: float, cpu_util: float, gpu_util: float, mem_util: float, power_consumption: float,
+               n_bytes_sent: int, n_bytes_rcvd: int, net_usage_out: float, net_usage_in: float,
+               cpu_info: Optional[bytes] = None, gpu_info: Optional[bytes] = None,
+               stage: int = STAGE_UNKNOWN, io: Optional[Tuple] = None) -> None:
+        """ io holds the HW_SAMPLE_IO_FIELDS values, None for missing ones """
+        i = self.size
+        if i == self.capacity:
+            self.grow()
+
+        self.time[i] = time_s
+        self.cpu_util[i] = nan_if_none(cpu_util)
+        self.gpu_util[i] = nan_if_none(gpu_util)
+        self.mem_util[i] = nan_if_none(mem_util)
+        self.power_consumption[i] = nan_if_none(power_consumption)
+        self.n_bytes_sent[i] = n_bytes_sent
+        self.n_bytes_rcvd[i] = n_bytes_rcvd
+        self.net_usage_out[i] = nan_if_none(net_usage_out)
+        self.net_usage_in[i] = nan_if_none(net_usage_in)
+        self.cpu_info[i] = cpu_info
+        self.gpu_info[i] = gpu_info
+        self.stage[i] = stage
+        for field, value in zip(HW_SAMPLE_IO_FIELDS, io or ()):
+            getattr(self, field)[i] = nan_if_none(value)
+        self.size = i + 1
+
+    def append_metric(self, m: ProcessMetrics, stage: int = STAGE_UNKNOWN) -> None:
+        self.append(m.time, m.cpu_util, m.gpu_util, m.mem_util, m.power_consumption,
+                    m.n_bytes_sent, m.n_bytes_rcvd, m.net_usage_out, m.net_usage_in,
+                    encode_info(m.cpu_info), encode_info(m.gpu_info), stage,
+                    (m.n_bytes_read, m.n_bytes_written, m.n_read_ops, m.n_write_ops, m.n_major_faults, m.io_wait_time))
+
+    def append_from(self, other: "HWSampleBuffer", i: int) -> None:
+        """ Appends the i-th sample of other. """
+        if self.size == self.capacity:
+            self.grow()
+
+        for field, _ in HW_SAMPLE_FIELDS:
+            getattr(self, field)[self.size] = getattr(other, field)[i]
+        for field in HW_SAMPLE_INFO_FIELDS:
+            getattr(self, field)[self.size] = getattr(other, field)[i]
+        self.stage[self.size] = other.stage[i]
+        for field in HW_SAMPLE_IO_FIELDS:
+            getattr(self, field)[self.size] = getattr(other, field)[i]
+        self.size += 1
+
+    def column(self, field: str) -> memoryview:
+        """ Contiguous view over the filled part of a column. """
+        return memoryview(getattr(self, field))[:self.size]
+
+    def iter_rows(self) -> Iterator[Tuple]:
+        """
+            Yields samples as tuples following HW_SAMPLE_FIELDS, HW_SAMPLE_INFO_FIELDS, stage and HW_SAMPLE_IO_FIELDS,
+            with time as a datetime, NaN as None, info fields as JSON text and STAGE_UNKNOWN as None.
+        """
+        for i in range(self.size):
+            yield (datetime.fromtimestamp(self.time[i], timezone.utc),
+                   none_if_nan(self.cpu_util[i]), none_if_nan(self.gpu_util[i]),
+                   none_if_nan(self.mem_util[i]), none_if_nan(self.power_consumption[i]),
+                   self.n_bytes_sent[i], self.n_bytes_rcvd[i],
+                   none_if_nan(self.net_usage_out[i]), none_if_nan(self.net_usage_in[i]),
+                   *(decode_info_text(getattr(self, field)[i]) for field in HW_SAMPLE_INFO_FIELDS),
+                   none_if_unknown_stage(self.stage[i]),
+                   *(none_if_nan(getattr(self, field)[i]) for field in HW_SAMPLE_IO_FIELDS))
+
+    def to_bytes(self) -> bytes:
+        """
+            Serializes the filled part of the buffer: sample count followed by each column in native byte order.
+            HW_SAMPLE_SERIALIZED_EXTRAS follow. Array extras as their column.
+            Info fields as an array of lengths (-1 for None) and the concatenated values.
+        """
+        parts = [HW_SAMPLE_SIZE.pack(self.size), *(self.column(field) for field, _ in HW_SAMPLE_FIELDS)]
+        for field in HW_SAMPLE_SERIALIZED_EXTRAS:
+            if field in HW_SAMPLE_EXTRA_TYPECODES:
+                parts.append(self.column(field))
+                continue
+            values = getattr(self, field)[:self.size]
+            parts.append(array("i", [-1 if v is None else len(v) for v in values]))
+            parts.extend(v for v in values if v is not None)
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HWSampleBuffer":
+        (size,) = HW_SAMPLE_SIZE.unpack_from(data)
+        buffer = cls(size)
+        offset = HW_SAMPLE_SIZE.size
+        for field, typecode in HW_SAMPLE_FIELDS:
+            col = array(typecode)
+            n_bytes = size * col.itemsize
+            col.frombytes(data[offset:offset + n_bytes])
+            offset += n_bytes
+            setattr(buffer, field, col)
+        # Older buffers end before some of the extras, which keep their defaults
+        for field in HW_SAMPLE_SERIALIZED_EXTRAS:
+            if offset >= len(data):
+                break
+            if field in HW_SAMPLE_EXTRA_TYPECODES:
+                col = array(HW_SAMPLE_EXTRA_TYPECODES[field])
+                n_bytes = size * col.itemsize
+                col.frombytes(data[offset:offset + n_bytes])
+                offset += n_bytes
+                setattr(buffer, field, col)
+                continue
+            lengths = array("i")
+            n_bytes = size * lengths.itemsize
+            lengths.frombytes(data[offset:offset + n_bytes])
+            offset += n_bytes
+            values = getattr(buffer, field)
+            for i, length in enumerate(lengths):
+                if length >= 0:
+                    values[i] = bytes(data[offset:offset + length])
+                    offset += length
+        buffer.size = size
+        buffer.capacity = size
+        return buffer
+
+
+def nan_if_none(value):
+    return math.nan if value is None else value
+
+def none_if_nan(value):
+    return None if math.isnan(value) else value
+
+def none_if_unknown_stage(stage: int) -> Optional[int]:
+    return None if stage == STAGE_UNKNOWN else stage
+
+def encode_info(info: Optional[dict]) -> Optional[bytes]:
+    return None if info is None else json.dumps(info, separators=(",", ":")).encode()
+
+def decode_info_text(info: Optional[bytes]) -> Optional[str]:
+    return None if info is None else info.decode()
@@ -0,0 +1,127 @@
+import math
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Upper bounds of the histogram buckets
+# Durations: 10us to 100s, 4 buckets per decade
+DURATION_BUCKETS_S = tuple(10 ** (e / 4) for e in range(-20, 9))
+# Sizes and counts: powers of 2 up to 1M
+SIZE_BUCKETS = tuple(float(2 ** e) for e in range(21))
+
+# Histograms
+SCRAPE_INTERVAL = "scrape_interval_s"
+SCRAPE_JITTER = "scrape_jitter_s"
+SCRAPE_TOTAL_COST = "scrape_total_s"
+SCRAPE_PSUTIL_COST = "scrape_psutil_s"
+SCRAPE_PROCFS_COST = "scrape_procfs_s"
+SCRAPE_PROCESS_TREE_COST = "scrape_process_tree_s"
+PROCESS_TREE_SIZE = "process_tree_size"
+SCRAPE_JTOP_COST = "scrape_jtop_s"
+SCRAPE_RAPL_COST = "scrape_rapl_s"
+SCRAPE_SMART_PLUG_COST = "scrape_smart_plug_s"
+SCRAPE_THERMAL_COST = "scrape_thermal_s"
+FLUSHER_QUEUE_DEPTH = "flusher_queue_depth"
+HW_BATCH_SIZE = "hw_batch_size"
+PUSH_LATENCY = "push_latency_s"
+# CPU time used by the metric manager over the whole job
+MONITOR_CPU = "monitor_cpu_s"
+# Counters
+MISSED_SCRAPES = "missed_scrapes"
+MISSED_PUSHES = "missed_pushes"
+DEFERRED_SUBMITS = "deferred_submits"
+SPOOLED_BATCHES = "spooled_batches"
+FAILED_BATCHES = "failed_batches"
+DROPPED_STAGE_EVENTS = "dropped_stage_events"
+DROPPED_TRAINING_RECORDS = "dropped_training_records"
+TELEMETRY_COUNTERS = (MISSED_SCRAPES, MISSED_PUSHES, DEFERRED_SUBMITS, SPOOLED_BATCHES, FAILED_BATCHES, DROPPED_STAGE_EVENTS,
+                      DROPPED_TRAINING_RECORDS)
+
+class Histogram():
+    """
+        Fixed bucket histogram. Recording a value does not allocate.
+        Values above the last bound are counted in an overflow bucket.
+    """
+    __slots__ = ("upper_bounds", "bucket_counts", "n_values", "sum", "min", "max")
+
+    def __init__(self, upper_bounds: Sequence[float]) -> None:
+        self.upper_bounds = upper_bounds
+        self.bucket_counts = [0] * (len(upper_bounds) + 1)
+        self.n_values = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def record(self, value: float) -> None:
+        self.bucket_counts[bisect_left(self.upper_bounds, value)] += 1
+        self.n_values += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """ Upper bound of the bucket holding the q quantile, clamped to the observed range. """
+        if self.n_values == 0:
+            return None
+
+        rank = q * self.n_values
+        cumulative = 0
+        for bucket_i, count in enumerate(self.bucket_counts):
+            cumulative += count
+            if cumulative >= rank and count > 0:
+                break
+        bound = self.upper_bounds[bucket_i] if bucket_i < len(self.upper_bounds) else self.max
+        return min(max(bound, self.min), self.max)
+
+class MonitoringTelemetry():
+    """
+        Histograms and counters describing the monitoring pipeline itself.
+
+        Each metric must be recorded from a single thread. Metrics from different threads
+        share the registry without locking, so recording stays in the order of a microsecond.
+    """
+    def __init__(self) -> None:
+        self.histograms: Dict[str, Histogram] = {}
+        # Counters are reported even if they stay at 0
+        self.counters: Dict[str, int] = dict.fromkeys(TELEMETRY_COUNTERS, 0)
+
+    def record_duration(self, name: str, duration_s: float) -> None:
+        self.get_histogram(name, DURATION_BUCKETS_S).record(duration_s)
+
+    def record_size(self, name: str, size: int) -> None:
+        self.get_histogram(name, SIZE_BUCKETS).record(size)
+
+    def increment(self, name: str, n: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def get_histogram(self, name: str, upper_bounds: Sequence[float]) -> Histogram:
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            # setdefault keeps the first histogram if two threads race here
+            histogram = self.histograms.setdefault(name, Histogram(upper_bounds))
+        return histogram
+
+    def summary_rows(self) -> List[Tuple]:
+        """
+            Returns (metric, n_values, sum, min, max, p50, p90, p99, bucket_bounds, bucket_counts) rows.
+            Counters only set n_values.
+        """
+        rows = []
+        for name, h in sorted(self.histograms.items()):
+            if h.n_values == 0:
+                continue
+            rows.append((name, h.n_values, h.sum, h.min, h.max,
+                         h.quantile(0.5), h.quantile(0.9), h.quantile(0.99),
+                         list(h.upper_bounds), list(h.bucket_counts)))
+        for name, value in sorted(self.counters.items()):
+            rows.append((name, value, None, None, None, None, None, None, None, None))
+        return rows
+
+    def log_summary(self, log_fn) -> None:
+        for name, h in sorted(self.histograms.items()):
+            if h.n_values > 0:
+                log_fn("%s: n = %s, avg = %.4g, p50 = %.4g, p99 = %.4g, max = %.4g", name, h.n_values,
+                       h.sum / h.n_values, h.quantile(0.5), h.quantile(0.99), h.max)
+        for name, value in sorted(self.counters.items()):
+            log_fn("%s: %s", name, value)
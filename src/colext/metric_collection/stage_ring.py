@@ -0,0 +1,202 @@
+import math
+import struct
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from datetime import datetime, timezone
+from typing import Iterator, Optional, Tuple
+
+from colext.common.logger import log
+from colext.metric_collection.sample_buffer import nan_if_none, none_if_nan
+from colext.metric_collection.typing import StageMetrics
+
+# Between stages
+STAGE_IDLE = 0
+STAGE_FIT = 1
+STAGE_EVAL = 2
+STAGE_NAMES = {STAGE_IDLE: "idle", STAGE_FIT: "fit", STAGE_EVAL: "eval"}
+
+EVENT_STAGE_START = 1
+EVENT_STAGE_END = 2
+
+# write_idx, read_idx, n_dropped. Indexes grow monotonically and wrap around the slots
+RING_HEADER = struct.Struct("<QQQ")
+# event, stage, cdb_id, round_id, start_time, end_time, loss, num_examples, accuracy,
+# data_wait_time, compute_time, data_wait_fraction, set_params_time, get_params_time, params_bytes_in, params_bytes_out
+# Times are seconds since the epoch and missing floats are stored as NaN. Missing sizes are stored as -1
+STAGE_RECORD = struct.Struct("<BBiidddqddddddqq")
+
+DEFAULT_RING_CAPACITY = 256
+
+class SharedRecordRing():
+    """
+        Single-producer single-consumer ring of fixed-layout records in shared memory.
+
+        The producer packs records into the slots and the consumer unpacks them, so records cross
+        processes without pickling. If the ring is full, new records are dropped and counted.
+        Once closed, puts are ignored, drains are empty and n_dropped keeps the count read at close.
+    """
+    def __init__(self, record: struct.Struct, capacity: int) -> None:
+        self.record = record
+        self.capacity = capacity
+        size = RING_HEADER.size + capacity * record.size
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        RING_HEADER.pack_into(self.shm.buf, 0, 0, 0, 0)
+        # Set by close. With the metric manager in a thread, both sides share this object
+        self.closed_n_dropped: Optional[int] = None
+
+    # Only required by the spawn start method. The ring is inherited as is with fork
+    def __getstate__(self):
+        return (self.record.format, self.capacity, self.shm.name)
+
+    def __setstate__(self, state):
+        record_format, self.capacity, shm_name = state
+        self.record = struct.Struct(record_format)
+        self.shm = shared_memory.SharedMemory(name=shm_name)
+        self.closed_n_dropped = None
+
+    @property
+    def closed(self) -> bool:
+        return self.closed_n_dropped is not None
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed_n_dropped = self.n_dropped
+        self.shm.close()
+
+    def unlink(self) -> None:
+        """ Frees the shared memory. Must be called once by the process that created the ring. """
+        self.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            # Already unlinked, e.g. clean_up called more than once
+            pass
+
+    @property
+    def n_dropped(self) -> int:
+        if self.closed:
+            return self.closed_n_dropped
+        return RING_HEADER.unpack_from(self.shm.buf, 0)[2]
+
+    # ====== Producer ======
+    def put(self, *record) -> int:
+        """ Returns the number of records in the ring after the put, or -1 if the record was dropped. """
+        if self.closed:
+            return -1
+        buf = self.shm.buf
+        write_idx, read_idx, n_dropped = RING_HEADER.unpack_from(buf, 0)
+        if write_idx - read_idx >= self.capacity:
+            struct.pack_into("<Q", buf, 16, n_dropped + 1)
+            return -1
+
+        self.record.pack_into(buf, self.slot_offset(write_idx), *record)
+        # Only write_idx is owned by the producer. Leave the rest of the header untouched
+        struct.pack_into("<Q", buf, 0, write_idx + 1)
+        return write_idx + 1 - read_idx
+
+    # ====== Consumer ======
+    def drain_records(self) -> Iterator[Tuple]:
+        """ Yields every record in the ring, oldest first, as unpacked tuples. """
+        if self.closed:
+            return
+        buf = self.shm.buf
+        write_idx, read_idx, _ = RING_HEADER.unpack_from(buf, 0)
+        while read_idx < write_idx:
+            record = self.record.unpack_from(buf, self.slot_offset(read_idx))
+            read_idx += 1
+            # Only read_idx is owned by the consumer
+            struct.pack_into("<Q", buf, 8, read_idx)
+            yield record
+
+    def drain_bytes(self) -> bytes:
+        """ Returns the records in the ring, oldest first, as they are packed. """
+        if self.closed:
+            return b""
+        buf = self.shm.buf
+        write_idx, read_idx, _ = RING_HEADER.unpack_from(buf, 0)
+        chunks = []
+        while read_idx < write_idx:
+            # Copy up to the end of the ring at once
+            n_records = min(write_idx - read_idx, self.capacity - read_idx % self.capacity)
+            offset = self.slot_offset(read_idx)
+            chunks.append(bytes(buf[offset:offset + n_records * self.record.size]))
+            read_idx += n_records
+        struct.pack_into("<Q", buf, 8, read_idx)
+        return b"".join(chunks)
+
+    def slot_offset(self, idx: int) -> int:
+        return RING_HEADER.size + (idx % self.capacity) * self.record.size
+
+class StageMetricRing(SharedRecordRing):
+    """
+        Ring of stage events shared by the decorated client (producer) and the metric manager (consumer).
+
+        The producer sends a wakeup byte over a pipe after each record. The metric manager
+        waits on the pipe and drains the ring, so stage boundaries are seen within milliseconds.
+        The wakeup pipe also orders the record writes before the consumer reads them.
+    """
+    def __init__(self, capacity: int = DEFAULT_RING_CAPACITY) -> None:
+        super().__init__(STAGE_RECORD, capacity)
+        self.wake_reader, self.wake_writer = mp.Pipe(duplex=False)
+
+    def __getstate__(self):
+        return (super().__getstate__(), self.wake_reader, self.wake_writer)
+
+    def __setstate__(self, state):
+        ring_state, self.wake_reader, self.wake_writer = state
+        super().__setstate__(ring_state)
+
+    # ====== Producer ======
+    def put_stage_start(self, stage: int, cdb_id: int, round_id: int, start_time: datetime) -> None:
+        self.put(EVENT_STAGE_START, stage, cdb_id, round_id, start_time.timestamp(),
+                 math.nan, math.nan, 0, math.nan, math.nan, math.nan, math.nan, math.nan, math.nan, -1, -1)
+
+    def put_stage_end(self, stage: int, st: StageMetrics) -> None:
+        self.put(EVENT_STAGE_END, stage, st.cdb_id, st.round_id,
+                 st.start_time.timestamp(), st.end_time.timestamp(),
+                 float(nan_if_none(st.loss)), st.num_examples, float(nan_if_none(st.accuracy)),
+                 float(nan_if_none(st.data_wait_time)), float(nan_if_none(st.compute_time)),
+                 float(nan_if_none(st.data_wait_fraction)),
+                 float(nan_if_none(st.set_params_time)), float(nan_if_none(st.get_params_time)),
+                 -1 if st.params_bytes_in is None else st.params_bytes_in,
+                 -1 if st.params_bytes_out is None else st.params_bytes_out)
+
+    def put(self, *record) -> int:
+        n_records = super().put(*record)
+        if n_records < 0:
+            if not self.closed:
+                log.error("Stage metric ring is full. Dropping stage event.")
+            return n_records
+        self.notify()
+        return n_records
+
+    def notify(self) -> None:
+        """ Wakes up the consumer. """
+        self.wake_writer.send_bytes(b"\0")
+
+    # ====== Consumer ======
+    def wait(self, timeout: Optional[float]) -> bool:
+        """ Waits up to timeout seconds for new events. Returns True if there might be events to drain. """
+        return self.wake_reader.poll(timeout)
+
+    def drain(self) -> Iterator[Tuple[int, int, StageMetrics]]:
+        """
+            Yields (event, stage, stage_metrics) for every record in the ring, oldest first.
+            For EVENT_STAGE_START records, only cdb_id, round_id and start_time are set.
+        """
+        # Consume the wakeups before reading the ring so that records written after this point trigger a new one
+        while self.wake_reader.poll(0):
+            self.wake_reader.recv_bytes()
+
+        for (event, stage, cdb_id, round_id, start_ts, end_ts, loss, num_examples, accuracy,
+             data_wait_time, compute_time, data_wait_fraction, set_params_time, get_params_time,
+             params_bytes_in, params_bytes_out) in self.drain_records():
+            end_time = None if math.isnan(end_ts) else datetime.fromtimestamp(end_ts, timezone.utc)
+            st = StageMetrics(cdb_id, round_id, datetime.fromtimestamp(start_ts, timezone.utc), end_time,
+                              none_if_nan(loss), num_examples, none_if_nan(accuracy),
+                              none_if_nan(data_wait_time), none_if_nan(compute_time), none_if_nan(data_wait_fraction),
+                              none_if_nan(set_params_time), none_if_nan(get_params_time),
+                              None if params_bytes_in < 0 else params_bytes_in,
+                              None if params_bytes_out < 0 else params_bytes_out)
+            yield event, stage, st
@@ -0,0 +1,292 @@
+import math
+import struct
+import functools
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Optional, Tuple
+
+from colext.metric_collection.deadline_scheduler import AnchoredClock
+from colext.metric_collection.stage_ring import SharedRecordRing, StageMetricRing
+
+RECORD_EPOCH = 1
+RECORD_BATCH = 2
+# kind, round_id, epoch_number, batch_number, start_time, end_time, frwd_pass_time, bkwd_pass_time, opt_step_time, loss
+# Times are seconds since the epoch and missing floats are stored as NaN. batch_number is -1 for epochs
+TRAINING_RECORD = struct.Struct("<Biiidddddd")
+
+DEFAULT_TRAINING_RING_CAPACITY = 4096
+
+class TrainingMetricRing(SharedRecordRing):
+    """
+        Ring of epoch and batch records written by the training loop of the client.
+
+        Records do not wake up the metric manager, which drains them with the stage events.
+        Only once the ring is half full it is woken up through the stage ring, so long stages
+        with many batches don't fill the ring.
+    """
+    def __init__(self, stage_ring: StageMetricRing, capacity: int = DEFAULT_TRAINING_RING_CAPACITY) -> None:
+        super().__init__(TRAINING_RECORD, capacity)
+        self.stage_ring = stage_ring
+
+    def __getstate__(self):
+        return (super().__getstate__(), self.stage_ring)
+
+    def __setstate__(self, state):
+        ring_state, self.stage_ring = state
+        super().__setstate__(ring_state)
+
+    def put(self, *record) -> int:
+        n_records = super().put(*record)
+        if n_records == self.capacity // 2:
+            self.stage_ring.notify()
+        return n_records
+
+class TrainingRecorder():
+    """
+        Times the epochs and batches of the stage the client is running and writes them to the training ring.
+
+        Batch times are marks on the batch: start_time when the batch is handed to the training loop,
+        then the end of the forward pass, backward pass and optimizer step, and end_time when the next batch
+        is requested or the batch is closed. Only every batch_sampling-th batch of an epoch is recorded,
+        which bounds the recording cost at high batch rates. Batches are numbered whether they are recorded or not.
+        Batches outside of an epoch open one, which is closed with the batch iterator or the stage.
+        Nothing is recorded outside of fit and evaluate.
+
+        Independently of sampling, the recorder sums the time monitor_batches waits for the next batch
+        (data wait) and the time spent in the loop body (compute) over the stage, see input_pipeline_times.
+    """
+    def __init__(self, ring: TrainingMetricRing, clock: AnchoredClock, batch_sampling: int) -> None:
+        self.ring = ring
+        self.clock = clock
+        self.batch_sampling = batch_sampling
+        self.round_id = None
+        self.reset_stage()
+
+    def reset_stage(self) -> None:
+        self.next_epoch_number = 0
+        self.epoch_number = None
+        self.epoch_start = math.nan
+        self.batch_number = 0
+        self.in_batch = False
+        self.batch_recorded = False
+        self.wait_start = None
+        self.n_batches = 0
+        self.data_wait_time = 0.0
+        self.compute_time = 0.0
+
+    # ====== Stages ======
+    def start_stage(self, round_id: int) -> None:
+        self.round_id = round_id
+        self.reset_stage()
+
+    def end_stage(self) -> None:
+        if self.round_id is None:
+            return
+        self.end_epoch()
+        self.round_id = None
+
+    def input_pipeline_times(self) -> Tuple[Optional[float], Optional[float], Optional[float]]:
+        """
+            Returns the data wait and compute time (s) of the last stage and the fraction of
+            their sum spent waiting for data. None if no batches were recorded in the stage.
+        """
+        if self.n_batches == 0:
+            return None, None, None
+        total_time = self.data_wait_time + self.compute_time
+        data_wait_fraction = self.data_wait_time / total_time if total_time > 0 else 0.0
+        return self.data_wait_time, self.compute_time, data_wait_fraction
+
+    # ====== Epochs ======
+    def start_epoch(self) -> None:
+        if self.round_id is None:
+            return
+        self.end_epoch()
+        self.epoch_number = self.next_epoch_number
+        self.next_epoch_number += 1
+        self.epoch_start = self.clock.time_s()
+        self.batch_number = 0
+
+    def end_epoch(self) -> None:
+        if self.epoch_number is None:
+            return
+        self.end_batch()
+        self.ring.put(RECORD_EPOCH, self.round_id, self.epoch_number, -1, self.epoch_start, self.clock.time_s(),
+                      math.nan, math.nan, math.nan, math.nan)
+        self.epoch_number = None
+
+    # ====== Batches ======
+    def wait_batch(self) -> None:
+        """ Called before requesting the next batch from the data pipeline. Ends the current batch. """
+        if self.round_id is None:
+            return
+        batch_end = self.end_batch()
+        self.wait_start = batch_end if batch_end is not None else self.clock.time_s()
+
+    def start_batch(self) -> None:
+        if self.round_id is None:
+            return
+        self.end_batch()
+        if self.epoch_number is None:
+            self.start_epoch()
+
+        self.in_batch = True
+        self.batch_start = self.clock.time_s()
+        if self.wait_start is not None:
+            self.data_wait_time += self.batch_start - self.wait_start
+            self.wait_start = None
+        self.batch_recorded = self.batch_sampling > 0 and self.batch_number % self.batch_sampling == 0
+        if self.batch_recorded:
+            self.frwd_time = self.bkwd_time = self.opt_time = self.loss = math.nan
+
+    def end_batch(self) -> Optional[float]:
+        """ Returns the end time of the batch, or None if no batch is open. """
+        if not self.in_batch:
+            return None
+        batch_end = self.clock.time_s()
+        self.compute_time += batch_end - self.batch_start
+        self.n_batches += 1
+        if self.batch_recorded:
+            self.ring.put(RECORD_BATCH, self.round_id, self.epoch_number, self.batch_number,
+                          self.batch_start, batch_end, self.frwd_time, self.bkwd_time, self.opt_time, self.loss)
+        self.batch_number += 1
+        self.in_batch = False
+        self.batch_recorded = False
+        return batch_end
+
+    def mark_forward(self) -> None:
+        if self.batch_recorded:
+            self.frwd_time = self.clock.time_s()
+
+    def mark_backward(self) -> None:
+        if self.batch_recorded:
+            self.bkwd_time = self.clock.time_s()
+
+    def mark_optimizer_step(self) -> None:
+        if self.batch_recorded:
+            self.opt_time = self.clock.time_s()
+
+    def record_loss(self, loss) -> None:
+        if self.batch_recorded:
+            self.loss = float(loss)
+
+# Set by MonitorFlwrClient. The functions below do nothing outside of the CoLExT environment
+_recorder: Optional[TrainingRecorder] = None
+
+def set_recorder(recorder: Optional[TrainingRecorder]) -> None:
+    global _recorder
+    _recorder = recorder
+
+def monitor_epochs(iterable: Iterable) -> Iterable:
+    """ Wraps an iterable of epochs, e.g. range(n_epochs). Each iteration is recorded as an epoch. """
+    if _recorder is None:
+        return iterable
+    return _monitored_epochs(_recorder, iterable)
+
+def _monitored_epochs(recorder: TrainingRecorder, iterable: Iterable) -> Iterator:
+    try:
+        for item in iterable:
+            recorder.start_epoch()
+            yield item
+            recorder.end_epoch()
+    finally:
+        # The loop was left with break or an exception
+        recorder.end_epoch()
+
+def monitor_batches(iterable: Iterable) -> Iterable:
+    """
+        Wraps an iterable of batches, e.g. a DataLoader. Each iteration is recorded as a batch.
+        A batch starts when it's handed to the training loop and ends when the next one is requested.
+        The time between the request and the hand over, including starting the iterator, is data wait.
+        If no epoch is open, the iteration is recorded as an epoch.
+    """
+    if _recorder is None:
+        return iterable
+    return _monitored_batches(_recorder, iterable)
+
+def _monitored_batches(recorder: TrainingRecorder, iterable: Iterable) -> Iterator:
+    opened_epoch = recorder.round_id is not None and recorder.epoch_number is None
+    if opened_epoch:
+        recorder.start_epoch()
+    try:
+        recorder.wait_batch()
+        for item in iterable:
+            recorder.start_batch()
+            yield item
+            recorder.wait_batch()
+    finally:
+        recorder.end_batch()
+        # Time after the last batch is not data wait
+        recorder.wait_start = None
+        if opened_epoch:
+            recorder.end_epoch()
+
+@contextmanager
+def training_epoch():
+    """ Records the enclosed code as an epoch. """
+    recorder = _recorder
+    if recorder is None:
+        yield
+        return
+    recorder.start_epoch()
+    try:
+        yield
+    finally:
+        recorder.end_epoch()
+
+@contextmanager
+def training_batch():
+    """ Records the enclosed code as a batch. """
+    recorder = _recorder
+    if recorder is None:
+        yield
+        return
+    recorder.start_batch()
+    try:
+        yield
+    finally:
+        recorder.end_batch()
+
+def mark_forward() -> None:
+    """ Marks the end of the forward pass of the current batch. """
+    if _recorder is not None:
+        _recorder.mark_forward()
+
+def mark_backward() -> None:
+    """ Marks the end of the backward pass of the current batch. """
+    if _recorder is not None:
+        _recorder.mark_backward()
+
+def mark_optimizer_step() -> None:
+    """ Marks the end of the optimizer step of the current batch. """
+    if _recorder is not None:
+        _recorder.mark_optimizer_step()
+
+def record_batch_loss(loss) -> None:
+    """
+        Records the loss of the current batch. Tensors are converted with float(),
+        which waits for the GPU, so this is only done for recorded batches.
+    """
+    if _recorder is not None:
+        _recorder.record_loss(loss)
+
+def monitor_model(model, optimizer=None) -> None:
+    """
+        Marks the batch phases with PyTorch hooks, so the training loop only needs monitor_batches.
+        The end of the forward pass is marked by a forward hook on model. With an optimizer,
+        the backward pass ends when optimizer.step is called and the step ends when it returns.
+        Does not import torch. On GPUs, marks are taken when the CPU finished queuing the work.
+    """
+    if _recorder is None:
+        return
+
+    model.register_forward_hook(lambda module, inputs, output: mark_forward())
+    if optimizer is not None:
+        step = optimizer.step
+
+        # wraps keeps the attributes LR schedulers set on step
+        @functools.wraps(step)
+        def monitored_step(*args, **kwargs):
+            mark_backward()
+            result = step(*args, **kwargs)
+            mark_optimizer_step()
+            return result
+        optimizer.step = monitored_step
@@ -2,6 +2,7 @@
 
 from dataclasses import dataclass
 from datetime import datetime
+from typing import Dict, Optional
 
 @dataclass
 class StageMetrics:
@@ -13,12 +14,22 @@ class StageMetrics:
     loss: float
     num_examples: int
     accuracy: float
+    # Input pipeline of the training loop, measured by monitor_batches. None if it's not monitored
+    data_wait_time: Optional[float] = None # seconds
+    compute_time: Optional[float] = None # seconds
+    data_wait_fraction: Optional[float] = None
+    # Model parameter handling in the stage. Times are seconds spent in set_parameters and get_parameters
+    set_params_time: Optional[float] = None
+    get_params_time: Optional[float] = None
+    # Size of the received and returned parameters (Bytes). None if they're not NumPy arrays
+    params_bytes_in: Optional[int] = None
+    params_bytes_out: Optional[int] = None
 
 @dataclass
 class ProcessMetrics:
     """Class to keep track of process metrics."""
 
-    time: datetime
+    time: float # seconds since the epoch
     cpu_util: float
     gpu_util: float
     mem_util: float
@@ -29,5 +40,30 @@ class ProcessMetrics:
     net_usage_out: float
     net_usage_in: float
 
-    # temperature: int # jtop.temperature.temp
-    # fan_speed: int # jtop.fan.speed
\ No newline at end of file
+    # Source specific details stored in the cpu_info and gpu_info jsonb columns
+    # e.g. RAPL domains, clock frequencies, temperatures and throttling state
+    cpu_info: Optional[dict] = None
+    gpu_info: Optional[dict] = None
+
+    # Disk I/O of the monitored processes, cumulative since monitoring started. None if not measured
+    n_bytes_read: Optional[int] = None
+    n_bytes_written: Optional[int] = None
+    n_read_ops: Optional[int] = None
+    n_write_ops: Optional[int] = None
+    n_major_faults: Optional[int] = None
+    io_wait_time: Optional[float] = None # seconds
+
+@dataclass
+class HWWindowMetrics:
+    """Class to keep track of HW metrics aggregated over a time window."""
+
+    # Power is integrated from start_time, the time of the sample preceding the window
+    start_time: datetime
+    end_time: datetime
+    n_samples: int
+    energy: float # power_consumption units * s
+
+    # gauge field -> {"min": .., "mean": .., "max": .., "last": ..}
+    stats: Dict[str, Dict[str, Optional[float]]]
+    # counter field -> last value
+    counters: Dict[str, int]
@@ -1,7 +1,11 @@
 from .experiment_dispatcher import launch_experiment
 from .metric_retriever import retrieve_metrics
+from .spool_replayer import replay_spool
+from .metric_collector import run_collector
 
 __all__ = [
     "launch_experiment",
     "retrieve_metrics",
+    "replay_spool",
+    "run_collector",
 ]
\ No newline at end of file
@@ -1,6 +1,7 @@
 import argparse
 import logging
 import os
+import re
 import sys
 import yaml
 from colext.common.logger import log
@@ -71,7 +72,24 @@ def apply_config_defaults(config_dict):
         "live_metrics": True,
         "push_interval": 10,
         "scraping_interval": 0.3,
+        # Per stage scraping intervals. 0 uses scraping_interval
+        "fit_scraping_interval": 0,
+        "eval_scraping_interval": 0,
+        "idle_scraping_interval": 0,
+        "high_res_sampling": False,
+        "scrape_backend": "psutil", # psutil/procfs
+        "scraper": "auto", # auto or <scraper>[:<arg>][+<component>[@<interval>]]..., e.g. general+rapl@1+smart_plug
+        "process_tree": False,
+        "net_scope": "namespace", # namespace/process/interface:<name>
+        "smart_plug_interval": 0, # 0 polls the smart plug every scraping_interval
+        "thermal_interval": 5, # 0 disables thermal telemetry
         "measure_self": False,
+        "monitor_mode": "process", # process/thread
+        "push_mode": "copy", # copy/insert
+        "agg_window": 0, # 0 disables aggregation
+        "raw_retention": "all", # all/fit/none
+        "batch_sampling": 1, # Record every n-th batch of the monitored training loop. 0 only records epochs
+        "collector_address": "", # Empty to push directly to the DB. host:port, unix:<path> or local (local_py deployer only)
     } # intervals are in seconds
     add_config_defaults(config_dict, "monitoring", monitoring_defaults)
 
@@ -114,6 +132,83 @@ def validate_config(config_dict):
         print_err(f"deployer can  only be set to {valid_deployers}")
         sys.exit(1)
 
+    valid_monitor_modes = ["process", "thread"]
+    if config_dict["monitoring"]["monitor_mode"] not in valid_monitor_modes:
+        print_err(f"monitoring.monitor_mode can  only be set to {valid_monitor_modes}")
+        sys.exit(1)
+
+    valid_push_modes = ["copy", "insert"]
+    if config_dict["monitoring"]["push_mode"] not in valid_push_modes:
+        print_err(f"monitoring.push_mode can  only be set to {valid_push_modes}")
+        sys.exit(1)
+
+    if not isinstance(config_dict["monitoring"]["high_res_sampling"], bool):
+        print_err("monitoring.high_res_sampling must be True or False")
+        sys.exit(1)
+
+    valid_scrape_backends = ["psutil", "procfs"]
+    if config_dict["monitoring"]["scrape_backend"] not in valid_scrape_backends:
+        print_err(f"monitoring.scrape_backend can  only be set to {valid_scrape_backends}")
+        sys.exit(1)
+
+    valid_scrapers = ["general", "jetson", "synthetic", "replay"]
+    valid_scraper_components = ["rapl", "smart_plug"]
+    scraper = config_dict["monitoring"]["scraper"]
+    scraper_pattern = rf"({'|'.join(valid_scrapers)})(:[^+]+)?(\+({'|'.join(valid_scraper_components)})(@\d+(\.\d+)?)?)*"
+    if not isinstance(scraper, str) or (scraper != "auto" and not re.fullmatch(scraper_pattern, scraper)):
+        print_err("monitoring.scraper can only be set to auto or <scraper>[:<arg>][+<component>[@<interval>]]... "
+                  f"with scrapers {valid_scrapers} and components {valid_scraper_components}")
+        sys.exit(1)
+    if scraper.startswith("replay") and not scraper.startswith("replay:"):
+        print_err("monitoring.scraper: the replay scraper needs a recording, replay:<hw_metrics.csv>")
+        sys.exit(1)
+
+    if not isinstance(config_dict["monitoring"]["process_tree"], bool):
+        print_err("monitoring.process_tree must be True or False")
+        sys.exit(1)
+
+    net_scope = config_dict["monitoring"]["net_scope"]
+    if not isinstance(net_scope, str) or \
+       (net_scope not in ["namespace", "process"] and not re.fullmatch(r"interface:[^\s:/]+", net_scope)):
+        print_err("monitoring.net_scope can only be set to namespace, process or interface:<name>")
+        sys.exit(1)
+
+    for stage in ["fit", "eval", "idle"]:
+        stage_interval = config_dict["monitoring"][f"{stage}_scraping_interval"]
+        if not isinstance(stage_interval, (int, float)) or stage_interval < 0:
+            print_err(f"monitoring.{stage}_scraping_interval must be a number of seconds >= 0")
+            sys.exit(1)
+
+    if not isinstance(config_dict["monitoring"]["thermal_interval"], (int, float)) or config_dict["monitoring"]["thermal_interval"] < 0:
+        print_err("monitoring.thermal_interval must be a number of seconds >= 0")
+        sys.exit(1)
+
+    if not isinstance(config_dict["monitoring"]["smart_plug_interval"], (int, float)) or config_dict["monitoring"]["smart_plug_interval"] < 0:
+        print_err("monitoring.smart_plug_interval must be a number of seconds >= 0")
+        sys.exit(1)
+
+    if not isinstance(config_dict["monitoring"]["agg_window"], (int, float)) or config_dict["monitoring"]["agg_window"] < 0:
+        print_err("monitoring.agg_window must be a number of seconds >= 0")
+        sys.exit(1)
+
+    valid_raw_retentions = ["all", "fit", "none"]
+    if config_dict["monitoring"]["raw_retention"] not in valid_raw_retentions:
+        print_err(f"monitoring.raw_retention can  only be set to {valid_raw_retentions}")
+        sys.exit(1)
+
+    if config_dict["monitoring"]["raw_retention"] != "all" and config_dict["monitoring"]["agg_window"] == 0:
+        print_err("monitoring.raw_retention can only be restricted when monitoring.agg_window is set")
+        sys.exit(1)
+
+    batch_sampling = config_dict["monitoring"]["batch_sampling"]
+    if not isinstance(batch_sampling, int) or isinstance(batch_sampling, bool) or batch_sampling < 0:
+        print_err("monitoring.batch_sampling must be an integer >= 0")
+        sys.exit(1)
+
+    if config_dict["monitoring"]["collector_address"] == "local" and config_dict["colext"]["deployer"] != "local_py":
+        print_err("monitoring.collector_address can only be set to 'local' with the local_py deployer")
+        sys.exit(1)
+
     valid_log_levels = ["ERROR", "INFO", "DEBUG"]
     if config_dict["colext"]["log_level"] not in valid_log_levels:
         print_err(f"colext.log_level can  only be set to {valid_log_levels}")
@@ -0,0 +1,45 @@
+import signal
+import argparse
+import logging
+import threading
+
+from colext.common.logger import log
+from colext.metric_collection.collector_client import DEFAULT_COLLECTOR_PORT
+from colext.metric_collection.collector_server import MetricCollector
+from colext.metric_collection.db_writer import VALID_PUSH_MODES
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Collect metrics from CoLExT clients and write them to the DB in bulk')
+    parser.add_argument('-l', '--listen', type=str, default=f"0.0.0.0:{DEFAULT_COLLECTOR_PORT}",
+                        help="Address to listen on: <host>:<port> or unix:<path>")
+    parser.add_argument('-m', '--push_mode', type=str, default="copy", choices=VALID_PUSH_MODES, help="How HW metrics are written to the DB")
+    parser.add_argument('-w', '--n_writers', type=int, default=2, help="Number of DB writer threads and connections")
+    parser.add_argument('-f', '--flush_interval', type=float, default=0.5, help="Time in seconds to coalesce client batches before writing")
+    parser.add_argument('-r', '--report_interval', type=float, default=10, help="Interval in seconds between ingest throughput reports")
+    parser.add_argument('-d', '--dry_run', action='store_true', help="Acknowledge batches without writing them to the DB")
+    parser.add_argument('-q', '--quarantine_dir', type=str, default="collector_quarantine",
+                        help="Where batches that repeatedly fail to be written are set aside")
+
+    args = parser.parse_args()
+    return args
+
+def run_collector():
+    log.setLevel(logging.INFO)
+    args = get_args()
+
+    collector = MetricCollector(args.listen, args.push_mode, args.n_writers,
+                                flush_interval_s=args.flush_interval,
+                                report_interval_s=args.report_interval,
+                                dry_run=args.dry_run,
+                                quarantine_dir=args.quarantine_dir)
+    collector.start()
+
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+    stop_event.wait()
+
+    collector.stop()
+
+if __name__ == "__main__":
+    run_collector()
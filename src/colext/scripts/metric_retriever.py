@@ -1,4 +1,5 @@
 import sys
+import json
 import argparse
 import logging
 import os
@@ -11,6 +12,12 @@ import pandas as pd
 from pandas import DataFrame
 from colext.common.logger import log
 from colext.exp_deployers.db_utils import DBUtils, JobNotFoundException
+from colext.metric_collection.sample_buffer import HW_SAMPLE_IO_FIELDS
+
+IO_COUNTER_COLS = list(HW_SAMPLE_IO_FIELDS)
+# Disk I/O of the client processes while training or evaluating, see add_io_metrics
+IO_SUMMARY_COLS = ["Disk read (MiB)", "Disk written (MiB)", "Read ops/s", "Write ops/s", "Major faults",
+                   "I/O wait (%)", "I/O bound"]
 
 def get_args():
     parser = argparse.ArgumentParser(description='Retrieve metrics from CoLExt')
@@ -56,6 +63,9 @@ def retrieve_metrics():
         print("Generating client summary timings")
         client_rounds_summary = gen_cr_metric_summary(jd)
 
+        print("Generating throttling report")
+        gen_throttling_report(jd)
+
     with change_cwd(f"{output_dir}/plots", mkdir=True):
         print("Creating plots")
         plot_summary_data(client_rounds_summary)
@@ -74,6 +84,7 @@ def read_metric_files():
     round_metrics: DataFrame = pd.read_csv("round_metrics.csv")
     cr_timings: DataFrame = pd.read_csv("client_round_metrics.csv")
     hw_metrics: DataFrame = pd.read_csv("hw_metrics.csv")
+    hw_windows: DataFrame = pd.read_csv("hw_metric_windows.csv")
     # FIX: Can we set the index to time?
 
     # Parse dates
@@ -82,6 +93,15 @@ def read_metric_files():
     cr_timings["start_time"]    = pd.to_datetime(cr_timings["start_time"],    format='ISO8601')
     cr_timings["end_time"]      = pd.to_datetime(cr_timings["end_time"],      format='ISO8601')
     hw_metrics["time"]          = pd.to_datetime(hw_metrics["time"],          format='ISO8601')
+    hw_windows["start_time"]    = pd.to_datetime(hw_windows["start_time"],    format='ISO8601')
+    hw_windows["end_time"]      = pd.to_datetime(hw_windows["end_time"],      format='ISO8601')
+
+    if not hw_windows.empty:
+        # Clients with aggregated metrics are analysed from their windows
+        agg_clients = hw_windows["client_id"].unique()
+        hw_metrics = pd.concat([hw_metrics[~hw_metrics["client_id"].isin(agg_clients)],
+                                hw_metrics_from_windows(hw_windows)], ignore_index=True)
+        hw_metrics.sort_values(by=["client_id", "time"], inplace=True, ignore_index=True)
 
     job_data = {
         "client_info": client_info,
@@ -92,6 +112,24 @@ def read_metric_files():
 
     return job_data
 
+def hw_metrics_from_windows(hw_windows):
+    """
+        Converts HW metric windows into hw_metrics rows, one per window end.
+        Mean power is the window energy over the time since the previous window end,
+        so the energy computed in gen_clean_hw_metrics matches the one measured on the device.
+    """
+    gauge_cols = ["cpu_util", "gpu_util", "mem_util", "power_consumption", "net_usage_out", "net_usage_in"]
+    counter_cols = ["n_bytes_sent", "n_bytes_rcvd", *IO_COUNTER_COLS]
+    rows = hw_windows[["client_id", "end_time"] + [f"{c}_mean" for c in gauge_cols] + counter_cols]
+    rows = rows.rename(columns={"end_time": "time", **{f"{c}_mean": c for c in gauge_cols}})
+
+    # The energy of each client's first window is integrated from its start_time
+    first_windows = hw_windows.sort_values("end_time").groupby("client_id").head(1)
+    first_rows = rows.loc[first_windows.index].copy()
+    first_rows["time"] = first_windows["start_time"]
+
+    return pd.concat([first_rows, rows], ignore_index=True)
+
 def gen_clean_hw_metrics(jd):
     round_metrics, hw_metrics, cr_timings = jd["round_metrics"], jd["hw_metrics"], jd["cr_timings"]
     # Clip HW measurements to start at first round and finish at last round
@@ -120,6 +158,11 @@ def gen_clean_hw_metrics(jd):
             client_i_hw.loc[client_i_hw.index[start_i:end_i + 1], "round_number"] = row["round_number"]
             client_i_hw.loc[client_i_hw.index[start_i:end_i + 1], "stage"] = row["stage"]
 
+        # Samples tagged with the client stage on the device don't need the client round timings
+        if client_i_hw["client_stage"].notna().all():
+            client_i_hw["state"] = np.where(client_i_hw["client_stage"] == "IDLE", "idle", "run")
+            return client_i_hw
+
         client_i_cr = cr_timings[cr_timings["client_id"] == client_id]
         for _, row in client_i_cr.iterrows():
             start_i = time_values.searchsorted(row["start_time"], side="left")
@@ -141,6 +184,8 @@ def gen_clean_hw_metrics(jd):
     hw_metrics["n_bytes_rcvd"] = hw_metrics["n_bytes_rcvd"] / 1024 / 1024 # MiB
     hw_metrics["net_usage_out"] = hw_metrics["net_usage_out"] / 1024 / 1024  # MiB/s
     hw_metrics["net_usage_in"] =  hw_metrics["net_usage_in"]  / 1024 / 1024 # MiB/s
+    hw_metrics["n_bytes_read"] = hw_metrics["n_bytes_read"] / 1024 / 1024 # MiB
+    hw_metrics["n_bytes_written"] = hw_metrics["n_bytes_written"] / 1024 / 1024 # MiB
 
     hw_metrics["round_number"] = hw_metrics["round_number"].astype("Int64")
 
@@ -155,11 +200,42 @@ def gen_clean_hw_metrics(jd):
         "n_bytes_rcvd": "Rcvd (MiB)",
         "net_usage_out": "Upload (MiB/s)",
         "net_usage_in":  "Download (MiB/s)",
+        "n_bytes_read": "Disk read (MiB)",
+        "n_bytes_written": "Disk written (MiB)",
+        "n_read_ops": "Read ops",
+        "n_write_ops": "Write ops",
+        "n_major_faults": "Major faults",
+        "io_wait_time": "I/O wait (s)",
         }, inplace=True)
 
     hw_metrics.to_csv('hw_metrics_cleaned.csv', index=False)
     return hw_metrics
 
+def add_io_metrics(cr_group, hw_group, start_i, end_i):
+    """
+        Adds the IO_SUMMARY_COLS of the samples between start_i and end_i to cr_group.
+        I/O wait (%) is the time the client processes waited for block I/O over the elapsed time.
+        It adds up over processes, so it can exceed 100%.
+        The stage is I/O bound if the processes spent more time waiting for block I/O than running on a CPU.
+    """
+    def calc_diff(col):
+        return hw_group.iloc[end_i][col] - hw_group.iloc[start_i][col]
+
+    elapsed_s = (hw_group.index[end_i] - hw_group.index[start_i]).total_seconds()
+    if elapsed_s <= 0:
+        cr_group.loc[:, IO_SUMMARY_COLS] = np.nan
+        return
+
+    cr_group["Disk read (MiB)"] = calc_diff("Disk read (MiB)")
+    cr_group["Disk written (MiB)"] = calc_diff("Disk written (MiB)")
+    cr_group["Read ops/s"] = calc_diff("Read ops") / elapsed_s
+    cr_group["Write ops/s"] = calc_diff("Write ops") / elapsed_s
+    cr_group["Major faults"] = calc_diff("Major faults")
+    io_wait_s = calc_diff("I/O wait (s)")
+    cpu_s = hw_group.iloc[start_i:end_i + 1]["CPU Util (%)"].mean() / 100 * elapsed_s
+    cr_group["I/O wait (%)"] = io_wait_s / elapsed_s * 100
+    cr_group["I/O bound"] = io_wait_s > cpu_s if not np.isnan(io_wait_s) else np.nan
+
 def gen_cr_metric_summary(jd):
     round_metrics, hw_metrics, cr_timings, client_info = jd["round_metrics"], jd["hw_metrics_cleaned"], jd["cr_timings"], jd["client_info"]
 
@@ -178,7 +254,8 @@ def gen_cr_metric_summary(jd):
                             ["Energy training (J)",
                             "Energy in round (J)",
                             "Data rcvd in round (MiB)",
-                            "Data sent in round (MiB)"]] = np.nan
+                            "Data sent in round (MiB)",
+                            *IO_SUMMARY_COLS]] = np.nan
         else:
             hw_group.set_index("time", inplace=True)
 
@@ -189,6 +266,7 @@ def gen_cr_metric_summary(jd):
             start_i = hw_group.index.get_indexer(cr_group["start_time"], method="nearest")[0]
             end_i = hw_group.index.get_indexer(cr_group["end_time"], method="nearest")[0]
             cr_group["Energy training (J)"] = calc_diff(start_i, end_i, "Energy (KJ)") * 1000 # (KJ -> J)
+            add_io_metrics(cr_group, hw_group, start_i, end_i)
 
             df = hw_group.iloc[start_i:end_i].groupby(["round_number", "stage"])[
                 ["CPU Util (%)", "GPU Util (%)", "Mem Util (MiB)", "Upload (MiB/s)", "Download (MiB/s)"]
@@ -210,6 +288,13 @@ def gen_cr_metric_summary(jd):
         .apply(get_scoped_metrics, include_groups=True).reset_index(drop=True)
 
     crs['EDP (J*s)'] = crs['Energy training (J)'] * crs['Training time (s)']
+    # Clients that mostly wait for data need more DataLoader workers or faster storage
+    crs.rename(columns={"data_wait_time": "Data wait (s)", "compute_time": "Compute time (s)",
+                        "data_wait_fraction": "Data wait fraction"}, inplace=True)
+    # Separates the cost of handling the model from training and communication
+    crs.rename(columns={"set_params_time": "Set parameters (s)", "get_params_time": "Get parameters (s)"}, inplace=True)
+    crs["Parameters in (MiB)"] = crs.pop("params_bytes_in") / 1024 / 1024
+    crs["Parameters out (MiB)"] = crs.pop("params_bytes_out") / 1024 / 1024
 
     crs['Training time ps (ms)'] = crs.apply(lambda row: row["Training time (s)"] / row["num_examples"] * 1000, axis=1)
     crs['Energy ps (mJ)'] = crs.apply(lambda row: row["Energy training (J)"] / row["num_examples"] * 1000 , axis=1)
@@ -223,6 +308,81 @@ def gen_cr_metric_summary(jd):
 
     return crs
 
+def thermal_samples(hw_metrics):
+    """ One row per HW sample with thermal details: client_id, time, cpu_freq_mhz, max_temp_c, throttled, gpu_freq_mhz """
+    rows = []
+    for client_id, time, cpu_info, gpu_info in hw_metrics[["client_id", "time", "cpu_info", "gpu_info"]].itertuples(index=False):
+        if not isinstance(cpu_info, str):
+            continue
+        cpu_info = json.loads(cpu_info)
+        if "throttle" not in cpu_info:
+            # No thermal reading in this sample
+            continue
+        gpu_info = json.loads(gpu_info) if isinstance(gpu_info, str) else {}
+
+        core_freqs = [f for f in cpu_info.get("freq_mhz", []) if f is not None]
+        temps = list(cpu_info.get("temp_c", {}).values())
+        gpu_freq = gpu_info.get("freq_mhz")
+        if gpu_freq is None and gpu_info.get("devfreq_mhz"):
+            gpu_freq = max(gpu_info["devfreq_mhz"].values())
+        rows.append((client_id, time,
+                     np.mean(core_freqs) if core_freqs else np.nan,
+                     max(temps) if temps else np.nan,
+                     cpu_info["throttle"]["throttled"],
+                     gpu_freq if gpu_freq is not None else np.nan))
+    return pd.DataFrame(rows, columns=["client_id", "time", "cpu_freq_mhz", "max_temp_c", "throttled", "gpu_freq_mhz"])
+
+def gen_throttling_report(jd):
+    """
+        Relates the training time per sample of each client round to the clock frequencies,
+        temperatures and throttling measured during the round.
+        Writes the per round values to throttling_report.csv and, for each client, the correlation
+        between the training time per sample and each thermal metric to throttling_correlation.csv.
+    """
+    hw_metrics, cr_timings = jd["hw_metrics"], jd["cr_timings"]
+    if "cpu_info" not in hw_metrics or "gpu_info" not in hw_metrics:
+        print("No thermal telemetry found. Skipping throttling report")
+        return None
+    thermal = thermal_samples(hw_metrics)
+    if thermal.empty:
+        print("No thermal telemetry found. Skipping throttling report")
+        return None
+
+    report_rows = []
+    for _, cr in cr_timings[cr_timings["stage"] == "FIT"].iterrows():
+        client_thermal = thermal[(thermal["client_id"] == cr["client_id"]) &
+                                 (thermal["time"] >= cr["start_time"]) & (thermal["time"] <= cr["end_time"])]
+        training_time = (cr["end_time"] - cr["start_time"]).total_seconds()
+        report_rows.append({
+            "client_id": cr["client_id"],
+            "round_number": cr["round_number"],
+            "Training time ps (ms)": training_time / cr["num_examples"] * 1000 if cr["num_examples"] else np.nan,
+            "n_thermal_samples": len(client_thermal),
+            "Avg CPU freq (MHz)": client_thermal["cpu_freq_mhz"].mean(),
+            "Avg GPU freq (MHz)": client_thermal["gpu_freq_mhz"].mean(),
+            "Max temp (C)": client_thermal["max_temp_c"].max(),
+            "Throttled (%)": client_thermal["throttled"].mean() * 100 if len(client_thermal) else np.nan,
+        })
+    report = pd.DataFrame(report_rows)
+    report.to_csv("throttling_report.csv", index=False)
+
+    thermal_cols = ["Avg CPU freq (MHz)", "Avg GPU freq (MHz)", "Max temp (C)", "Throttled (%)"]
+    correlation_rows = []
+    for client_id, client_report in report.groupby("client_id"):
+        client_report = client_report[client_report["n_thermal_samples"] > 0]
+        row = {"client_id": client_id, "n_rounds": len(client_report)}
+        for col in thermal_cols:
+            # Correlation is undefined for fewer than 3 rounds or constant values
+            valid = client_report[["Training time ps (ms)", col]].dropna()
+            corr = np.nan
+            if len(valid) >= 3 and valid[col].nunique() > 1 and valid["Training time ps (ms)"].nunique() > 1:
+                corr = valid["Training time ps (ms)"].corr(valid[col])
+            row[f"corr {col}"] = corr
+        correlation_rows.append(row)
+    correlation = pd.DataFrame(correlation_rows)
+    correlation.to_csv("throttling_correlation.csv", index=False)
+    return correlation
+
 def plot_cir_metrics(df, interest_cols, save_file, row="dev_type"):
     """Convert to long format and print facetgrid with metrics"""
     id_vars=[row, "stage"]
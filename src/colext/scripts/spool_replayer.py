@@ -0,0 +1,58 @@
+import os
+import sys
+import argparse
+import logging
+
+from colext.common.logger import log
+from colext.common.vars import SPOOL_PATH
+from colext.exp_deployers.db_utils import DBUtils
+from colext.metric_collection.db_writer import HWMetricWriter, write_hw_windows, write_stage_metrics, write_training_metrics
+from colext.metric_collection.metric_spool import MetricSpool
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Push metrics left in a CoLExT spool dir to the DB')
+    parser.add_argument('-s', '--spool_dir', type=str, default=SPOOL_PATH, help="Spool dir containing client_<id> dirs")
+    parser.add_argument('-c', '--client_db_id', type=int, default=None, help="Only replay metrics from this client")
+
+    args = parser.parse_args()
+    return args
+
+def replay_spool():
+    log.setLevel(logging.INFO)
+    args = get_args()
+
+    if not os.path.isdir(args.spool_dir):
+        print(f"Could not find spool dir '{args.spool_dir}'")
+        sys.exit(1)
+
+    client_dirs = sorted(d for d in os.listdir(args.spool_dir) if d.startswith("client_"))
+    if args.client_db_id is not None:
+        client_dirs = [d for d in client_dirs if d == f"client_{args.client_db_id}"]
+
+    if not client_dirs:
+        print("No spooled metrics found.")
+        return
+
+    db = DBUtils()
+    for client_dir in client_dirs:
+        client_db_id = int(client_dir[len("client_"):])
+        hw_metric_writer = HWMetricWriter(client_db_id)
+
+        def push_spooled_metrics(hw_metrics, hw_windows, stage_metrics, training_records):
+            # Committed as a whole before the spool saves its replay offset
+            with db.DB_CONNECTION.transaction():
+                if hw_metrics:
+                    hw_metric_writer.write(db.DB_CONNECTION, hw_metrics)
+                if hw_windows:
+                    write_hw_windows(db.DB_CONNECTION, client_db_id, hw_windows)
+                if stage_metrics:
+                    write_stage_metrics(db.DB_CONNECTION, stage_metrics)
+                if training_records:
+                    write_training_metrics(db.DB_CONNECTION, client_db_id, training_records)
+
+        print(f"Replaying spooled metrics for client {client_db_id}")
+        spool_path = os.path.join(args.spool_dir, client_dir)
+        MetricSpool(spool_path).replay(push_spooled_metrics)
+
+        if not os.listdir(spool_path):
+            os.rmdir(spool_path)
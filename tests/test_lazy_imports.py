@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+# Only imported once monitoring starts and the component using them is created
+HEAVY_MODULES = ("flwr", "psycopg", "psycopg_pool", "psutil", "tapo", "jtop")
+
+def loaded_heavy_modules(code: str, tmp_path) -> list:
+    """ Runs code in a fresh interpreter outside of the CoLExT environment and returns the heavy modules it imported. """
+    # Stand-in for jtop, so importing it is seen even where it's not installed
+    (tmp_path / "jtop.py").write_text("jtop = None\n")
+    env = dict(os.environ, COLEXT_ENV="False", PYTHONPATH=os.pathsep.join([str(tmp_path), os.environ.get("PYTHONPATH", "")]))
+    script = textwrap.dedent(code) + textwrap.dedent(f"""
+        import sys
+        print("heavy modules:" + ",".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))
+    """)
+    out = subprocess.run([sys.executable, "-c", script], env=env, check=True, capture_output=True, text=True).stdout
+    heavy_modules = out.strip().splitlines()[-1][len("heavy modules:"):]
+    return [m for m in heavy_modules.split(",") if m]
+
+def test_import_colext_is_lazy(tmp_path):
+    code = """
+        from colext import MonitorFlwrClient, MonitorFlwrStrategy, monitor_batches
+        MonitorFlwrClient(type("Client", (), {}))
+        MonitorFlwrStrategy(type("Strategy", (), {}))
+    """
+    assert loaded_heavy_modules(code, tmp_path) == []
+
+def test_scrapers_do_not_import_jtop_on_jetsons(tmp_path):
+    code = """
+        import os
+        # Jetson kernels have tegra in their release
+        uname = os.uname()
+        os.uname = lambda: os.uname_result((uname.sysname, uname.nodename, uname.release + "-tegra", uname.version, uname.machine))
+        import colext.metric_collection.hw_scraper.scrapers.scraper_registry
+    """
+    loaded = loaded_heavy_modules(code, tmp_path)
+    assert "jtop" not in loaded and "tapo" not in loaded
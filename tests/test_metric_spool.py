@@ -0,0 +1,89 @@
+import json
+import math
+import os
+
+from colext.metric_collection.metric_spool import (
+    BAD_SEGMENT_SUFFIX, HW_METRIC_STRUCT_V1, RECORD_HW_METRICS, RECORD_STAGE_METRICS, SEGMENT_HEADER, SEGMENT_MAGIC,
+    MetricSpool, encode_record,
+)
+from colext.metric_collection.sample_buffer import HWSampleBuffer
+
+def hw_batch(time_s: float) -> HWSampleBuffer:
+    hw_metrics = HWSampleBuffer()
+    hw_metrics.append(time_s, 10.0, None, 100.0, None, 1, 2, None, None)
+    return hw_metrics
+
+def spool_batches(spool_dir: str, times_s) -> None:
+    spool = MetricSpool(spool_dir)
+    for time_s in times_s:
+        spool.write(hw_batch(time_s), [], [], b"")
+    spool.close()
+
+def replayed_times(spool_dir: str) -> list:
+    times_s = []
+    def push_fn(hw_metrics, hw_windows, stage_metrics, training_records):
+        times_s.extend(hw_metrics.time[:len(hw_metrics)])
+    MetricSpool(spool_dir).replay(push_fn)
+    return times_s
+
+def test_replay_removes_consumed_segments(tmp_path):
+    spool_batches(str(tmp_path), [1.0, 2.0])
+    assert replayed_times(str(tmp_path)) == [1.0, 2.0]
+    assert os.listdir(tmp_path) == []
+
+def test_segment_without_header_is_quarantined(tmp_path):
+    # Left by a crash right after the segment was created
+    (tmp_path / "segment_00000000.spool").write_bytes(b"")
+    spool_batches(str(tmp_path), [1.0])
+
+    assert replayed_times(str(tmp_path)) == [1.0]
+    assert sorted(os.listdir(tmp_path)) == ["segment_00000000.spool" + BAD_SEGMENT_SUFFIX]
+
+def test_corrupted_record_is_quarantined(tmp_path):
+    spool_batches(str(tmp_path), [1.0, 2.0, 3.0])
+    segment_path = tmp_path / "segment_00000000.spool"
+    data = bytearray(segment_path.read_bytes())
+    # Records of the same batch have the same size. Flip the last byte of the second one
+    record_size = (len(data) - SEGMENT_HEADER.size) // 3
+    data[SEGMENT_HEADER.size + 2 * record_size - 1] ^= 0xFF
+    segment_path.write_bytes(bytes(data))
+
+    assert replayed_times(str(tmp_path)) == [1.0]
+    bad_path = tmp_path / ("segment_00000000.spool" + BAD_SEGMENT_SUFFIX)
+    assert os.listdir(tmp_path) == [bad_path.name]
+    assert bad_path.read_bytes() == bytes(data)
+    # Quarantined segments are not replayed again
+    assert replayed_times(str(tmp_path)) == []
+
+def test_unknown_segment_version_is_kept(tmp_path):
+    spool_batches(str(tmp_path), [1.0])
+    segment_path = tmp_path / "segment_00000000.spool"
+    data = bytearray(segment_path.read_bytes())
+    data[4] = 255
+    segment_path.write_bytes(bytes(data))
+
+    assert replayed_times(str(tmp_path)) == []
+    assert os.listdir(tmp_path) == ["segment_00000000.spool" + BAD_SEGMENT_SUFFIX]
+
+def test_replays_version_1_segments(tmp_path):
+    hw_rows = HW_METRIC_STRUCT_V1.pack(1.0, 10.0, math.nan, 100.0, 5.0, 1, 2, math.nan, math.nan) \
+        + HW_METRIC_STRUCT_V1.pack(2.0, 20.0, math.nan, 200.0, math.nan, 3, 4, 0.5, 0.25)
+    # Stage metrics of version 1 segments have none of the fields added since
+    stage_metric = {"cdb_id": 1, "round_id": 2, "start_time": "2024-01-01T00:00:00+00:00",
+                    "end_time": "2024-01-01T00:00:01+00:00", "loss": 0.5, "num_examples": 10, "accuracy": 0.9}
+    (tmp_path / "segment_00000000.spool").write_bytes(
+        SEGMENT_HEADER.pack(SEGMENT_MAGIC, 1)
+        + encode_record(RECORD_HW_METRICS, hw_rows)
+        + encode_record(RECORD_STAGE_METRICS, json.dumps([stage_metric]).encode()))
+
+    hw_rows, stage_metrics = [], []
+    def push_fn(hw_metrics, hw_windows, stage_metrics_, training_records):
+        hw_rows.extend(row[:9] for row in hw_metrics.iter_rows())
+        stage_metrics.extend(stage_metrics_)
+    MetricSpool(str(tmp_path)).replay(push_fn)
+
+    assert [row[0].timestamp() for row in hw_rows] == [1.0, 2.0]
+    assert [row[1:] for row in hw_rows] == [(10.0, None, 100.0, 5.0, 1, 2, None, None),
+                                           (20.0, None, 200.0, None, 3, 4, 0.5, 0.25)]
+    assert [(sm.round_id, sm.loss, sm.data_wait_time) for sm in stage_metrics] == [(2, 0.5, None)]
+    assert os.listdir(tmp_path) == []
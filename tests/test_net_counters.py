@@ -0,0 +1,91 @@
+import os
+import socket
+import subprocess
+import sys
+
+import pytest
+
+from colext.metric_collection.hw_scraper.scrapers.net_counters import SocketNetCounters
+
+def tcp_pair():
+    """ Connected (client, server) TCP sockets of this process. """
+    listener = socket.create_server(("127.0.0.1", 0))
+    client = socket.create_connection(listener.getsockname())
+    server, _ = listener.accept()
+    listener.close()
+    return client, server
+
+def send(sock: socket.socket, peer: socket.socket, n_bytes: int) -> None:
+    sock.sendall(b"x" * n_bytes)
+    received = 0
+    while received < n_bytes:
+        received += len(peer.recv(n_bytes - received))
+
+@pytest.fixture
+def sock_diag():
+    try:
+        counters = SocketNetCounters(os.getpid())
+    except OSError as err:
+        pytest.skip(f"sock_diag is not available ({err})")
+    counters.close()
+
+@pytest.fixture
+def sockets(sock_diag):
+    client, server = tcp_pair()
+    monitor, monitor_server = tcp_pair()
+    yield client, server, monitor, monitor_server
+    for sock in (client, server, monitor, monitor_server):
+        sock.close()
+
+def test_counts_the_sockets_of_the_process(sockets):
+    client, server, _, _ = sockets
+    counters = SocketNetCounters(os.getpid())
+    sent, recv = counters.read_net()
+    send(client, server, 1000)
+    # Both ends are sockets of this process
+    assert counters.read_net() == (sent + 1000, recv + 1000)
+    counters.close()
+
+def test_monitor_sockets_are_left_out(sockets):
+    client, server, monitor, monitor_server = sockets
+    monitor_inodes = {os.fstat(monitor.fileno()).st_ino, os.fstat(monitor_server.fileno()).st_ino}
+    counters = SocketNetCounters(os.getpid(), monitor_inodes)
+    monitor_only = SocketNetCounters(os.getpid(), monitor_inodes, monitor_only=True)
+    sent, recv = counters.read_net()
+    monitor_sent, monitor_recv = monitor_only.read_net()
+
+    send(client, server, 1000)
+    send(monitor, monitor_server, 300)
+    assert counters.read_net() == (sent + 1000, recv + 1000)
+    assert monitor_only.read_net() == (monitor_sent + 300, monitor_recv + 300)
+    counters.close()
+    monitor_only.close()
+
+def test_counts_the_sockets_of_other_processes(sock_diag):
+    listener = socket.create_server(("127.0.0.1", 0))
+    # Connects, then sends 500 bytes once told to on stdin
+    code = ("import socket, sys; s = socket.create_connection(%r); sys.stdin.readline(); s.sendall(b'x' * 500); sys.stdin.readline()"
+            % (listener.getsockname(),))
+    child = subprocess.Popen([sys.executable, "-c", code], stdin=subprocess.PIPE)
+    try:
+        child_conn, _ = listener.accept()
+        counters = SocketNetCounters(os.getpid())
+        tree_counters = SocketNetCounters(os.getpid(), get_pids=lambda: (os.getpid(), child.pid))
+        sent, recv = counters.read_net()
+        tree_sent, tree_recv = tree_counters.read_net()
+
+        child.stdin.write(b"\n")
+        child.stdin.flush()
+        received = 0
+        while received < 500:
+            received += len(child_conn.recv(500 - received))
+        # The child's end of the connection is only counted with the child's sockets
+        assert counters.read_net() == (sent, recv + 500)
+        assert tree_counters.read_net() == (tree_sent + 500, tree_recv + 500)
+        counters.close()
+        tree_counters.close()
+        child_conn.close()
+    finally:
+        child.kill()
+        child.wait()
+        listener.close()
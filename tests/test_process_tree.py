@@ -0,0 +1,23 @@
+import os
+import subprocess
+import sys
+import time
+
+from colext.metric_collection.hw_scraper.scrapers.process_tree import ProcessTree
+
+def test_scrape_reports_totals_and_each_process():
+    child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    try:
+        tree = ProcessTree(os.getpid())
+        cpu_util, rss, pss = tree.scrape(time.time())
+        info = tree.last_scrape_info(pss)
+
+        assert set(info["processes"]) == {str(os.getpid()), str(child.pid)}
+        assert cpu_util == sum(p["cpu_util"] for p in info["processes"].values())
+        assert rss == sum(p["rss"] for p in info["processes"].values())
+        assert info["pss"] == pss == sum(p["pss"] for p in info["processes"].values())
+        # PSS splits the shared pages between the processes mapping them
+        assert 0 < pss <= rss
+    finally:
+        child.kill()
+        child.wait()
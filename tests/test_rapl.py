@@ -0,0 +1,92 @@
+import pytest
+
+from colext.metric_collection.hw_scraper.scrapers import rapl
+from colext.metric_collection.hw_scraper.scrapers.rapl import RaplReader
+
+MAX_ENERGY_UJ = 1_000_000
+
+def make_zone(powercap_root, zone: str, name: str, energy_uj: int) -> None:
+    zone_path = powercap_root / zone
+    zone_path.mkdir()
+    (zone_path / "name").write_text(f"{name}\n")
+    (zone_path / "max_energy_range_uj").write_text(f"{MAX_ENERGY_UJ}\n")
+    set_energy(powercap_root, zone, energy_uj)
+
+def set_energy(powercap_root, zone: str, energy_uj: int) -> None:
+    # Rewrites the same file, so the descriptor kept open by the reader sees the new value
+    (powercap_root / zone / "energy_uj").write_text(f"{energy_uj}\n")
+
+@pytest.fixture
+def powercap_root(tmp_path):
+    """ Fake powercap tree with a package, its core subzone, the platform zone and an mmio mirror of the package. """
+    make_zone(tmp_path, "intel-rapl:0", "package-0", 100_000)
+    make_zone(tmp_path, "intel-rapl:0:0", "core", 50_000)
+    make_zone(tmp_path, "intel-rapl:1", "psys", 200_000)
+    make_zone(tmp_path, "intel-rapl-mmio:0", "package-0", 100_000)
+    return tmp_path
+
+@pytest.fixture
+def clock(monkeypatch):
+    """ Monotonic clock of the reader, advanced by the test. """
+    now_ns = [0]
+    monkeypatch.setattr(rapl.time, "monotonic_ns", lambda: now_ns[0])
+    return now_ns
+
+def test_finds_zones(powercap_root, clock):
+    assert RaplReader.is_available(str(powercap_root))
+    reader = RaplReader(str(powercap_root))
+    assert [d.name for d in reader.domains] == ["package-0", "package-0/core", "psys"]
+    assert [d.is_package for d in reader.domains] == [True, False, False]
+    reader.close()
+
+def test_power_from_energy_deltas(powercap_root, clock):
+    reader = RaplReader(str(powercap_root))
+    set_energy(powercap_root, "intel-rapl:0", 300_000)
+    set_energy(powercap_root, "intel-rapl:0:0", 150_000)
+    set_energy(powercap_root, "intel-rapl:1", 600_000)
+    clock[0] += 2 * 10**9
+
+    package_power_mw, domains = reader.update()
+    assert package_power_mw == 100.0
+    assert domains == {
+        "package-0": {"energy_uj": 200_000, "power_mw": 100.0},
+        "package-0/core": {"energy_uj": 100_000, "power_mw": 50.0},
+        "psys": {"energy_uj": 400_000, "power_mw": 200.0},
+    }
+    reader.close()
+
+def test_counter_wraparound(powercap_root, clock):
+    reader = RaplReader(str(powercap_root))
+    set_energy(powercap_root, "intel-rapl:0", MAX_ENERGY_UJ - 100_000)
+    clock[0] += 10**9
+    reader.update()
+
+    # Wraps around max_energy_range_uj: 100_000 uJ to the max and 50_000 uJ after it
+    set_energy(powercap_root, "intel-rapl:0", 50_000)
+    clock[0] += 10**9
+    package_power_mw, domains = reader.update()
+    assert package_power_mw == 150.0
+    assert domains["package-0"]["energy_uj"] == MAX_ENERGY_UJ - 200_000 + 150_000
+    reader.close()
+
+def test_failed_read_updates_no_counter(powercap_root, clock):
+    reader = RaplReader(str(powercap_root))
+    set_energy(powercap_root, "intel-rapl:0", 300_000)
+    set_energy(powercap_root, "intel-rapl:1", "not a number")
+    clock[0] += 10**9
+    with pytest.raises(ValueError):
+        reader.update()
+
+    set_energy(powercap_root, "intel-rapl:1", 200_000)
+    clock[0] += 10**9
+    package_power_mw, domains = reader.update()
+    # The package energy is only counted once, over both intervals
+    assert package_power_mw == 100.0
+    assert domains["package-0"]["energy_uj"] == 200_000
+    reader.close()
+
+def test_no_zones(tmp_path, clock):
+    assert not RaplReader.is_available(str(tmp_path))
+    assert not RaplReader.is_available(str(tmp_path / "missing"))
+    with pytest.raises(FileNotFoundError):
+        RaplReader(str(tmp_path))